@@ -0,0 +1,145 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Game, Achievement, UserAchievement
+from . import steam_api
+
+# Achievement sync runs after the library sync, in the worker. Schemas are
+# shared by all users and fetched again once older than SCHEMA_STALE_AFTER (DLC
+# and updates add achievements); player states are fetched only for games whose
+# playtime moved, in parallel, and written in bulk.
+ACHIEVEMENT_WORKERS = 8
+ACHIEVEMENT_CALL_TIMEOUT = 15
+ACHIEVEMENT_BUDGET = 120.0
+BATCH_SIZE = 500
+SCHEMA_STALE_AFTER = timedelta(days=7)
+# Apps a sync couldn't finish (errors, budget) are retried by this many later syncs
+ACHIEVEMENT_RETRIES = 2
+
+def played_appids(diff: dict) -> list:
+    """
+    Apps worth re-checking after a sync: newly seen with playtime, or played since.
+    """
+    appids = [appid for appid, new in diff["inserted"] if new[0] > 0]
+    appids += [appid for appid, old, new in diff["changed"] if new[0] != old[0]]
+    return appids
+
+def _chunks(items, size=BATCH_SIZE):
+    items = list(items)
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def ensure_schemas(appids) -> int:
+    """
+    Fetch achievement schemas for apps nobody has fetched yet, or not within
+    SCHEMA_STALE_AFTER. Returns the number of schemas fetched.
+    """
+    due = Q(schema_fetched_at__isnull=True) | Q(schema_fetched_at__lt=timezone.now() - SCHEMA_STALE_AFTER)
+    missing = []
+    for chunk in _chunks(appids):
+        missing += Game.objects.filter(due, appid__in=chunk).values_list("appid", flat=True)
+    if not missing:
+        return 0
+
+    schemas, _ = steam_api.fan_out(
+        lambda appid: steam_api.get_schema_for_game(appid, timeout=ACHIEVEMENT_CALL_TIMEOUT),
+        missing,
+        max_workers=ACHIEVEMENT_WORKERS, budget=ACHIEVEMENT_BUDGET,
+    )
+    rows = [
+        Achievement(
+            appid=appid,
+            apiname=a["name"],
+            displayname=(a.get("displayName") or a["name"])[:200],
+            description=a.get("description") or "",
+            icon=a.get("icon") or "",
+            icongray=a.get("icongray") or "",
+        )
+        for appid, schema in sorted(schemas.items())
+        for a in schema if a.get("name")
+    ]
+    with transaction.atomic():
+        Achievement.objects.bulk_create(
+            rows, batch_size=BATCH_SIZE,
+            update_conflicts=True, unique_fields=["appid", "apiname"],
+            update_fields=["displayname", "description", "icon", "icongray"],
+        )
+        # Apps without achievements are marked too, so we don't ask again.
+        for chunk in _chunks(schemas):
+            Game.objects.filter(appid__in=chunk).update(schema_fetched_at=timezone.now())
+    return len(schemas)
+
+def sync_achievements(profile, appids) -> dict:
+    """
+    Refresh the profile's achievement states for the given apps.
+    Returns {"schemas", "apps", "failed", "unlocked", "pending"}; pending lists
+    the apps that weren't done (schema or player call failed or ran out of time).
+    """
+    appids = list(dict.fromkeys(appids))
+    if not appids:
+        return {"schemas": 0, "apps": 0, "failed": 0, "unlocked": 0, "pending": []}
+
+    # 1) Shared schemas first; only apps that actually have achievements need a player call
+    schemas = ensure_schemas(appids)
+    with_achievements, no_schema = set(), []
+    for chunk in _chunks(appids):
+        with_achievements.update(
+            Achievement.objects.filter(appid__in=chunk).values_list("appid", flat=True).distinct())
+        no_schema += Game.objects.filter(
+            appid__in=chunk, schema_fetched_at__isnull=True).values_list("appid", flat=True)
+
+    # 2) Player states, in parallel under a budget
+    results, failed = steam_api.fan_out(
+        lambda appid: steam_api.get_player_achievements(profile.steamid64, appid,
+                                                        timeout=ACHIEVEMENT_CALL_TIMEOUT),
+        sorted(with_achievements),
+        max_workers=ACHIEVEMENT_WORKERS, budget=ACHIEVEMENT_BUDGET,
+    )
+    rows = [
+        UserAchievement(
+            profile=profile,
+            appid=appid,
+            apiname=a["apiname"],
+            achieved=bool(a.get("achieved")),
+            unlocktime=int(a.get("unlocktime") or 0),
+        )
+        for appid, states in results.items()
+        for a in states if a.get("apiname")
+    ]
+
+    # 3) One upsert per batch instead of a row at a time
+    UserAchievement.objects.bulk_create(
+        rows, batch_size=BATCH_SIZE,
+        update_conflicts=True, unique_fields=["profile", "appid", "apiname"],
+        update_fields=["achieved", "unlocktime"],
+    )
+    return {
+        "schemas": schemas,
+        "apps": len(results),
+        "failed": len(failed),
+        "unlocked": sum(1 for r in rows if r.achieved),
+        "pending": sorted(set(failed).union(no_schema)),
+    }
+
+def next_pending(pending: dict, missed) -> dict:
+    """
+    The profile's achievements_pending after a sync that missed `missed`:
+    attempts counted per app, apps past ACHIEVEMENT_RETRIES dropped.
+    """
+    tries = {str(appid): pending.get(str(appid), 0) + 1 for appid in missed}
+    return {appid: n for appid, n in tries.items() if n <= ACHIEVEMENT_RETRIES}
+
+def achievement_progress(profile, appid: int) -> dict:
+    """
+    {"total", "unlocked", "items": [...]} for the detail page, unlocked first.
+    """
+    defs = list(Achievement.objects.filter(appid=appid).values("apiname", "displayname", "description", "icon", "icongray"))
+    states = dict(UserAchievement.objects
+                  .filter(profile=profile, appid=appid, achieved=True)
+                  .values_list("apiname", "unlocktime"))
+    items = [{**d, "achieved": d["apiname"] in states, "unlocktime": states.get(d["apiname"], 0)} for d in defs]
+    items.sort(key=lambda d: (not d["achieved"], -d["unlocktime"], d["displayname"]))
+    return {"total": len(items), "unlocked": sum(1 for d in items if d["achieved"]), "items": items}
@@ -0,0 +1,45 @@
+import threading, time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import close_old_connections
+
+# A small shared pool for "refresh this later" work triggered by page views
+# (store metadata, player counts). Pages never wait on it.
+_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="background")
+_inflight = set()
+_inflight_lock = threading.Lock()
+
+def submit_once(key, fn, *args) -> bool:
+    """
+    Run fn(*args) in the background unless a task with the same key is
+    already pending. Errors are swallowed: the next trigger retries.
+    Returns False when deduplicated.
+    """
+    with _inflight_lock:
+        if key in _inflight:
+            return False
+        _inflight.add(key)
+    _pool.submit(_run, key, fn, args)
+    return True
+
+def _run(key, fn, args):
+    try:
+        fn(*args)
+    except Exception:
+        pass
+    finally:
+        with _inflight_lock:
+            _inflight.discard(key)
+        close_old_connections()
+
+def wait_idle(timeout: float = 10.0) -> bool:
+    """
+    Block until no task is pending (or timeout). For benchmarks and tests.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        with _inflight_lock:
+            if not _inflight:
+                return True
+        time.sleep(0.01)
+    return False
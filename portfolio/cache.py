@@ -0,0 +1,241 @@
+import math, pickle, random, threading, time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.core.cache import cache, caches
+from django.core.cache.backends.base import BaseCache, DEFAULT_TIMEOUT
+
+from . import perf
+
+# --- Metrics ---
+# Per key prefix ("lib", "pc", "friend_idx", ...): where gets were answered and
+# how long recomputes took. In-process; read with cache_stats().
+
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+def _prefix(key: str) -> str:
+    return str(key).split(":", 1)[0]
+
+def _bump(key, field, n=1):
+    if field in ("local_hits", "shared_hits", "misses"):
+        perf.record_cache(field != "misses")
+    with _metrics_lock:
+        m = _metrics.setdefault(_prefix(key), {
+            "local_hits": 0, "shared_hits": 0, "misses": 0,
+            "stale_served": 0, "recomputes": 0, "recompute_ms": 0.0, "recompute_ms_max": 0.0,
+        })
+        if field == "recompute_ms":
+            m["recompute_ms_max"] = max(m["recompute_ms_max"], n)
+        m[field] += n
+
+def cache_stats() -> dict:
+    """
+    Snapshot of the counters, with hit ratio and mean recompute time per prefix.
+    """
+    with _metrics_lock:
+        out = {}
+        for prefix, m in _metrics.items():
+            gets = m["local_hits"] + m["shared_hits"] + m["misses"]
+            out[prefix] = {
+                **m,
+                "hit_ratio": round((gets - m["misses"]) / gets, 3) if gets else None,
+                "recompute_ms_avg": round(m["recompute_ms"] / m["recomputes"], 1) if m["recomputes"] else None,
+            }
+        return out
+
+def reset_cache_stats() -> None:
+    with _metrics_lock:
+        _metrics.clear()
+
+# --- Backend ---
+
+class TieredCache(BaseCache):
+    """
+    A small in-process LRU in front of a shared cache alias (file, DB or Redis).
+
+    OPTIONS:
+        SHARED             alias of the shared backend in CACHES (default "shared")
+        LOCAL_MAX_ENTRIES  LRU size (default 500)
+        LOCAL_TIMEOUT      max seconds a value lives in the LRU (default 30); this
+                           bounds how long another worker's delete can go unseen
+    """
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get("OPTIONS", {})
+        self._shared_alias = options.get("SHARED", "shared")
+        self._local_max = int(options.get("LOCAL_MAX_ENTRIES", 500))
+        self._local_timeout = float(options.get("LOCAL_TIMEOUT", 30))
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    # Local tier: values are kept pickled, like LocMemCache, so callers can't
+    # mutate each other's copies.
+
+    def _local_get(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            expires, blob = entry
+            if expires < time.monotonic():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+        return blob
+
+    def _local_set(self, key, value, timeout):
+        ttl = self._local_timeout if timeout is None else min(timeout, self._local_timeout)
+        if ttl <= 0:
+            return
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._local[key] = (time.monotonic() + ttl, blob)
+            self._local.move_to_end(key)
+            while len(self._local) > self._local_max:
+                self._local.popitem(last=False)
+
+    def _local_delete(self, key):
+        with self._lock:
+            self._local.pop(key, None)
+
+    # Cache API
+
+    def get(self, key, default=None, version=None):
+        blob = self._local_get(self.make_and_validate_key(key, version=version))
+        if blob is not None:
+            _bump(key, "local_hits")
+            return pickle.loads(blob)
+
+        sentinel = object()
+        value = self.shared.get(key, sentinel, version=version)
+        if value is sentinel:
+            _bump(key, "misses")
+            return default
+        _bump(key, "shared_hits")
+        self._local_set(self.make_and_validate_key(key, version=version), value, None)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        self._local_set(self.make_and_validate_key(key, version=version), value,
+                        self.get_backend_timeout(timeout))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self._local_set(self.make_and_validate_key(key, version=version), value,
+                            self.get_backend_timeout(timeout))
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._local_delete(self.make_and_validate_key(key, version=version))
+        return self.shared.delete(key, version=version)
+
+    def has_key(self, key, version=None):
+        return (self._local_get(self.make_and_validate_key(key, version=version)) is not None
+                or self.shared.has_key(key, version=version))
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+        self.shared.clear()
+
+# --- Stampede protection ---
+
+_key_locks = {}        # key -> [lock, threads holding or waiting on it]
+_key_locks_guard = threading.Lock()
+
+@contextmanager
+def key_lock(key):
+    """
+    The process-wide lock for `key` (not acquired yet). It only exists while
+    some thread holds or waits on it, so the table doesn't grow with every
+    key ever used. Also used by images.py.
+    """
+    with _key_locks_guard:
+        entry = _key_locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        yield entry[0]
+    finally:
+        with _key_locks_guard:
+            entry[1] -= 1
+            if not entry[1]:
+                del _key_locks[key]
+
+def get_or_compute(key: str, compute, timeout: int, beta: float = 1.0, lock_timeout: int = 30):
+    """
+    cache.get + recompute on miss, for expensive keys:
+
+    - single flight: one thread per process (threading lock) and one process
+      per key (cache.add lock) recomputes; the rest serve the stale value, or
+      wait for the winner if there is none yet. The cross-process part needs
+      an atomic add (Redis, DB cache): FileBasedCache.add checks then writes,
+      so on the default file tier two processes can occasionally both recompute
+    - early refresh: as expiry approaches, a request may volunteer to
+      recompute ahead of time, more likely the closer it is and the slower the
+      value is to compute (probabilistic "XFetch"), so hot keys rarely miss
+
+    Values are stored wrapped as (value, soft_expiry, compute_seconds) and kept
+    for timeout + a grace period so a stale copy is available while refreshing.
+    `timeout` may be a callable taking the fresh value, for per-value TTLs.
+    """
+    entry = cache.get(key)
+    now = time.time()
+    if entry is not None:
+        value, expires, delta = entry
+        # XFetch: -log(U) is exponential; early refresh probability rises near expiry.
+        if now - delta * beta * math.log(1.0 - random.random()) < expires:
+            return value
+
+    with key_lock(key) as lock:
+        # With a stale copy in hand, don't queue behind another thread's refresh.
+        acquired = lock.acquire(timeout=lock_timeout) if entry is None else lock.acquire(blocking=False)
+        if not acquired:
+            if entry is not None:
+                _bump(key, "stale_served")
+                return entry[0]
+            return compute()
+        try:
+            # Someone may have refreshed it while we waited for the lock.
+            fresh = cache.get(key)
+            if fresh is not None and (entry is None or fresh[1] != entry[1]):
+                return fresh[0]
+
+            lock_key = f"lock:{key}"
+            owns_lock = cache.add(lock_key, 1, lock_timeout)
+            if not owns_lock:
+                # Another process is recomputing.
+                if entry is not None:
+                    _bump(key, "stale_served")
+                    return entry[0]
+                deadline = time.monotonic() + lock_timeout
+                while time.monotonic() < deadline:
+                    time.sleep(0.1)
+                    fresh = cache.get(key)
+                    if fresh is not None:
+                        return fresh[0]
+                # Winner died or is very slow: compute it ourselves.
+
+            try:
+                t0 = time.monotonic()
+                value = compute()
+                delta = time.monotonic() - t0
+                _bump(key, "recomputes")
+                _bump(key, "recompute_ms", delta * 1000)
+                ttl = timeout(value) if callable(timeout) else timeout
+                cache.set(key, (value, time.time() + ttl, delta), ttl + max(60, ttl // 10))
+                return value
+            finally:
+                if owns_lock:
+                    cache.delete(lock_key)
+        finally:
+            lock.release()
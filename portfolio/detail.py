@@ -0,0 +1,151 @@
+import asyncio, contextvars, hashlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import close_old_connections
+
+from . import ownership
+from .achievements import achievement_progress
+from .friends import friends_who_own, peek_friend_index, peek_recheck
+from .jobs import latest_job
+from .player_counts import note_view, current as current_players, history as player_history_for
+from .store_meta import get_meta, is_stale, refresh_in_background
+
+# The game page is a shell (UserGame/Game only) plus one fragment per
+# section, fetched by the browser after first paint (/game/<appid>/<section>/).
+# Each fragment has its own cache policy and a cheap version (ETag +
+# Last-Modified) checked before the section is built, so a revalidation that
+# matches costs a query or two and no rendering.
+#
+# Under ASYNC_VIEWS the fragment view runs the section in a worker thread
+# under SECTION_TIMEOUTS and serves the fallback (uncached) when it runs out.
+# Work that timed out keeps going and fills the caches for the next request.
+SECTION_TIMEOUTS = {
+    "players": 2.0,
+    "store": 2.0,
+    "friends": 4.0,
+    "achievements": 2.0,
+}
+# A pool of our own rather than the loop's default executor: a loop that
+# shuts down (async view under WSGI) would wait for abandoned sections.
+SECTION_WORKERS = 16
+_pool = ThreadPoolExecutor(max_workers=SECTION_WORKERS, thread_name_prefix="detail")
+
+# --- Sections: each returns its slice of the template context ---
+
+def players_section(profile, appid: int) -> dict:
+    # Refreshed in batches by refresh_player_counts; no network here. The view
+    # is noted by players_version, which runs first (also for a 304).
+    count, _ = current_players(appid)
+    return {"player_count": count, "player_history": player_history_for(appid)}
+
+def store_section(profile, appid: int) -> dict:
+    # Shared GameMeta row; missing/stale rows refresh in the background
+    meta = get_meta(appid)
+    if is_stale(meta):
+        refresh_in_background(appid)
+    return {
+        "genres": meta.genres if meta else [],
+        "description": (meta.short_description or None) if meta else None,
+        "release_date": meta.release_date if meta else "",
+        "store_url": (meta.website if meta else "") or f"https://store.steampowered.com/app/{appid}",
+    }
+
+def friends_section(profile, appid: int) -> dict:
+    # Per-profile friend-library index (built once, TTL-refreshed); the only
+    # section that may call Steam
+    friends, unchecked = friends_who_own(profile, appid)
+    return {"friends_who_own": friends, "friends_unchecked": unchecked, "friends_pending": False}
+
+def achievements_section(profile, appid: int) -> dict:
+    # Filled by the sync worker; no network here
+    return {"achievements": achievement_progress(profile, appid)}
+
+# --- Versions: (etag source, last modified) or None when not cacheable ---
+
+def players_version(profile, appid: int):
+    # Keeps the app hot even when every viewer revalidates a cached fragment
+    note_view(appid)
+    count, row = current_players(appid)
+    if row is None or row.checked_at is None:
+        return None
+    return f"{row.checked_at.timestamp()}:{count is not None}", row.checked_at
+
+def store_version(profile, appid: int):
+    meta = get_meta(appid)
+    if meta is None:
+        return None
+    return f"{meta.fetched_at.timestamp()}", meta.fetched_at
+
+def friends_version(profile, appid: int):
+    # Only an index that's already built: a cold one is built by the section,
+    # under its timeout
+    idx = peek_friend_index(profile)
+    if idx is None:
+        return None
+    # Friends the scan missed: only once they've been asked about this game
+    recheck = peek_recheck(profile, appid, idx) if idx.get("failed") else None
+    if idx.get("failed") and recheck is None:
+        return None
+    # Registered friends are answered from the app owners list, which can
+    # change without the index being rebuilt
+    registered = sorted(idx.get("registered", {}).values())
+    owners = sorted(ownership.owners_among(appid, registered))
+    built = datetime.fromtimestamp(idx["built_at"], tz=dt_timezone.utc)
+    return f"{idx['built_at']}:{owners}:{recheck}", built
+
+def achievements_version(profile, appid: int):
+    # Achievements land after last_synced is set, when the sync job finishes
+    job = latest_job(profile)
+    finished = job.finished_at if job else None
+    changed = max(filter(None, (profile.last_synced, finished)), default=None)
+    if changed is None:
+        return None
+    return f"{profile.last_synced}:{finished}", changed
+
+# name -> (build, version, Cache-Control, needs a signed-in owner of the game)
+SECTIONS = {
+    "players": (players_section, players_version, {"public": True, "max_age": 60}, False),
+    "store": (store_section, store_version, {"public": True, "max_age": 3600}, False),
+    "friends": (friends_section, friends_version, {"private": True, "max_age": 300}, True),
+    "achievements": (achievements_section, achievements_version, {"private": True, "no_cache": True}, True),
+}
+
+def etag_for(*parts) -> str:
+    """
+    A strong ETag from whatever identifies a version of a response.
+    """
+    return '"' + hashlib.sha1(":".join(map(str, parts)).encode()).hexdigest()[:20] + '"'
+
+def fallback(name: str, appid: int) -> dict:
+    """
+    What a section shows when it didn't finish in time (or failed).
+    """
+    if name == "players":
+        return {"player_count": None, "player_history": []}
+    if name == "store":
+        return {"genres": [], "description": None, "release_date": "",
+                "store_url": f"https://store.steampowered.com/app/{appid}"}
+    if name == "friends":
+        return {"friends_who_own": [], "friends_unchecked": 0, "friends_pending": True}
+    return {"achievements": {"total": 0, "unlocked": 0, "items": []}}
+
+def _run_section(fn, profile, appid):
+    try:
+        return fn(profile, appid)
+    finally:
+        close_old_connections()
+
+async def abuild_section(name: str, profile, appid: int):
+    """
+    (context, complete) for one section, built in a worker thread and capped
+    by its SECTION_TIMEOUTS entry. On timeout or error: (fallback, False).
+    """
+    build = SECTIONS[name][0]
+    # The section runs in a copy of the context so per-request timings see it
+    call = asyncio.get_running_loop().run_in_executor(
+        _pool, contextvars.copy_context().run, _run_section, build, profile, appid)
+    try:
+        return await asyncio.wait_for(call, SECTION_TIMEOUTS[name]), True
+    except Exception:
+        return fallback(name, appid), False
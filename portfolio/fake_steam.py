@@ -0,0 +1,247 @@
+import json, random, subprocess, sys, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+from urllib.request import Request, urlopen
+
+# A local stand-in for the Steam Web API and Storefront, for `manage.py bench`.
+# Everything is generated from the request (steamid/appid), so runs are
+# reproducible. Point STEAM_API_BASE and STEAM_STORE_BASE at `FakeSteam.url`.
+# The server runs in a child process so its allocations don't show up in the
+# benchmark's memory numbers; FakeSteam drives it over /_fake/ endpoints.
+
+FRIEND_LIBRARY_SIZE = 300
+ACHIEVEMENTS_PER_APP = 12
+GENRES = ["Action", "Adventure", "RPG", "Strategy", "Indie", "Simulation", "Casual", "Sports"]
+
+def appid_at(i: int) -> int:
+    return 10 + i * 10
+
+def friend_id(owner: str, i: int) -> str:
+    # 17 digits like a real steamid64, unique per (owner, i)
+    return f"7656119{(int(owner) * 7 + i) % 10**10:010d}"
+
+class FakeSteam:
+    """
+    Handle on the fake server process.
+    set_library(steamid, size, bump=0, drop=0, private=False): the library of
+    a user under test; `bump` adds minutes to every 10th game, `drop` removes
+    the last N, `private` answers without a games list like a hidden library.
+    set_friends(steamid, n): friend count. Unknown steamids (friends) get a
+    FRIEND_LIBRARY_SIZE library overlapping the users' appids.
+    fail(path, status, times, retry_after=None): the next `times` requests to
+    `path` get `status` (with a Retry-After header when given).
+    latency_ms (+ up to jitter_ms) is slept on every request.
+    """
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self._process = None
+        self.url = None
+
+    def start(self):
+        self._process = subprocess.Popen(
+            [sys.executable, "-m", "portfolio.fake_steam", str(self.latency_ms), str(self.jitter_ms)],
+            cwd=Path(__file__).resolve().parent.parent, stdout=subprocess.PIPE, text=True,
+        )
+        # The child prints its port once it's listening
+        self.url = f"http://127.0.0.1:{int(self._process.stdout.readline())}"
+        return self
+
+    def stop(self):
+        if self._process:
+            self._process.terminate()
+            self._process.wait()
+
+    def _control(self, path, payload=None):
+        data = json.dumps(payload or {}).encode()
+        with urlopen(Request(f"{self.url}/_fake/{path}", data=data), timeout=10) as r:
+            return json.loads(r.read())
+
+    def set_library(self, steamid, size, bump=0, drop=0, private=False):
+        self._control("library", {"steamid": steamid, "size": size, "bump": bump, "drop": drop,
+                                  "private": private})
+
+    def set_friends(self, steamid, n):
+        self._control("friends", {"steamid": steamid, "n": n})
+
+    def fail(self, path, status, times=1, retry_after=None):
+        self._control("fail", {"path": path, "status": status, "times": times, "retry_after": retry_after})
+
+    def counts(self) -> dict:
+        """
+        Requests served per endpoint path since the last reset_counts().
+        """
+        return self._control("counts")
+
+    def reset_counts(self):
+        # Also drops failures that haven't been served yet
+        self._control("reset", {})
+
+def _serve(latency_ms, jitter_ms):
+    state = _FakeState(latency_ms, jitter_ms)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"    # keep-alive, like the real API
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            params = {k: v[0] for k, v in parse_qs(parts.query).items()}
+            self._send(*state.handle(parts.path.rstrip("/"), params))
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+            self._send(*state.control(self.path.rstrip("/"), json.loads(body or b"null")))
+
+        def _send(self, status, body, headers=None):
+            payload = json.dumps(body).encode()
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        daemon_threads = True
+
+        def handle_error(self, request, client_address):
+            # Clients that stop reading early (owns_game) reset the connection.
+            if not isinstance(sys.exc_info()[1], (ConnectionError, BrokenPipeError)):
+                super().handle_error(request, client_address)
+
+    httpd = Server(("127.0.0.1", 0), Handler)
+    print(httpd.server_address[1], flush=True)
+    httpd.serve_forever()
+
+class _FakeState:
+    def __init__(self, latency_ms, jitter_ms):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.libraries = {}
+        self.friends = {}
+        self.failures = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def control(self, path, payload):
+        with self._lock:
+            if path == "/_fake/library":
+                self.libraries[payload.pop("steamid")] = payload
+            elif path == "/_fake/friends":
+                self.friends[payload["steamid"]] = payload["n"]
+            elif path == "/_fake/fail":
+                self.failures[payload.pop("path").rstrip("/")] = payload
+            elif path == "/_fake/counts":
+                return 200, dict(self._counts)
+            elif path == "/_fake/reset":
+                self._counts.clear()
+                self.failures.clear()
+            else:
+                return 404, {}
+        return 200, {}
+
+    # --- endpoints ---
+
+    def handle(self, path: str, params: dict):
+        with self._lock:
+            self._counts[path] = self._counts.get(path, 0) + 1
+            fail = self.failures.get(path)
+            if fail and fail["times"] > 0:
+                fail["times"] -= 1
+            else:
+                fail = None
+        if self.latency_ms or self.jitter_ms:
+            time.sleep((self.latency_ms + random.uniform(0, self.jitter_ms)) / 1000)
+        if fail:
+            headers = {"Retry-After": str(fail["retry_after"])} if fail["retry_after"] is not None else {}
+            return fail["status"], {}, headers
+
+        route = {
+            "/ISteamUser/GetPlayerSummaries/v2": self.player_summaries,
+            "/IPlayerService/GetSteamLevel/v1": lambda p: {"response": {"player_level": 10}},
+            "/ISteamUser/GetFriendList/v1": self.friend_list,
+            "/IPlayerService/GetOwnedGames/v1": self.owned_games,
+            "/ISteamUserStats/GetSchemaForGame/v2": self.schema,
+            "/ISteamUserStats/GetPlayerAchievements/v1": self.player_achievements,
+            "/ISteamUserStats/GetNumberOfCurrentPlayers/v1": self.current_players,
+            "/api/appdetails": self.appdetails,
+        }.get(path)
+        if route is None:
+            return 404, {}
+        return 200, route(params)
+
+    def player_summaries(self, p):
+        return {"response": {"players": [
+            {"steamid": sid, "personaname": f"Player {sid[-4:]}", "avatarfull": "",
+             "profileurl": f"https://steamcommunity.com/profiles/{sid}"}
+            for sid in p.get("steamids", "").split(",") if sid
+        ]}}
+
+    def friend_list(self, p):
+        owner = p["steamid"]
+        return {"friendslist": {"friends": [
+            {"steamid": friend_id(owner, i), "relationship": "friend", "friend_since": 0}
+            for i in range(self.friends.get(owner, 0))
+        ]}}
+
+    def owned_games(self, p):
+        sid = p["steamid"]
+        lib = self.libraries.get(sid)
+        if lib is None:
+            # Friend: a slice of the shared appid space, different per friend
+            start = int(sid) % 500
+            indexes = range(start, start + FRIEND_LIBRARY_SIZE)
+            bump = 0
+        elif lib.get("private"):
+            return {"response": {}}
+        else:
+            indexes = range(lib["size"] - lib.get("drop", 0))
+            bump = lib.get("bump", 0)
+        games = [{
+            "appid": appid_at(i),
+            "name": f"Game {appid_at(i)}",
+            # ~1 in 5 games played; every 10th gets `bump` extra minutes
+            "playtime_forever": (i * 7 if i % 5 == 0 else 0) + (bump if i % 10 == 0 else 0),
+            "playtime_2weeks": 30 if i % 50 == 0 else 0,
+            "rtime_last_played": 1_700_000_000 + i if i % 5 == 0 else 0,
+            "img_icon_url": "",
+        } for i in indexes]
+        return {"response": {"game_count": len(games), "games": games}}
+
+    def schema(self, p):
+        appid = int(p["appid"])
+        if (appid // 10) % 4 == 3:
+            return {"game": {}}    # a quarter of apps have no achievements
+        return {"game": {"availableGameStats": {"achievements": [
+            {"name": f"ACH_{n}", "displayName": f"Achievement {n}", "description": "",
+             "icon": "", "icongray": ""}
+            for n in range(ACHIEVEMENTS_PER_APP)
+        ]}}}
+
+    def player_achievements(self, p):
+        appid = int(p["appid"])
+        return {"playerstats": {"achievements": [
+            {"apiname": f"ACH_{n}", "achieved": int((appid + n) % 3 == 0), "unlocktime": 0}
+            for n in range(ACHIEVEMENTS_PER_APP)
+        ]}}
+
+    def current_players(self, p):
+        return {"response": {"player_count": int(p["appid"]) % 5000, "result": 1}}
+
+    def appdetails(self, p):
+        appid = int(p["appids"])
+        return {str(appid): {"success": True, "data": {
+            "name": f"Game {appid}",
+            "genres": [{"id": str(n), "description": GENRES[(appid // 10 + n) % len(GENRES)]} for n in range(2)],
+            "short_description": f"Synthetic game {appid}.",
+            "website": "",
+            "release_date": {"date": "1 Jan, 2020"},
+        }}}
+
+if __name__ == "__main__":
+    _serve(float(sys.argv[1]), float(sys.argv[2]))
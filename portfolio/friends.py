@@ -0,0 +1,161 @@
+import contextvars, time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import cache
+
+from . import ownership, steam_api
+from .cache import get_or_compute
+
+# One scan of the friends' libraries serves every game page: the index maps
+# appid -> set of friend steamids and is rebuilt when the TTL runs out.
+FRIEND_INDEX_TTL = 2 * 3600
+# An index with friends we couldn't reach is only kept briefly, so they get retried.
+FRIEND_INDEX_PARTIAL_TTL = 5 * 60
+
+# Friend-library scan: parallel calls, per-call timeout and an overall budget
+# (seconds) after which we index whatever has come back.
+FRIEND_SCAN_LIMIT = 100
+FRIEND_SCAN_WORKERS = 8
+FRIEND_SCAN_CALL_TIMEOUT = 6
+FRIEND_SCAN_BUDGET = 5.0
+# Per game, for friends the last scan missed; the answers are cached with the
+# index they belong to, so each friend is asked at most once per game and index
+FRIEND_RECHECK_BUDGET = 2.0
+
+def _index_key(profile_id: int) -> str:
+    return f"friend_idx:{profile_id}"
+
+def _recheck_key(profile_id: int, appid: int, idx: dict) -> str:
+    return f"friend_recheck:{profile_id}:{appid}:{idx['built_at']}"
+
+def get_friend_index(profile) -> dict:
+    """
+    Cached friend-library index for the profile, built on first use.
+    """
+    # Single flight: concurrent game pages for the same profile share one scan.
+    return get_or_compute(
+        _index_key(profile.id),
+        lambda: build_friend_index(profile),
+        lambda idx: FRIEND_INDEX_PARTIAL_TTL if idx["unchecked"] else FRIEND_INDEX_TTL,
+    )
+
+def peek_friend_index(profile):
+    """
+    The cached index, or None if it hasn't been built. Never scans.
+    """
+    entry = cache.get(_index_key(profile.id)) if cache else None
+    return entry[0] if entry else None     # stored as get_or_compute's (value, expiry, cost)
+
+def invalidate_friend_index(profile_id: int) -> None:
+    if cache:
+        cache.delete(_index_key(profile_id))
+
+def recheck_failed(profile, appid: int, idx: dict) -> dict:
+    """
+    {"owners": [steamid], "unchecked": n} for the friends `idx` couldn't scan,
+    asked about this one game. Cached until the index is rebuilt.
+    """
+    def ask():
+        answers, still_failed = steam_api.fan_out(
+            lambda fid: steam_api.owns_game(fid, appid, timeout=FRIEND_SCAN_CALL_TIMEOUT),
+            idx["failed"],
+            max_workers=FRIEND_SCAN_WORKERS,
+            budget=FRIEND_RECHECK_BUDGET,
+        )
+        return {"owners": sorted(fid for fid, owns in answers.items() if owns), "unchecked": len(still_failed)}
+
+    return get_or_compute(_recheck_key(profile.id, appid, idx), ask, FRIEND_INDEX_PARTIAL_TTL)
+
+def peek_recheck(profile, appid: int, idx: dict):
+    """
+    The cached recheck_failed answer, or None. Never calls Steam.
+    """
+    entry = cache.get(_recheck_key(profile.id, appid, idx)) if cache else None
+    return entry[0] if entry else None
+
+def build_friend_index(profile) -> dict:
+    """
+    Fetch the friend list, their summaries (one call) and the libraries of
+    friends who aren't registered here (parallel, budgeted) and fold them into:
+        {"built_at", "summaries": {steamid: {...}}, "owners": {appid: {steamid}},
+         "registered": {steamid: profile id}, "checked", "unchecked", "failed": [steamid]}
+    Registered friends are answered from the ownership index at lookup time.
+    NOTE: subject to each friend's privacy; private libraries index as empty.
+    """
+    idx = {"built_at": time.time(), "summaries": {}, "owners": {}, "registered": {},
+           "checked": 0, "unchecked": 0, "failed": []}
+    try:
+        friend_ids = steam_api.get_friend_steamids(profile.steamid64)[:FRIEND_SCAN_LIMIT]
+    except Exception:
+        return idx
+    if not friend_ids:
+        return idx
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="steam") as pool:
+        # Names/avatars in one call, fetched while the libraries are scanned
+        summaries = pool.submit(contextvars.copy_context().run, steam_api.get_player_summaries, friend_ids)
+
+        # Friends with a profile here are already in the ownership index
+        idx["registered"] = ownership.registered(friend_ids)
+        unregistered = [fid for fid in friend_ids if fid not in idx["registered"]]
+
+        # Appids only (no names), streamed: a friend's library never sits in memory as JSON
+        libraries, failed = steam_api.get_owned_appids_many(
+            unregistered,
+            max_workers=FRIEND_SCAN_WORKERS,
+            call_timeout=FRIEND_SCAN_CALL_TIMEOUT,
+            budget=FRIEND_SCAN_BUDGET,
+        )
+
+        try:
+            for ps in summaries.result():
+                fid = ps.get("steamid")
+                if fid:
+                    idx["summaries"][fid] = {
+                        "name": ps.get("personaname", "Friend"),
+                        "avatar": ps.get("avatarfull", ""),
+                        "profileurl": ps.get("profileurl", f"https://steamcommunity.com/profiles/{fid}"),
+                    }
+        except Exception:
+            pass
+    owners = idx["owners"]
+    for fid, appids in libraries.items():
+        for appid in appids or ():
+            owners.setdefault(appid, set()).add(fid)
+
+    idx["checked"] = len(libraries) + len(idx["registered"])
+    idx["unchecked"] = len(failed)
+    idx["failed"] = failed
+    return idx
+
+def friends_who_own(profile, appid: int):
+    """
+    (friends, unchecked) for one game. Registered friends come from the
+    ownership index, the others from the friend index (dictionary lookups).
+    Friends the scan couldn't reach are asked about this one game (once per
+    index, see recheck_failed), and each of those calls stops reading as soon
+    as the appid shows up.
+    Registered friends also get "in_common": games both of you own.
+    """
+    idx = get_friend_index(profile)
+    registered = idx.get("registered", {})
+    owner_pids = ownership.owners_among(appid, registered.values())
+    owner_ids = set(idx["owners"].get(appid, ()))
+    owner_ids.update(fid for fid, pid in registered.items() if pid in owner_pids)
+    unchecked = idx["unchecked"]
+    if idx.get("failed"):
+        recheck = recheck_failed(profile, appid, idx)
+        owner_ids.update(recheck["owners"])
+        unchecked = recheck["unchecked"]
+
+    friends = []
+    for fid in sorted(owner_ids):
+        ps = idx["summaries"].get(fid, {})
+        friends.append({
+            "steamid": fid,
+            "name": ps.get("name", "Friend"),
+            "avatar": ps.get("avatar", ""),
+            "profileurl": ps.get("profileurl", f"https://steamcommunity.com/profiles/{fid}"),
+            "in_common": len(ownership.library_overlap(profile.id, registered[fid])) if fid in registered else None,
+        })
+    return friends, unchecked
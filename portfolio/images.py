@@ -0,0 +1,228 @@
+import hashlib, io, os, threading, time
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+
+from django.conf import settings
+
+from .cache import key_lock
+from .steam_client import get_client
+
+try:
+    from PIL import Image
+except ImportError:     # optional: without Pillow the original JPEG is served as is
+    Image = None
+
+# Game header images, fetched once per appid from the Steam CDN and kept on
+# disk under IMAGE_CACHE_DIR:
+#   blobs/ab/<sha256>                  the original, addressed by its content
+#   variants/ab/<sha256>-<width>.<fmt> resized copies
+#   appids/<appid>                     sha256 of the app's current header, or "missing"
+# Identical headers (placeholders) share one blob. Blobs and variants are
+# evicted least recently used first once they pass IMAGE_CACHE_MAX_MB; an app
+# whose blob was evicted is simply fetched again.
+WIDTHS = (320, 460)
+FORMATS = {"webp": "image/webp", "jpg": "image/jpeg"}
+QUALITY = {"webp": 80, "jpg": 82}
+# Apps without a header are asked again after this long
+MISSING_RETRY = 24 * 3600
+# Reads bump a file's mtime (the LRU clock) at most this often
+TOUCH_EVERY = 3600
+# Eviction frees down to this fraction of the limit
+EVICT_TO = 0.9
+# known_version answers are reused for this long, for this many appids
+KNOWN_TTL = 30
+KNOWN_MAX = 4096
+
+_usage = None           # bytes on disk, scanned once per process
+_usage_lock = threading.Lock()
+
+def _root() -> Path:
+    return Path(settings.IMAGE_CACHE_DIR)
+
+def _blob_path(sha: str) -> Path:
+    return _root() / "blobs" / sha[:2] / sha
+
+def _variant_path(sha: str, width: int, fmt: str) -> Path:
+    return _root() / "variants" / sha[:2] / f"{sha}-{width}.{fmt}"
+
+def _appid_path(appid: int) -> Path:
+    return _root() / "appids" / str(appid)
+
+@contextmanager
+def _lock(key):
+    # Refcounted per-key locks (see cache.key_lock): no entry left per appid
+    # or variant once nobody waits on it
+    with key_lock(("images", *key)) as lock, lock:
+        yield
+
+def _write(path: Path, data: bytes) -> None:
+    # Atomic: readers never see a half-written file
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+def _touch(path: Path) -> None:
+    try:
+        if path.stat().st_mtime < time.time() - TOUCH_EVERY:
+            os.utime(path)
+    except FileNotFoundError:
+        pass
+
+# --- Originals ---
+
+def known_version(appid: int):
+    """
+    sha256 of the app's header if it's on disk, else None. No network.
+    Memoized per process for up to KNOWN_TTL seconds: header_url asks for
+    every variant of every card.
+    """
+    return _known_version(appid, int(time.monotonic() // KNOWN_TTL))
+
+@lru_cache(maxsize=KNOWN_MAX)
+def _known_version(appid: int, tick: int):
+    # `tick` changes every KNOWN_TTL seconds, which retires older answers
+    return _read_version(appid)
+
+def _read_version(appid: int):
+    try:
+        sha = _appid_path(appid).read_text()
+    except FileNotFoundError:
+        return None
+    return sha if sha != "missing" and _blob_path(sha).exists() else None
+
+def _fetch_original(appid: int):
+    url = f"{settings.STEAM_CDN_BASE}/steam/apps/{appid}/header.jpg"
+    r = get_client().get(url, timeout=10)
+    if r.status_code == 404:
+        return None
+    r.raise_for_status()
+    return r.content
+
+def original(appid: int):
+    """
+    sha256 of the app's header, fetched from the CDN the first time (one
+    fetch per appid at a time). None when the app has no header.
+    """
+    sha = _read_version(appid)
+    if sha is not None:
+        return sha
+    with _lock(("appid", appid)):
+        sha = _read_version(appid)
+        if sha is not None:
+            return sha
+        marker = _appid_path(appid)
+        if marker.exists() and marker.read_text() == "missing" \
+                and marker.stat().st_mtime > time.time() - MISSING_RETRY:
+            return None
+
+        data = _fetch_original(appid)
+        if data is None:
+            _write(marker, b"missing")
+            return None
+        sha = hashlib.sha256(data).hexdigest()
+        blob = _blob_path(sha)
+        if not blob.exists():
+            _write(blob, data)
+            _account(len(data))
+        _write(marker, sha.encode())
+        return sha
+
+# --- Variants ---
+
+def variant(appid: int, width: int, fmt: str):
+    """
+    (path, content type, sha256) of the header at `width` in `fmt`, made on
+    first use; None when the app has no header. Without Pillow every variant
+    is the original JPEG.
+    """
+    sha = original(appid)
+    if sha is None:
+        return None
+    if Image is None:
+        blob = _blob_path(sha)
+        _touch(blob)
+        return blob, FORMATS["jpg"], sha
+
+    path = _variant_path(sha, width, fmt)
+    if path.exists():
+        _touch(path)
+        return path, FORMATS[fmt], sha
+    with _lock(("variant", sha, width, fmt)):
+        if not path.exists():
+            data = _resize(_blob_path(sha).read_bytes(), width, fmt)
+            _write(path, data)
+            _account(len(data))
+    return path, FORMATS[fmt], sha
+
+def open_variant(appid: int, width: int, fmt: str):
+    """
+    variant() opened for reading: (file, content type, sha256) or None. A file
+    evicted between finding and opening it is made again (once).
+    """
+    for attempt in range(2):
+        try:
+            found = variant(appid, width, fmt)
+            if found is None:
+                return None
+            path, content_type, sha = found
+            return open(path, "rb"), content_type, sha
+        except FileNotFoundError:
+            if attempt:
+                raise
+
+def _resize(data: bytes, width: int, fmt: str) -> bytes:
+    with Image.open(io.BytesIO(data)) as im:
+        im = im.convert("RGB")
+        if im.width > width:
+            im = im.resize((width, round(im.height * width / im.width)), Image.LANCZOS)
+        out = io.BytesIO()
+        im.save(out, "WEBP" if fmt == "webp" else "JPEG", quality=QUALITY[fmt], optimize=fmt == "jpg")
+        return out.getvalue()
+
+# --- Size bound ---
+
+def _files():
+    for sub in ("blobs", "variants"):
+        for dirpath, _, names in os.walk(_root() / sub):
+            for name in names:
+                if not name.startswith("."):
+                    yield Path(dirpath) / name
+
+def _account(added: int) -> None:
+    global _usage
+    limit = settings.IMAGE_CACHE_MAX_MB * 1024 * 1024
+    with _usage_lock:
+        if _usage is None:
+            _usage = sum(f.stat().st_size for f in _files())
+        else:
+            _usage += added
+        if _usage > limit:
+            _usage = _evict(_usage, int(limit * EVICT_TO))
+
+def _evict(usage: int, target: int) -> int:
+    """
+    Delete least recently used files until usage <= target; returns the new usage.
+    """
+    entries = []
+    for f in _files():
+        try:
+            st = f.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((st.st_mtime, st.st_size, f))
+    entries.sort()
+    usage = sum(size for _, size, _ in entries)
+    for _, size, f in entries:
+        if usage <= target:
+            break
+        f.unlink(missing_ok=True)
+        usage -= size
+    return usage
+
+def disk_usage() -> int:
+    """
+    Bytes used by blobs and variants (scans the directory).
+    """
+    return sum(f.stat().st_size for f in _files())
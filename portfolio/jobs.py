@@ -0,0 +1,106 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import SyncJob
+from . import perf
+from .sync import sync_library
+
+def enqueue_sync(profile, run_inline=None) -> SyncJob:
+    """
+    Queue a library sync for the profile and return the job.
+    If one is already queued or running, that job is returned instead.
+    With settings.SYNC_INLINE (or run_inline=True) the job runs right away,
+    handy without a worker.
+    """
+    job = active_job(profile)
+    if job is None:
+        try:
+            with transaction.atomic():
+                job = SyncJob.objects.create(profile=profile)
+        except IntegrityError:
+            # Lost a race with another request; the partial unique index kept it to one job.
+            job = active_job(profile)
+
+    if run_inline is None:
+        run_inline = getattr(settings, "SYNC_INLINE", False)
+    if run_inline and job.status == SyncJob.QUEUED:
+        run_job(job.id)
+        job.refresh_from_db()
+    return job
+
+def active_job(profile):
+    return (SyncJob.objects
+            .filter(profile=profile, status__in=SyncJob.ACTIVE)
+            .order_by("-created_at")
+            .first())
+
+def latest_job(profile):
+    return SyncJob.objects.filter(profile=profile).order_by("-created_at").first()
+
+def claim_next(limit: int = 1) -> list:
+    """
+    Atomically move up to `limit` queued jobs to running and return their ids.
+    The status check in the UPDATE makes it safe with several workers polling.
+    """
+    claimed = []
+    for job_id in (SyncJob.objects
+                   .filter(status=SyncJob.QUEUED)
+                   .order_by("created_at")
+                   .values_list("id", flat=True)[:limit * 2]):
+        if len(claimed) >= limit:
+            break
+        won = (SyncJob.objects
+               .filter(id=job_id, status=SyncJob.QUEUED)
+               .update(status=SyncJob.RUNNING, started_at=timezone.now()))
+        if won:
+            claimed.append(job_id)
+    return claimed
+
+def claim(job_id: int) -> bool:
+    """
+    Move one specific queued job to running; False if someone else got it.
+    """
+    return bool(SyncJob.objects
+                .filter(id=job_id, status=SyncJob.QUEUED)
+                .update(status=SyncJob.RUNNING, started_at=timezone.now()))
+
+def run_job(job_id: int, **sync_kwargs) -> None:
+    """
+    Run one claimed (or still queued) job and record its outcome.
+    Extra keyword arguments go to sync_library.
+    """
+    claim(job_id)
+    job = SyncJob.objects.get(id=job_id)
+
+    t0 = time.monotonic()
+    with perf.collect() as timings:
+        try:
+            result = sync_library(job.profile_id, **sync_kwargs)
+            status, error = SyncJob.DONE, ""
+        except Exception as e:
+            result, status, error = {}, SyncJob.FAILED, f"{type(e).__name__}: {e}"
+    # Where the time went (DB, Steam calls per endpoint, phases)
+    result = {**(result or {}), "timings": timings.as_dict()}
+
+    SyncJob.objects.filter(id=job_id).update(
+        status=status,
+        result=result,
+        error=error,
+        finished_at=timezone.now(),
+        duration_ms=int((time.monotonic() - t0) * 1000),
+    )
+
+def requeue_stale(max_age: timedelta = timedelta(minutes=15), exclude=()) -> int:
+    """
+    Jobs left "running" by a crashed worker go back to the queue, except the
+    `exclude` ids (the caller's own jobs, still in progress).
+    """
+    cutoff = timezone.now() - max_age
+    return (SyncJob.objects
+            .filter(status=SyncJob.RUNNING, started_at__lt=cutoff)
+            .exclude(id__in=list(exclude))
+            .update(status=SyncJob.QUEUED, started_at=None))
@@ -0,0 +1,163 @@
+import base64, json, struct, zlib
+from array import array
+from collections import namedtuple
+
+from django.db.models import Q
+
+from .models import UserGame
+
+# Server-side portfolio query: sort, name search and keyset pagination.
+# Each sort is (column, descending); ties break on game_id in the same
+# direction so the cursor is unambiguous. The (profile, column, game) indexes
+# on UserGame serve the playtime/date sorts without a filesort.
+SORTS = {
+    "minutes": ("playtime_forever", True),
+    "recent": ("playtime_2weeks", True),
+    "last_played": ("rtime_last_played", True),
+    "name": ("game__name", False),
+}
+DEFAULT_SORT = "minutes"
+PAGE_SIZE = 60
+MAX_PAGE_SIZE = 200
+
+FIELDS = ("game__appid", "game__name", "playtime_forever", "playtime_2weeks", "rtime_last_played")
+
+class BadCursor(ValueError):
+    pass
+
+def encode_cursor(value, game_id: int) -> str:
+    raw = json.dumps([value, game_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value, game_id = json.loads(raw)
+        return value, int(game_id)
+    except Exception as e:
+        raise BadCursor(cursor) from e
+
+def query_library(profile, sort: str = DEFAULT_SORT, q: str = "", cursor: str = None,
+                  limit: int = PAGE_SIZE):
+    """
+    One page of the profile's library.
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    Raises BadCursor for a cursor we didn't issue.
+    """
+    column, desc = SORTS.get(sort) or SORTS[DEFAULT_SORT]
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+
+    qs = UserGame.objects.filter(profile=profile)
+    if q:
+        qs = qs.filter(game__name__icontains=q.strip())
+
+    if cursor:
+        value, game_id = decode_cursor(cursor)
+        # The sort value must have the column's type (str for names, int otherwise)
+        if value.__class__ is not (str if column == "game__name" else int):
+            raise BadCursor(cursor)
+        after = "lt" if desc else "gt"
+        qs = qs.filter(Q(**{f"{column}__{after}": value})
+                       | Q(**{column: value, f"game_id__{after}": game_id}))
+
+    order = [f"-{column}", "-game_id"] if desc else [column, "game_id"]
+    rows = list(qs.order_by(*order).values(*FIELDS)[:limit + 1])
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last[column], last["game__appid"])
+    return rows, next_cursor
+
+# --- Cached page snapshot ---
+# The first page of the grid is cached per (profile, sync, sort). Instead of a
+# pickled list of dicts it's stored as one blob: a small header with the
+# cursor, then zlib of one uint32 column per int field followed by the
+# deduplicated names (NUL-separated utf-8), indexed per row.
+# Bump SNAPSHOT_VERSION when the layout changes; old blobs then stop matching
+# the cache key and fail from_bytes().
+
+SNAPSHOT_VERSION = 2
+_MAGIC = b"LSNP"
+_HEADER = struct.Struct("<4sBIH")    # magic, version, rows, cursor bytes
+_INT_COLUMNS = ("appids", "forever", "two_weeks", "last_played", "name_ids")
+
+class LibraryRow(namedtuple("LibraryRow", "appid name playtime_forever playtime_2weeks rtime_last_played")):
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        # Django templates try row["appid"] before row.appid; answering the
+        # first lookup saves an exception per field in the grid.
+        return getattr(self, key) if key.__class__ is str else tuple.__getitem__(self, key)
+
+class LibrarySnapshot:
+    """
+    A page of library rows in columns. Iterating yields LibraryRow tuples
+    (appid, name, playtime_forever, playtime_2weeks, rtime_last_played).
+    """
+    __slots__ = ("appids", "forever", "two_weeks", "last_played", "name_ids", "names", "next_cursor")
+
+    def __init__(self, next_cursor=None):
+        for column in _INT_COLUMNS:
+            setattr(self, column, array("I"))
+        self.names = []
+        self.next_cursor = next_cursor
+
+    @classmethod
+    def from_rows(cls, rows, next_cursor=None) -> "LibrarySnapshot":
+        """
+        Build from query_library() rows. Missing recent/last-played values
+        are stored as 0 (never).
+        """
+        snap = cls(next_cursor)
+        name_index = {}
+        for r in rows:
+            name = r["game__name"].replace("\x00", "")
+            if name not in name_index:
+                name_index[name] = len(snap.names)
+                snap.names.append(name)
+            snap.appids.append(r["game__appid"])
+            snap.forever.append(r["playtime_forever"])
+            snap.two_weeks.append(r.get("playtime_2weeks") or 0)
+            snap.last_played.append(r.get("rtime_last_played") or 0)
+            snap.name_ids.append(name_index[name])
+        return snap
+
+    def to_bytes(self) -> bytes:
+        cursor = (self.next_cursor or "").encode("ascii")
+        body = b"".join([
+            *(getattr(self, column).tobytes() for column in _INT_COLUMNS),
+            "\x00".join(self.names).encode("utf-8"),
+        ])
+        return _HEADER.pack(_MAGIC, SNAPSHOT_VERSION, len(self.appids), len(cursor)) + cursor + zlib.compress(body, 1)
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> "LibrarySnapshot":
+        """
+        Raises ValueError for a blob of another version or a damaged one.
+        """
+        try:
+            magic, version, rows, cursor_len = _HEADER.unpack_from(blob)
+            if magic != _MAGIC or version != SNAPSHOT_VERSION:
+                raise ValueError("not a library snapshot of this version")
+            pos = _HEADER.size + cursor_len
+            snap = cls(blob[_HEADER.size:pos].decode("ascii") or None)
+            body = zlib.decompress(blob[pos:])
+        except (struct.error, zlib.error, UnicodeDecodeError) as e:
+            raise ValueError("damaged library snapshot") from e
+
+        width = array("I").itemsize * rows
+        for i, column in enumerate(_INT_COLUMNS):
+            getattr(snap, column).frombytes(body[i * width:(i + 1) * width])
+        if rows:
+            snap.names = body[len(_INT_COLUMNS) * width:].decode("utf-8").split("\x00")
+        return snap
+
+    def __len__(self):
+        return len(self.appids)
+
+    def __iter__(self):
+        names = self.names
+        return map(LibraryRow._make, zip(self.appids, [names[i] for i in self.name_ids],
+                                         self.forever, self.two_weeks, self.last_played))
@@ -0,0 +1,253 @@
+import gc, json, os, platform, statistics, time, tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from portfolio import background, steam_client
+from portfolio.detail import SECTIONS
+from portfolio.fake_steam import FakeSteam, appid_at
+from portfolio.models import GameMeta, PlayerCount, Profile
+from portfolio.sync import sync_library
+
+# Isolated caches: an in-process LRU over a LocMem "shared" tier, so runs
+# don't read (or pollute) the real cache.
+BENCH_CACHES = {
+    "default": {"BACKEND": "portfolio.cache.TieredCache", "OPTIONS": {"SHARED": "shared"}},
+    "shared": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "bench"},
+}
+
+# Metrics compared against a baseline; lower is better for all of them.
+COMPARED = ("wall_ms", "queries", "http_calls", "peak_kb")
+
+
+def _ints(value: str) -> list:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+class Command(BaseCommand):
+    help = ("Benchmark sync_library, the portfolio page and game_detail (cold/warm) against a "
+            "local fake Steam server, in a throwaway test DB. Writes JSON results and can "
+            "compare them with a stored baseline.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", default="100,1000,10000", help="Library sizes (games).")
+        parser.add_argument("--friends", default="0,50,200", help="Friend counts for game_detail.")
+        parser.add_argument("--concurrency", default="8",
+                            help="Parallel syncs of overlapping libraries (smallest size), comma separated.")
+        parser.add_argument("--latency-ms", type=float, default=0, help="Fake Steam latency per request.")
+        parser.add_argument("--jitter-ms", type=float, default=0, help="Extra random latency per request.")
+        parser.add_argument("--repeat", type=int, default=3,
+                            help="Runs of each repeatable scenario (page views); the median is reported.")
+        parser.add_argument("--no-memory", action="store_true",
+                            help="Skip tracemalloc (it slows everything down by a constant factor).")
+        parser.add_argument("--only", default="", help="Run scenarios whose name contains this.")
+        parser.add_argument("--out", help="Write results JSON here.")
+        parser.add_argument("--baseline", help="Compare with a results JSON from an earlier run.")
+        parser.add_argument("--threshold", type=float, default=0.2,
+                            help="With --baseline: fail when a metric is this much worse (0.2 = +20%%).")
+
+    def handle(self, *args, **opts):
+        self.opts = opts
+        self.results = {}
+        fake = FakeSteam(opts["latency_ms"], opts["jitter_ms"]).start()
+        self.fake = fake
+
+        # Never touch the real database or the real Steam API. On SQLite the
+        # test DB is a file (the in-memory default can't take parallel writers).
+        if connection.vendor == "sqlite":
+            connection.settings_dict["TEST"]["NAME"] = f"{connection.settings_dict['NAME']}.bench"
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        os.environ.setdefault("STEAM_WEB_API_KEY", "bench")
+        try:
+            with override_settings(STEAM_API_BASE=fake.url, STEAM_STORE_BASE=fake.url,
+                                   CACHES=BENCH_CACHES, ALLOWED_HOSTS=["*"], SYNC_INLINE=False):
+                # Rebuild the client against the fake server, without the per-host
+                # rate limits (both bases share one host here, and throttling
+                # isn't what's being measured).
+                steam_client._client = None
+                steam_client.get_client().rates.clear()
+                self.run_all()
+        finally:
+            background.wait_idle()
+            steam_client._client = None
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            fake.stop()
+
+        report = {
+            "meta": {
+                "at": timezone.now().isoformat(),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "db": connection.vendor,
+                "memory": not opts["no_memory"],
+                **{k: opts[k] for k in ("sizes", "friends", "concurrency", "latency_ms", "jitter_ms", "repeat")},
+            },
+            "results": self.results,
+        }
+        if opts["out"]:
+            with open(opts["out"], "w") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"wrote {opts['out']}")
+        if opts["baseline"]:
+            self.compare(opts["baseline"])
+
+    # --- scenarios ---
+
+    def run_all(self):
+        sizes, friend_counts = _ints(self.opts["sizes"]), _ints(self.opts["friends"])
+        self.stdout.write(f"{'scenario':<34} {'wall_ms':>9} {'queries':>7} {'http':>5} {'peak_kb':>8}")
+        profiles = {}
+
+        # 1) sync_library: first sync, 10% of games played more, no change, 10% removed
+        for size in sizes:
+            profile = profiles[size] = self.make_profile(f"sync-{size}")
+            lib = {"size": size, "bump": 0, "drop": 0}
+            for label, change in (("initial", {}), ("changed", {"bump": 5}), ("noop", {}),
+                                  ("removed", {"drop": size // 10})):
+                lib.update(change)
+                self.fake.set_library(profile.steamid64, **lib)
+                self.measure(f"sync/{size}/{label}", lambda: sync_library(profile.id))
+
+        # 1b) Parallel syncs of different profiles whose libraries overlap: they
+        # upsert the same Game and AppOwners rows. Any error fails the run.
+        for n in _ints(self.opts["concurrency"]):
+            group = [self.make_profile(f"concurrent-{n}-{i}") for i in range(n)]
+            size = sizes[0]
+            for label, change in (("initial", {}), ("changed", {"bump": 5})):
+                for profile in group:
+                    self.fake.set_library(profile.steamid64, size, **change)
+                self.measure(f"sync/concurrent/{n}x{size}/{label}",
+                             lambda: self.parallel_syncs([p.id for p in group]))
+
+        # 2) Portfolio page: first view after the sync (cache cold), then warm
+        for size in sizes:
+            client = self.client_for(profiles[size])
+            caches["default"].clear()
+            self.measure(f"portfolio/{size}/cold", lambda: self.get(client, "/me/"))
+            self.measure(f"portfolio/{size}/warm", lambda: self.get(client, "/me/"), repeat=True)
+
+        # 3) Game detail: the shell alone, then shell + every section fragment
+        # cold (no friend index, no store/player rows) and warm
+        size = sizes[0]
+        appid = appid_at(0)
+        for n in friend_counts:
+            profile = self.make_profile(f"friends-{n}")
+            self.fake.set_library(profile.steamid64, size)
+            self.fake.set_friends(profile.steamid64, n)
+            sync_library(profile.id, achievements=False)
+            background.wait_idle()
+            client = self.client_for(profile)
+
+            caches["default"].clear()
+            GameMeta.objects.filter(game_id=appid).delete()
+            PlayerCount.objects.filter(appid=appid).delete()
+            self.measure(f"game_detail/{n}_friends/shell", lambda: self.get(client, f"/game/{appid}/"))
+            self.measure(f"game_detail/{n}_friends/cold", lambda: self.get_detail(client, appid))
+            self.measure(f"game_detail/{n}_friends/warm", lambda: self.get_detail(client, appid),
+                         repeat=True)
+
+    def parallel_syncs(self, profile_ids):
+        def one(profile_id):
+            try:
+                return sync_library(profile_id, achievements=False)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=len(profile_ids)) as pool:
+            futures = [pool.submit(one, pid) for pid in profile_ids]
+        errors = [f.exception() for f in futures if f.exception() is not None]
+        if errors:
+            raise CommandError(f"{len(errors)}/{len(profile_ids)} parallel syncs failed: {errors[0]!r}")
+
+    def make_profile(self, name):
+        user = User.objects.create(username=f"bench-{name}")
+        return Profile.objects.create(user=user, steamid64=f"76561198{User.objects.count():09d}")
+
+    def client_for(self, profile):
+        client = Client()
+        client.force_login(profile.user)
+        return client
+
+    def get(self, client, url):
+        r = client.get(url)
+        if r.status_code != 200:
+            raise CommandError(f"GET {url}: {r.status_code}")
+
+    def get_detail(self, client, appid):
+        # What a browser without cached fragments does: the shell, then each section
+        self.get(client, reverse("game_detail", args=[appid]))
+        for section in SECTIONS:
+            self.get(client, reverse("game_fragment", args=[appid, section]))
+
+    # --- measuring ---
+
+    def measure(self, name, fn, repeat=False):
+        """
+        Wall time, DB queries (this thread only, so 0 for parallel_syncs),
+        requests seen by the fake Steam server (including background work the
+        call started) and peak Python memory. Repeatable scenarios report the median of --repeat runs.
+        """
+        if self.opts["only"] and self.opts["only"] not in name:
+            return
+        runs = []
+        for _ in range(self.opts["repeat"] if repeat else 1):
+            gc.collect()
+            self.fake.reset_counts()
+            if not self.opts["no_memory"]:
+                tracemalloc.start()
+            with CaptureQueriesContext(connection) as queries:
+                t0 = time.perf_counter()
+                fn()
+                wall_ms = (time.perf_counter() - t0) * 1000
+            peak_kb = None
+            if not self.opts["no_memory"]:
+                peak_kb = tracemalloc.get_traced_memory()[1] // 1024
+                tracemalloc.stop()
+            background.wait_idle()
+            runs.append({
+                "wall_ms": round(wall_ms, 1),
+                "queries": len(queries.captured_queries),
+                "http_calls": sum(self.fake.counts().values()),
+                "peak_kb": peak_kb,
+            })
+
+        result = {k: statistics.median_low([r[k] for r in runs]) if runs[0][k] is not None else None
+                  for k in runs[0]}
+        result["runs"] = len(runs)
+        self.results[name] = result
+        self.stdout.write(f"{name:<34} {result['wall_ms']:>9.1f} {result['queries']:>7} "
+                          f"{result['http_calls']:>5} {result['peak_kb'] if result['peak_kb'] is not None else '-':>8}")
+
+    def compare(self, path):
+        with open(path) as f:
+            baseline = json.load(f)["results"]
+        threshold = self.opts["threshold"]
+        self.stdout.write(f"\nvs {path} (worse than +{threshold:.0%} is a regression)")
+        regressions = []
+        for name, cur in self.results.items():
+            base = baseline.get(name)
+            if base is None:
+                self.stdout.write(f"{name:<34} new")
+                continue
+            deltas = []
+            for metric in COMPARED:
+                b, c = base.get(metric), cur.get(metric)
+                if b is None or c is None:
+                    continue
+                ratio = (c / b) if b else (1.0 if c == 0 else float("inf"))
+                # Sub-millisecond noise on wall time isn't a regression.
+                worse = ratio > 1 + threshold and not (metric == "wall_ms" and c - b < 1)
+                deltas.append(f"{metric} {b}->{c}{' !' if worse else ''}")
+                if worse:
+                    regressions.append(f"{name} {metric}")
+            self.stdout.write(f"{name:<34} " + ", ".join(deltas))
+        if regressions:
+            raise CommandError(f"{len(regressions)} regression(s): " + "; ".join(regressions))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from portfolio import transfer
+
+
+class Command(BaseCommand):
+    help = ("Write profiles with their libraries and achievements to a newline-delimited JSON file "
+            "(gzipped for *.gz, stdout for -) that import_library can load without calling Steam.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Output file: *.ndjson, *.ndjson.gz or - for stdout.")
+        parser.add_argument("--steamid", action="append", default=[],
+                            help="Only this profile (repeatable). Default: every profile.")
+
+    def handle(self, *args, **opts):
+        t0 = time.monotonic()
+        with transfer.open_file(opts["path"], "w") as out:
+            counts = transfer.export(out, opts["steamid"])
+        # Progress goes to stderr when the export itself is on stdout
+        log = self.stderr if opts["path"] == "-" else self.stdout
+        log.write("done: " + ", ".join(f"{n} {kind}" for kind, n in counts.items())
+                  + f" in {time.monotonic() - t0:.1f}s")
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from portfolio import transfer
+
+
+class Command(BaseCommand):
+    help = ("Load an export_library file in one transaction: games, profiles (with a Steam login "
+            "link for new ones), libraries and achievements, written in bulk. Each profile's library "
+            "is replaced by the file's and counts as synced now.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Input file: *.ndjson, *.ndjson.gz or - for stdin.")
+
+    def handle(self, *args, **opts):
+        t0 = time.monotonic()
+        try:
+            with transfer.open_file(opts["path"], "r") as f:
+                counts = transfer.load(f)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"{opts['path']}: {e}")
+        self.stdout.write("done: " + ", ".join(f"{n} {kind}" for kind, n in counts.items())
+                          + f" in {time.monotonic() - t0:.1f}s")
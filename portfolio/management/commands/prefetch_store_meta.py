@@ -0,0 +1,53 @@
+import time
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from portfolio.models import UserGame
+from portfolio import store_meta
+from portfolio.steam_client import get_client, TokenBucket
+
+
+class Command(BaseCommand):
+    help = ("Fetch Storefront metadata for every game in users' libraries that is missing or stale. "
+            "Safe to interrupt: each row is saved as it's fetched and fresh rows are skipped on the next run.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=None, help="Stop after this many apps.")
+        parser.add_argument("--rps", type=float, default=None,
+                            help="Store requests per second (default: STEAM_STORE_RATE).")
+        parser.add_argument("--all", action="store_true", help="Refetch fresh rows too.")
+
+    def handle(self, *args, **opts):
+        if opts["rps"]:
+            # The shared client already throttles the store host; just retune its bucket.
+            host = urlsplit(settings.STEAM_STORE_BASE).netloc
+            get_client().buckets[host] = TokenBucket(opts["rps"], 1)
+
+        appids = (UserGame.objects
+                  .values_list("game_id", flat=True)
+                  .distinct()
+                  .order_by("game_id"))
+        if not opts["all"]:
+            cutoff = timezone.now() - store_meta.STALE_AFTER
+            appids = appids.filter(Q(game__meta__isnull=True) | Q(game__meta__fetched_at__lt=cutoff))
+        appids = list(appids[:opts["limit"]] if opts["limit"] else appids)
+
+        self.stdout.write(f"{len(appids)} app(s) to fetch")
+        ok = failed = 0
+        t0 = time.monotonic()
+        for i, appid in enumerate(appids, 1):
+            try:
+                store_meta.refresh(appid)
+                ok += 1
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"  {appid}: {type(e).__name__}: {e}")
+            if i % 50 == 0:
+                rate = i / (time.monotonic() - t0)
+                self.stdout.write(f"  {i}/{len(appids)} ({rate:.1f}/s)")
+
+        self.stdout.write(f"done: {ok} fetched, {failed} failed in {time.monotonic() - t0:.1f}s")
@@ -0,0 +1,54 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+
+from portfolio import images
+from portfolio.models import Game
+
+
+class Command(BaseCommand):
+    help = ("Fetch the header image of every game in the Game table and build its resized variants "
+            "in the local image cache. Safe to interrupt: finished images are skipped on the next run.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=8, help="Parallel fetches.")
+        parser.add_argument("--limit", type=int, default=None, help="Stop after this many apps.")
+        parser.add_argument("--formats", default=",".join(images.FORMATS),
+                            help="Variants to build (default: all).")
+
+    def handle(self, *args, **opts):
+        formats = [f for f in opts["formats"].split(",") if f in images.FORMATS]
+        if images.Image is None:
+            self.stdout.write("Pillow is not installed: storing originals only")
+            formats = ["jpg"]
+        appids = Game.objects.order_by("appid").values_list("appid", flat=True)
+        appids = list(appids[:opts["limit"]] if opts["limit"] else appids)
+
+        self.stdout.write(f"{len(appids)} app(s)")
+        ok = missing = failed = 0
+        t0 = time.monotonic()
+        with ThreadPoolExecutor(max_workers=opts["workers"]) as pool:
+            futures = {pool.submit(self.warm, appid, formats): appid for appid in appids}
+            for i, f in enumerate(as_completed(futures), 1):
+                try:
+                    if f.result():
+                        ok += 1
+                    else:
+                        missing += 1
+                except Exception as e:
+                    failed += 1
+                    self.stderr.write(f"  {futures[f]}: {type(e).__name__}: {e}")
+                if i % 100 == 0:
+                    rate = i / (time.monotonic() - t0)
+                    self.stdout.write(f"  {i}/{len(appids)} ({rate:.1f}/s)")
+
+        self.stdout.write(f"done: {ok} cached, {missing} without a header, {failed} failed "
+                          f"in {time.monotonic() - t0:.1f}s; {images.disk_usage() // 1024} KB on disk")
+
+    def warm(self, appid, formats) -> bool:
+        for width in images.WIDTHS:
+            for fmt in formats:
+                if images.variant(appid, width, fmt) is None:
+                    return False
+        return True
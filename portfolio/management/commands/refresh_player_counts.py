@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from portfolio import player_counts
+
+
+class Command(BaseCommand):
+    help = ("Refresh concurrent-player counts for hot apps (viewed in the last 24h "
+            "or played in the last 2 weeks) in parallel batches.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=player_counts.REFRESH_WORKERS)
+        parser.add_argument("--limit", type=int, default=None, help="Max apps per pass.")
+        parser.add_argument("--budget", type=float, default=player_counts.REFRESH_BUDGET,
+                            help="Seconds per pass; apps not reached keep their reading and go first next pass.")
+        parser.add_argument("--interval", type=float, default=300,
+                            help="Seconds between passes when looping.")
+        parser.add_argument("--once", action="store_true", help="Run one pass and exit.")
+
+    def handle(self, *args, **opts):
+        try:
+            while True:
+                t0 = time.monotonic()
+                appids = player_counts.hot_appids(opts["limit"])
+                res = player_counts.refresh_counts(appids, workers=opts["workers"], budget=opts["budget"])
+                self.stdout.write(f"{len(appids)} app(s): {res['ok']} ok, {res['failed']} failed, "
+                                  f"{res['skipped']} not reached in {time.monotonic() - t0:.1f}s")
+                if opts["once"]:
+                    break
+                close_old_connections()
+                time.sleep(max(0.0, opts["interval"] - (time.monotonic() - t0)))
+        except KeyboardInterrupt:
+            self.stdout.write("stopped")
@@ -0,0 +1,146 @@
+import statistics, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from portfolio.models import Profile, SyncJob
+from portfolio import jobs, steam_api
+from portfolio.steam_client import get_client, TokenBucket
+from portfolio.sync import apply_summary
+
+# GetPlayerSummaries takes up to 100 steamids per call.
+SUMMARY_BATCH = 100
+
+
+def _lag_hours(profiles, now):
+    lags = [(now - p["last_synced"]).total_seconds() / 3600 if p["last_synced"] else None for p in profiles]
+    known = [l for l in lags if l is not None]
+    return {
+        "never_synced": lags.count(None),
+        "median_h": round(statistics.median(known), 1) if known else None,
+        "max_h": round(max(known), 1) if known else None,
+    }
+
+
+def _run(job_id: int):
+    """
+    Claim and run one queued job; None when a sync_worker got to it first.
+    """
+    try:
+        # Claimed only now, so at most --workers fleet jobs are running at once
+        # (sync_worker's concurrency cap counts running jobs).
+        if not jobs.claim(job_id):
+            return None
+        # Summaries were refreshed in bulk up front; skip the per-user calls.
+        jobs.run_job(job_id, profile_basics=False)
+    finally:
+        close_old_connections()
+    return job_id
+
+
+class Command(BaseCommand):
+    help = ("Resync stale libraries across all profiles, most stale/most active first, "
+            "under a global Steam API request budget. Re-run after a crash to resume.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--stale-hours", type=float, default=12,
+                            help="Sync profiles not synced for this long (active users: half).")
+        parser.add_argument("--limit", type=int, default=None, help="Max profiles this run.")
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--rpm", type=float, default=None,
+                            help="Global Steam Web API budget, requests per minute (default: STEAM_API_RATE).")
+        parser.add_argument("--dry-run", action="store_true", help="Only print the plan.")
+
+    def rank(self, now, stale_hours):
+        """
+        Due profiles, highest priority first. Score = hours since last sync x
+        an activity weight; never-synced profiles go first.
+        """
+        recent_login = now - timedelta(days=7)
+        rows = list(Profile.objects.values(
+            "id", "steamid64", "last_synced", "user__last_login", "stats__minutes_2weeks"))
+
+        due = []
+        for p in rows:
+            active = (p["user__last_login"] and p["user__last_login"] >= recent_login) or (p["stats__minutes_2weeks"] or 0) > 0
+            weight = 3.0 if active else 1.0
+            if p["last_synced"] is None:
+                due.append((float("inf"), p))
+                continue
+            age_h = (now - p["last_synced"]).total_seconds() / 3600
+            # Active users are kept twice as fresh.
+            if age_h >= stale_hours / (2 if active else 1):
+                due.append((age_h * weight, p))
+        due.sort(key=lambda sp: -sp[0])
+        return rows, [p for _, p in due]
+
+    def handle(self, *args, **opts):
+        now = timezone.now()
+        if opts["rpm"]:
+            # Every Steam call in this process (summaries, owned games,
+            # achievements) draws from the same bucket.
+            host = urlsplit(settings.STEAM_API_BASE).netloc
+            get_client().buckets[host] = TokenBucket(opts["rpm"] / 60.0, max(1, int(opts["rpm"] // 60)))
+
+        requeued = jobs.requeue_stale()
+        if requeued:
+            self.stdout.write(f"requeued {requeued} job(s) left running by a crashed run")
+
+        everyone, due = self.rank(now, opts["stale_hours"])
+        if opts["limit"]:
+            due = due[:opts["limit"]]
+        self.stdout.write(f"{len(due)} of {len(everyone)} profile(s) due; lag before: {_lag_hours(everyone, now)}")
+        if opts["dry_run"] or not due:
+            return
+
+        t0 = time.monotonic()
+
+        # 1) Persona/avatar for everyone due, 100 ids per call
+        profiles = {p.steamid64: p for p in Profile.objects.filter(id__in=[p["id"] for p in due])}
+        ids = list(profiles)
+        for i in range(0, len(ids), SUMMARY_BATCH):
+            try:
+                for s in steam_api.get_player_summaries(ids[i:i + SUMMARY_BATCH]):
+                    p = profiles.get(s.get("steamid"))
+                    if p:
+                        apply_summary(p, s)
+            except Exception as e:
+                self.stderr.write(f"summaries batch {i // SUMMARY_BATCH}: {e}")
+        Profile.objects.bulk_update(profiles.values(), ["persona", "avatar"], batch_size=500)
+
+        # 2) Library syncs as SyncJobs, so they dedupe with user-triggered ones
+        # and a crash leaves queued jobs the next run (or sync_worker) picks up.
+        job_ids = []
+        for p in due:
+            job = jobs.enqueue_sync(profiles[p["steamid64"]], run_inline=False)
+            if job.status == SyncJob.QUEUED:
+                job_ids.append(job.id)
+
+        done = failed = taken = 0
+        with ThreadPoolExecutor(max_workers=opts["workers"], thread_name_prefix="fleet") as pool:
+            for f in as_completed([pool.submit(_run, job_id) for job_id in job_ids]):
+                if f.result() is None:
+                    taken += 1
+                    continue
+                job = SyncJob.objects.get(id=f.result())
+                if job.status == SyncJob.DONE:
+                    done += 1
+                else:
+                    failed += 1
+                    self.stderr.write(f"profile {job.profile_id}: {job.error}")
+                if (done + failed) % 25 == 0:
+                    elapsed = time.monotonic() - t0
+                    self.stdout.write(f"  {done + failed}/{len(job_ids)} ({(done + failed) / elapsed * 60:.1f} profiles/min)")
+
+        elapsed = time.monotonic() - t0
+        after = list(Profile.objects.values("last_synced"))
+        self.stdout.write(
+            f"synced {done}, failed {failed}, skipped {len(due) - len(job_ids) + taken} (already being synced) "
+            f"in {elapsed:.1f}s = {(done + failed) / elapsed * 60 if elapsed else 0:.1f} profiles/min; "
+            f"lag after: {_lag_hours(after, timezone.now())}"
+        )
@@ -0,0 +1,100 @@
+import logging, time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections, connections
+
+from portfolio.models import SyncJob
+from portfolio import jobs
+
+logger = logging.getLogger(__name__)
+
+# Seconds between sweeps for jobs stuck in "running" (a crashed worker, or a
+# job whose outcome couldn't be written)
+REQUEUE_EVERY = 60
+
+
+def _run(job_id: int) -> int:
+    # Each thread/process uses its own DB connection; don't leak it between jobs.
+    try:
+        jobs.run_job(job_id)
+    finally:
+        close_old_connections()
+    return job_id
+
+
+class Command(BaseCommand):
+    help = "Run queued library syncs in a thread or process pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4, help="Pool size.")
+        parser.add_argument("--pool", choices=["thread", "process"], default="thread")
+        parser.add_argument("--max-running", type=int, default=None,
+                            help="Cap on running jobs across all workers (default: --workers).")
+        parser.add_argument("--poll", type=float, default=2.0, help="Seconds between queue polls when idle.")
+        parser.add_argument("--stale-minutes", type=int, default=15,
+                            help="Requeue jobs stuck in 'running' longer than this (crashed worker).")
+        parser.add_argument("--once", action="store_true", help="Drain the queue and exit.")
+
+    def handle(self, *args, **opts):
+        workers = opts["workers"]
+        max_running = opts["max_running"] or workers
+
+        stale_after = timedelta(minutes=opts["stale_minutes"])
+        if opts["pool"] == "process":
+            # Forked children must not share the parent's DB connection.
+            connections.close_all()
+            pool = ProcessPoolExecutor(max_workers=workers)
+        else:
+            pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sync")
+
+        inflight = {}       # future -> job id
+        next_requeue = 0.0
+        self.stdout.write(f"sync_worker: {opts['pool']} pool x{workers}, max running {max_running}")
+        try:
+            while True:
+                # A database hiccup (e.g. SQLite "database is locked") skips
+                # this round instead of stopping the worker.
+                try:
+                    if time.monotonic() >= next_requeue:
+                        requeued = jobs.requeue_stale(stale_after, exclude=inflight.values())
+                        if requeued:
+                            self.stdout.write(f"requeued {requeued} stale job(s)")
+                        next_requeue = time.monotonic() + REQUEUE_EVERY
+                    # Global cap: includes jobs running in other worker processes.
+                    running = SyncJob.objects.filter(status=SyncJob.RUNNING).count()
+                    slots = min(workers - len(inflight), max_running - running)
+                    if slots > 0:
+                        for job_id in jobs.claim_next(slots):
+                            inflight[pool.submit(_run, job_id)] = job_id
+                except DatabaseError:
+                    logger.exception("sync_worker: polling the queue failed")
+
+                if inflight:
+                    done, _ = wait(inflight, timeout=opts["poll"], return_when=FIRST_COMPLETED)
+                    for f in done:
+                        self._report(inflight.pop(f), f)
+                    continue
+
+                if opts["once"]:
+                    break
+                close_old_connections()
+                time.sleep(opts["poll"])
+        except KeyboardInterrupt:
+            self.stdout.write("shutting down, waiting for running jobs...")
+        finally:
+            pool.shutdown(wait=True)
+
+    def _report(self, job_id, future):
+        # run_job records sync errors on the job itself; anything raised here
+        # (claiming, writing the outcome) leaves the job "running" until the
+        # next stale sweep requeues it.
+        try:
+            future.result()
+            job = SyncJob.objects.get(id=job_id)
+        except Exception:
+            logger.exception("sync_worker: job %s didn't finish cleanly", job_id)
+            return
+        self.stdout.write(f"job {job.id} profile {job.profile_id}: {job.status} "
+                          f"in {job.duration_ms} ms {job.error or job.result}")
@@ -0,0 +1,95 @@
+import cProfile, random, threading, time
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils import timezone
+
+from . import perf
+
+# Only one request is profiled at a time (profilers don't nest well).
+_profile_lock = threading.Lock()
+
+class TimingMiddleware:
+    """
+    Times every request: DB, Steam HTTP, cache, render (see perf.py).
+    Adds a Server-Timing header, feeds the per-view percentiles behind
+    /stats/requests/, and with PERF_PROFILE_SAMPLE > 0 runs a sample of
+    requests under cProfile, keeping the dumps of slow ones.
+    Works in both sync (WSGI) and async (ASGI) middleware chains.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        profiler = _start_profiler()
+        t0 = time.perf_counter()
+        try:
+            with perf.collect() as t:
+                if profiler:
+                    profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    if profiler:
+                        profiler.disable()
+            _finish(request, response, t, t0, profiler)
+        finally:
+            if profiler:
+                _profile_lock.release()
+        return response
+
+    async def __acall__(self, request):
+        # Only this coroutine's thread is profiled; sections run in worker threads.
+        profiler = _start_profiler()
+        t0 = time.perf_counter()
+        try:
+            with perf.collect() as t:
+                if profiler:
+                    profiler.enable()
+                try:
+                    response = await self.get_response(request)
+                finally:
+                    if profiler:
+                        profiler.disable()
+            _finish(request, response, t, t0, profiler)
+        finally:
+            if profiler:
+                _profile_lock.release()
+        return response
+
+def _start_profiler():
+    if settings.PERF_PROFILE_SAMPLE and random.random() < settings.PERF_PROFILE_SAMPLE \
+            and _profile_lock.acquire(blocking=False):
+        return cProfile.Profile()
+    return None
+
+def _finish(request, response, t, t0, profiler):
+    total_ms = (time.perf_counter() - t0) * 1000
+    match = request.resolver_match
+    if match is not None:
+        perf.observe(match.view_name or match._func_path, total_ms, t)
+    if settings.PERF_SERVER_TIMING:
+        response["Server-Timing"] = perf.server_timing(t, total_ms)
+    if profiler and total_ms >= settings.PERF_PROFILE_SLOW_MS:
+        _dump(profiler, match.view_name if match else "unresolved", total_ms)
+
+def _dump(profiler, view, total_ms):
+    """
+    Write <dir>/<time>-<view>-<ms>ms.prof (read with `python -m pstats`) and
+    keep only the newest PERF_PROFILE_KEEP files.
+    """
+    out = Path(settings.PERF_PROFILE_DIR)
+    out.mkdir(parents=True, exist_ok=True)
+    name = f"{timezone.now():%Y%m%dT%H%M%S}-{view.replace(':', '_')}-{int(total_ms)}ms.prof"
+    profiler.dump_stats(str(out / name))
+    for old in sorted(out.glob("*.prof"), key=lambda f: f.stat().st_mtime)[:-settings.PERF_PROFILE_KEEP]:
+        old.unlink(missing_ok=True)
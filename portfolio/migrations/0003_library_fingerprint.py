@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:41
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0002_sync_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LibraryFingerprint',
+            fields=[
+                ('profile', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='library_fingerprint', serialize=False, to='portfolio.profile')),
+                ('digest', models.CharField(max_length=40)),
+                ('data', models.BinaryField()),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
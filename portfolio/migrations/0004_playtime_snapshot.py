@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:42
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0003_library_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlaytimeSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('data', models.BinaryField()),
+                ('profile', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='playtime_snapshots', to='portfolio.profile')),
+            ],
+            options={
+                'unique_together': {('profile', 'day')},
+            },
+        ),
+    ]
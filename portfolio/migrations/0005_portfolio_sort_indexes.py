@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0004_playtime_snapshot'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='game',
+            name='name',
+            field=models.CharField(db_index=True, max_length=200),
+        ),
+        migrations.AddIndex(
+            model_name='usergame',
+            index=models.Index(fields=['profile', '-playtime_forever', '-game'], name='ug_profile_forever_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usergame',
+            index=models.Index(fields=['profile', '-playtime_2weeks', '-game'], name='ug_profile_2weeks_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usergame',
+            index=models.Index(fields=['profile', '-rtime_last_played', '-game'], name='ug_profile_lastplayed_idx'),
+        ),
+    ]
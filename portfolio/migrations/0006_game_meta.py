@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:44
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0005_portfolio_sort_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GameMeta',
+            fields=[
+                ('game', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='meta', serialize=False, to='portfolio.game')),
+                ('found', models.BooleanField(default=True)),
+                ('genres', models.JSONField(blank=True, default=list)),
+                ('short_description', models.TextField(blank=True)),
+                ('website', models.URLField(blank=True, max_length=500)),
+                ('release_date', models.CharField(blank=True, max_length=50)),
+                ('fetched_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
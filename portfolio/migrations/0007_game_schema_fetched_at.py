@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0006_game_meta'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='game',
+            name='schema_fetched_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0007_game_schema_fetched_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProfileStats',
+            fields=[
+                ('profile', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='portfolio.profile')),
+                ('games_total', models.IntegerField(default=0)),
+                ('games_played', models.IntegerField(default=0)),
+                ('minutes_total', models.BigIntegerField(default=0)),
+                ('minutes_2weeks', models.IntegerField(default=0)),
+                ('genre_minutes', models.JSONField(blank=True, default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
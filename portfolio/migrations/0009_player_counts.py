@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0008_profile_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayerCount',
+            fields=[
+                ('appid', models.IntegerField(primary_key=True, serialize=False)),
+                ('count', models.IntegerField(blank=True, null=True)),
+                ('counted_at', models.DateTimeField(blank=True, null=True)),
+                ('checked_at', models.DateTimeField(blank=True, null=True)),
+                ('ok', models.BooleanField(default=False)),
+                ('last_viewed_at', models.DateTimeField(blank=True, db_index=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PlayerCountSample',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('appid', models.IntegerField()),
+                ('at', models.DateTimeField()),
+                ('count', models.IntegerField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['appid', 'at'], name='portfolio_p_appid_5a501f_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:14
+
+from django.db import migrations, models
+
+
+def _encode(profile_ids):
+    # Sorted ids -> gaps as unsigned LEB128 varints (see portfolio/ownership.py)
+    out, prev = bytearray(), 0
+    for pid in profile_ids:
+        gap, prev = pid - prev, pid
+        while gap >= 0x80:
+            out.append(gap & 0x7F | 0x80)
+            gap >>= 7
+        out.append(gap)
+    return bytes(out)
+
+
+def backfill(apps, schema_editor):
+    # One pass over UserGame ordered by app, then profile; one row per app.
+    UserGame = apps.get_model("portfolio", "UserGame")
+    AppOwners = apps.get_model("portfolio", "AppOwners")
+    rows, appid, owners = [], None, []
+    for game_id, profile_id in (UserGame.objects.order_by("game_id", "profile_id")
+                                .values_list("game_id", "profile_id").iterator(chunk_size=5000)):
+        if game_id != appid:
+            if appid is not None:
+                rows.append(AppOwners(appid=appid, profile_ids=_encode(owners)))
+            appid, owners = game_id, []
+        owners.append(profile_id)
+        if len(rows) >= 500:
+            AppOwners.objects.bulk_create(rows)
+            rows = []
+    if appid is not None:
+        rows.append(AppOwners(appid=appid, profile_ids=_encode(owners)))
+    AppOwners.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0009_player_counts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AppOwners',
+            fields=[
+                ('appid', models.IntegerField(primary_key=True, serialize=False)),
+                ('profile_ids', models.BinaryField()),
+            ],
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
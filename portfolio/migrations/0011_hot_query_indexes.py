@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0010_app_owners'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='playercountsample',
+            index=models.Index(fields=['at'], name='pcs_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='syncjob',
+            index=models.Index(fields=['profile', '-created_at'], name='syncjob_profile_latest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usergame',
+            index=models.Index(condition=models.Q(('playtime_2weeks__gt', 0)), fields=['game'], name='ug_active_game_idx'),
+        ),
+    ]
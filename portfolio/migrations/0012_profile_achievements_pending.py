@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0011_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='achievements_pending',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('portfolio', '0012_profile_achievements_pending'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='achievement',
+            name='icon',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AlterField(
+            model_name='achievement',
+            name='icongray',
+            field=models.TextField(blank=True),
+        ),
+    ]
@@ -8,13 +8,18 @@ class Profile(models.Model):
     avatar = models.URLField(blank=True)
     level = models.IntegerField(default=0)
     last_synced = models.DateTimeField(null=True, blank=True)
+    # Apps whose achievements a sync couldn't fetch -> failed attempts so far;
+    # retried by the next syncs (see achievements.py)
+    achievements_pending = models.JSONField(default=dict, blank=True)
 
     def __str__(self):
         return f"{self.user.username} ({self.steamid64})"
     
 class Game(models.Model):
     appid = models.IntegerField(primary_key=True)
-    name = models.CharField(max_length=200)
+    name = models.CharField(max_length=200, db_index=True)
+    # When the achievement schema was last fetched (shared by all users; see achievements.py)
+    schema_fetched_at = models.DateTimeField(null=True, blank=True)
 
     def __str__(self): return f"{self.name} [{self.appid}]"
 
@@ -27,14 +32,23 @@ class UserGame(models.Model):
 
     class Meta:
         unique_together = ('profile', 'game')
+        # Keyset pagination for each portfolio sort (see portfolio/library.py)
+        indexes = [
+            models.Index(fields=["profile", "-playtime_forever", "-game"], name="ug_profile_forever_idx"),
+            models.Index(fields=["profile", "-playtime_2weeks", "-game"], name="ug_profile_2weeks_idx"),
+            models.Index(fields=["profile", "-rtime_last_played", "-game"], name="ug_profile_lastplayed_idx"),
+            # Apps played in the last two weeks by anyone (player_counts.hot_appids)
+            models.Index(fields=["game"], condition=models.Q(playtime_2weeks__gt=0), name="ug_active_game_idx"),
+        ]
 
 class Achievement(models.Model):
     appid = models.IntegerField()
     apiname =  models.CharField(max_length=200)
     displayname = models.CharField(max_length=200)
     description = models.TextField(blank= True)
-    icon = models.URLField(blank=True)
-    icongray = models.URLField(blank=True)
+    # CDN URLs, stored whole (no length cap to truncate them to)
+    icon = models.TextField(blank=True)
+    icongray = models.TextField(blank=True)
 
     class Meta:
         unique_together = ("appid", "apiname")
@@ -47,4 +61,134 @@ class UserAchievement(models.Model):
     unlocktime = models.IntegerField(default=0)
 
     class Meta:
-        unique_together = ("profile", "appid", "apiname")
\ No newline at end of file
+        unique_together = ("profile", "appid", "apiname")
+
+class SyncJob(models.Model):
+    """
+    One queued/running/finished library sync. Picked up by `manage.py sync_worker`.
+    """
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [(QUEUED, "Queued"), (RUNNING, "Running"), (DONE, "Done"), (FAILED, "Failed")]
+    ACTIVE = (QUEUED, RUNNING)
+
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name="sync_jobs")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    duration_ms = models.IntegerField(null=True, blank=True)
+    result = models.JSONField(default=dict, blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "created_at"]),
+            # Latest/active job for a profile, on every portfolio view
+            models.Index(fields=["profile", "-created_at"], name="syncjob_profile_latest_idx"),
+        ]
+        constraints = [
+            # At most one queued/running job per profile: repeat "Sync Now" clicks dedupe.
+            models.UniqueConstraint(
+                fields=["profile"], condition=models.Q(status__in=["queued", "running"]),
+                name="one_active_sync_per_profile",
+            ),
+        ]
+
+    def __str__(self):
+        return f"sync #{self.pk} {self.profile_id} [{self.status}]"
+
+class LibraryFingerprint(models.Model):
+    """
+    What the last sync saw for a profile: a digest of the whole library plus
+    packed per-appid values, so the next sync can diff without reading UserGame.
+    """
+    profile = models.OneToOneField(Profile, on_delete=models.CASCADE, primary_key=True,
+                                   related_name="library_fingerprint")
+    digest = models.CharField(max_length=40)
+    data = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+class PlaytimeSnapshot(models.Model):
+    """
+    Playtime changes for one profile on one day. Only games whose playtime
+    moved are stored, packed as (appid, playtime_forever, delta_minutes)
+    int32 triples; see portfolio/history.py.
+    """
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name="playtime_snapshots")
+    day = models.DateField()
+    data = models.BinaryField()
+
+    class Meta:
+        unique_together = ("profile", "day")
+
+class GameMeta(models.Model):
+    """
+    Storefront metadata for a game, shared by every user and worker.
+    Filled by `manage.py prefetch_store_meta` and refreshed in the background
+    when a detail page finds it stale (see portfolio/store_meta.py).
+    """
+    game = models.OneToOneField(Game, on_delete=models.CASCADE, primary_key=True, related_name="meta")
+    # False when the store has no page for the app (delisted, tools, ...)
+    found = models.BooleanField(default=True)
+    genres = models.JSONField(default=list, blank=True)
+    short_description = models.TextField(blank=True)
+    website = models.URLField(max_length=500, blank=True)
+    release_date = models.CharField(max_length=50, blank=True)
+    fetched_at = models.DateTimeField(db_index=True)
+
+    def __str__(self): return f"meta [{self.game_id}]"
+
+class ProfileStats(models.Model):
+    """
+    Library totals for the portfolio header, kept up to date by sync_library
+    from each sync's diff (see portfolio/stats.py) so reading them is O(1).
+    """
+    profile = models.OneToOneField(Profile, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    games_total = models.IntegerField(default=0)
+    games_played = models.IntegerField(default=0)
+    minutes_total = models.BigIntegerField(default=0)
+    minutes_2weeks = models.IntegerField(default=0)
+    # genre -> minutes played, from GameMeta genres
+    genre_minutes = models.JSONField(default=dict, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+class PlayerCount(models.Model):
+    """
+    Latest concurrent-player count per app, refreshed for "hot" apps by
+    `manage.py refresh_player_counts` (see portfolio/player_counts.py).
+    `count` is the last successful reading; `ok` says whether the latest
+    attempt worked, so a failure shows as unknown instead of 0.
+    """
+    appid = models.IntegerField(primary_key=True)
+    count = models.IntegerField(null=True, blank=True)
+    counted_at = models.DateTimeField(null=True, blank=True)
+    checked_at = models.DateTimeField(null=True, blank=True)
+    ok = models.BooleanField(default=False)
+    last_viewed_at = models.DateTimeField(null=True, blank=True, db_index=True)
+
+class PlayerCountSample(models.Model):
+    """
+    Rolling ~24h of readings per app for the detail-page sparkline.
+    """
+    appid = models.IntegerField()
+    at = models.DateTimeField()
+    count = models.IntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["appid", "at"]),
+            # Pruning samples older than the window
+            models.Index(fields=["at"], name="pcs_at_idx"),
+        ]
+
+class AppOwners(models.Model):
+    """
+    Which registered profiles own an app: their Profile ids, sorted and
+    delta-encoded as varints. Kept up to date by sync_library from each
+    sync's diff (see portfolio/ownership.py).
+    """
+    appid = models.IntegerField(primary_key=True)
+    profile_ids = models.BinaryField()
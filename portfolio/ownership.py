@@ -0,0 +1,143 @@
+from array import array
+from bisect import bisect_left
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .cache import get_or_compute
+from .models import AppOwners, Profile, UserGame
+
+# "Who among our users owns app X": one row per appid holding the sorted
+# Profile ids that own it, delta-encoded as varints (dense ids cost a byte
+# each, and a row's size follows its owner count, not the largest id).
+# sync_library applies each sync's diff (only ownership changes touch it, not
+# playtime). Lookups read one cached id list and binary-search it.
+OWNERS_TTL = 3600
+LIBRARY_TTL = 3600
+BATCH_SIZE = 500
+
+def _encode(profile_ids) -> bytes:
+    """
+    Sorted ids -> gaps from the previous id as unsigned LEB128 varints.
+    """
+    out, prev = bytearray(), 0
+    for pid in profile_ids:
+        gap, prev = pid - prev, pid
+        while gap >= 0x80:
+            out.append(gap & 0x7F | 0x80)
+            gap >>= 7
+        out.append(gap)
+    return bytes(out)
+
+def _decode(data) -> array:
+    ids, prev, gap, shift = array("I"), 0, 0, 0
+    for byte in bytes(data):
+        gap |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        prev += gap
+        ids.append(prev)
+        gap, shift = 0, 0
+    return ids
+
+def _key(appid: int) -> str:
+    return f"own:{appid}"
+
+def _library_key(profile_id: int) -> str:
+    return f"ownlib:{profile_id}"
+
+def apply_diff(profile, diff: dict) -> None:
+    """
+    Add the profile to the owners of inserted apps and drop it from removed
+    ones. Call inside the sync transaction; the rows are locked while they're
+    rewritten so concurrent syncs of other profiles don't lose owners.
+    """
+    changes = {appid: ({profile.id}, ()) for appid, _ in diff["inserted"]}
+    changes.update({appid: ((), {profile.id}) for appid, _ in diff["removed"]})
+    apply_changes(changes, [profile.id])
+
+def apply_changes(changes: dict, profile_ids=()) -> None:
+    """
+    {appid: (profile ids to add, profile ids to remove)} for any number of
+    profiles at once (apply_diff, bulk imports). Call inside a transaction.
+    """
+    # Appid order, so concurrent syncs lock rows in the same order
+    moves = sorted(changes.items())
+    for i in range(0, len(moves), BATCH_SIZE):
+        chunk = dict(moves[i:i + BATCH_SIZE])
+        # Make sure every row exists first: on Postgres two syncs adding the
+        # same new app would otherwise both start from an empty list.
+        AppOwners.objects.bulk_create([AppOwners(appid=appid, profile_ids=b"") for appid in chunk],
+                                      ignore_conflicts=True)
+        current = dict(AppOwners.objects.select_for_update()
+                       .filter(appid__in=list(chunk)).values_list("appid", "profile_ids"))
+        rows = []
+        for appid, (add, remove) in chunk.items():
+            owners = set(_decode(current.get(appid, b"")))
+            changed = owners.union(add).difference(remove)
+            if changed != owners:
+                rows.append(AppOwners(appid=appid, profile_ids=_encode(sorted(changed))))
+        AppOwners.objects.bulk_create(rows, update_conflicts=True,
+                                      unique_fields=["appid"], update_fields=["profile_ids"])
+    if moves:
+        keys = [_key(appid) for appid, _ in moves] + [_library_key(pid) for pid in profile_ids]
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+def owners(appid: int) -> array:
+    """
+    The ids of the profiles that own the app, sorted. Cached until a sync
+    changes them.
+    """
+    data = get_or_compute(
+        _key(appid),
+        lambda: _decode(AppOwners.objects.filter(appid=appid)
+                        .values_list("profile_ids", flat=True).first() or b"").tobytes(),
+        OWNERS_TTL,
+    )
+    ids = array("I")
+    ids.frombytes(data)
+    return ids
+
+def registered(steamids) -> dict:
+    """
+    {steamid: profile id} for the steamids that have a synced profile here.
+    """
+    steamids = list(steamids)
+    found = {}
+    for i in range(0, len(steamids), BATCH_SIZE):
+        found.update(Profile.objects.filter(steamid64__in=steamids[i:i + BATCH_SIZE], last_synced__isnull=False)
+                     .values_list("steamid64", "id"))
+    return found
+
+def owners_among(appid: int, profile_ids) -> set:
+    """
+    The subset of profile_ids that own appid.
+    """
+    ids = owners(appid)
+    found = set()
+    for pid in profile_ids:
+        i = bisect_left(ids, pid)
+        if i < len(ids) and ids[i] == pid:
+            found.add(pid)
+    return found
+
+def library_appids(profile_id: int) -> array:
+    """
+    The profile's appids, sorted. Cached until its next sync changes ownership.
+    """
+    data = get_or_compute(
+        _library_key(profile_id),
+        lambda: array("I", UserGame.objects.filter(profile_id=profile_id)
+                      .order_by("game_id").values_list("game_id", flat=True)).tobytes(),
+        LIBRARY_TTL,
+    )
+    appids = array("I")
+    appids.frombytes(data)
+    return appids
+
+def library_overlap(profile_a_id: int, profile_b_id: int) -> set:
+    """
+    Appids both profiles own.
+    """
+    return set(library_appids(profile_a_id)).intersection(library_appids(profile_b_id))
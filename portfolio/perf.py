@@ -0,0 +1,167 @@
+import contextvars, math, threading, time
+from collections import deque
+from contextlib import contextmanager
+
+from django.db import connection
+
+# --- Per-request (or per-job) timings ---
+# collect() installs a Timings for the current context; the DB wrapper, the
+# Steam client, the cache and span() add to it. Work handed to fan_out threads
+# runs in a copy of the context, so its HTTP calls count too. Outside collect()
+# every hook is a no-op.
+
+_current = contextvars.ContextVar("perf_timings", default=None)
+
+class Timings:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.db_queries = 0
+        self.db_ms = 0.0
+        self.http = {}      # endpoint path -> [calls, ms]
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.spans = {}     # name -> ms
+
+    @property
+    def http_calls(self) -> int:
+        return sum(c for c, _ in self.http.values())
+
+    @property
+    def http_ms(self) -> float:
+        return sum(ms for _, ms in self.http.values())
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "db_queries": self.db_queries,
+                "db_ms": round(self.db_ms, 1),
+                "http_calls": self.http_calls,
+                "http_ms": round(self.http_ms, 1),
+                "http": {path: {"calls": c, "ms": round(ms, 1)} for path, (c, ms) in self.http.items()},
+                "cache_hits": self.cache_hits,
+                "cache_misses": self.cache_misses,
+                **{f"{name}_ms": round(ms, 1) for name, ms in self.spans.items()},
+            }
+
+def current():
+    return _current.get()
+
+def _db_wrapper(execute, sql, params, many, context):
+    t = _current.get()
+    t0 = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if t is not None:
+            with t._lock:
+                t.db_queries += 1
+                t.db_ms += (time.perf_counter() - t0) * 1000
+
+@contextmanager
+def collect():
+    """
+    Record timings for the block. DB queries are counted on this thread's
+    connection only.
+    """
+    t = Timings()
+    token = _current.set(t)
+    try:
+        with connection.execute_wrapper(_db_wrapper):
+            yield t
+    finally:
+        _current.reset(token)
+
+def record_http(path: str, ms: float) -> None:
+    t = _current.get()
+    if t is not None:
+        with t._lock:
+            calls_ms = t.http.setdefault(path, [0, 0.0])
+            calls_ms[0] += 1
+            calls_ms[1] += ms
+
+def record_cache(hit: bool) -> None:
+    t = _current.get()
+    if t is not None:
+        with t._lock:
+            if hit:
+                t.cache_hits += 1
+            else:
+                t.cache_misses += 1
+
+@contextmanager
+def span(name: str):
+    """
+    Time a named phase ("render", "sync_db", ...). Repeated spans add up.
+    """
+    t = _current.get()
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        if t is not None:
+            with t._lock:
+                t.spans[name] = t.spans.get(name, 0.0) + (time.perf_counter() - t0) * 1000
+
+# --- Aggregates per view ---
+# The last SAMPLE_WINDOW requests per view name, in this process. Read with
+# request_stats().
+
+SAMPLE_WINDOW = 1000
+
+_samples = {}
+_samples_lock = threading.Lock()
+
+def observe(view: str, total_ms: float, t: Timings) -> None:
+    sample = (total_ms, t.db_queries, t.db_ms, t.http_calls, t.http_ms, t.spans.get("render", 0.0))
+    with _samples_lock:
+        _samples.setdefault(view, deque(maxlen=SAMPLE_WINDOW)).append(sample)
+
+def _percentile(sorted_values, p):
+    # Nearest rank
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+def request_stats() -> dict:
+    """
+    Per view: request count, p50/p95/p99 total time and mean DB/HTTP/render cost.
+    """
+    with _samples_lock:
+        snapshot = {view: list(d) for view, d in _samples.items()}
+    out = {}
+    for view, rows in snapshot.items():
+        n = len(rows)
+        totals = sorted(r[0] for r in rows)
+        mean = lambda i: round(sum(r[i] for r in rows) / n, 1)
+        out[view] = {
+            "requests": n,
+            "p50_ms": round(_percentile(totals, 50), 1),
+            "p95_ms": round(_percentile(totals, 95), 1),
+            "p99_ms": round(_percentile(totals, 99), 1),
+            "max_ms": round(totals[-1], 1),
+            "db_queries_avg": mean(1),
+            "db_ms_avg": mean(2),
+            "http_calls_avg": mean(3),
+            "http_ms_avg": mean(4),
+            "render_ms_avg": mean(5),
+        }
+    return out
+
+def reset_request_stats() -> None:
+    with _samples_lock:
+        _samples.clear()
+
+def server_timing(t: Timings, total_ms: float) -> str:
+    """
+    Server-Timing header value (shows up in the browser's network panel).
+    """
+    parts = [
+        f"total;dur={total_ms:.1f}",
+        f'db;dur={t.db_ms:.1f};desc="{t.db_queries} queries"',
+        f'steam;dur={t.http_ms:.1f};desc="{t.http_calls} calls"',
+        f'cache;desc="{t.cache_hits} hit / {t.cache_misses} miss"',
+    ]
+    for name, ms in t.spans.items():
+        parts.append(f"{name};dur={ms:.1f}")
+    for path, (calls, ms) in t.http.items():
+        metric = "-".join(p for p in path.split("/") if p) or "root"
+        parts.append(f'steam-{metric};dur={ms:.1f};desc="{calls}x"')
+    return ", ".join(parts)
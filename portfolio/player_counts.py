@@ -0,0 +1,119 @@
+import threading
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.utils import timezone
+
+from .background import submit_once
+from .models import PlayerCount, PlayerCountSample, UserGame
+from . import steam_api
+
+# Player counts are refreshed on a schedule for "hot" apps (viewed recently or
+# played in the last 2 weeks by someone) and served from the PlayerCount table.
+# The detail page never calls Steam for them.
+HOT_VIEW_WINDOW = timedelta(hours=24)
+FRESH_FOR = timedelta(minutes=30)       # older readings show as unknown
+HISTORY_WINDOW = timedelta(hours=24)    # sparkline range
+REFRESH_WORKERS = 8
+REFRESH_CALL_TIMEOUT = 10
+REFRESH_BUDGET = 60.0
+VIEW_NOTE_TTL = 300                     # write last_viewed_at at most every 5 min per app
+BATCH_SIZE = 500
+
+def hot_appids(limit: int = None) -> list:
+    """
+    Recently viewed apps and apps in active libraries, least recently checked
+    first (never checked before anything else), so a pass that runs out of
+    budget leaves different apps for the next one.
+    """
+    since = timezone.now() - HOT_VIEW_WINDOW
+    viewed = PlayerCount.objects.filter(last_viewed_at__gte=since).values_list("appid", flat=True)
+    active = (UserGame.objects
+              .filter(playtime_2weeks__gt=0)
+              .values_list("game_id", flat=True)
+              .distinct())
+    appids = list(dict.fromkeys([*viewed, *active]))
+    checked = {}
+    for i in range(0, len(appids), BATCH_SIZE):
+        checked.update(PlayerCount.objects
+                       .filter(appid__in=appids[i:i + BATCH_SIZE], checked_at__isnull=False)
+                       .values_list("appid", "checked_at"))
+    appids.sort(key=lambda appid: (appid in checked, checked.get(appid) or since))
+    return appids[:limit] if limit else appids
+
+def refresh_counts(appids, workers: int = REFRESH_WORKERS, budget: float = REFRESH_BUDGET) -> dict:
+    """
+    Fetch counts for many apps in parallel and store them with a sample each.
+    Apps whose call failed (error, no count) are recorded as not ok; apps the
+    budget didn't reach, or that were still in flight, keep their last reading.
+    """
+    appids = list(dict.fromkeys(appids))
+    if not appids:
+        return {"ok": 0, "failed": 0, "skipped": 0}
+
+    errors, lock = set(), threading.Lock()
+
+    def fetch(appid):
+        try:
+            return steam_api.get_number_of_current_players(appid, timeout=REFRESH_CALL_TIMEOUT)
+        except Exception:
+            with lock:
+                errors.add(appid)
+            raise
+
+    results, _ = steam_api.fan_out(fetch, appids, max_workers=workers, budget=budget)
+    now = timezone.now()
+    good = {appid: c for appid, c in results.items() if c is not None}
+    with lock:
+        bad = [appid for appid in appids if appid in errors or (appid in results and results[appid] is None)]
+
+    PlayerCount.objects.bulk_create(
+        [PlayerCount(appid=appid, count=c, counted_at=now, checked_at=now, ok=True) for appid, c in good.items()],
+        batch_size=500, update_conflicts=True, unique_fields=["appid"],
+        update_fields=["count", "counted_at", "checked_at", "ok"],
+    )
+    # Keep the last good count, but flag it: the page shows it as unknown.
+    PlayerCount.objects.bulk_create(
+        [PlayerCount(appid=appid, checked_at=now, ok=False) for appid in bad],
+        batch_size=500, update_conflicts=True, unique_fields=["appid"],
+        update_fields=["checked_at", "ok"],
+    )
+    PlayerCountSample.objects.bulk_create(
+        [PlayerCountSample(appid=appid, at=now, count=c) for appid, c in good.items()], batch_size=500)
+    PlayerCountSample.objects.filter(at__lt=now - HISTORY_WINDOW).delete()
+    return {"ok": len(good), "failed": len(bad), "skipped": len(appids) - len(good) - len(bad)}
+
+def note_view(appid: int) -> None:
+    """
+    Mark the app as hot. Throttled through the cache so page views don't
+    turn into a write each.
+    """
+    if cache.add(f"pcview:{appid}", 1, VIEW_NOTE_TTL):
+        PlayerCount.objects.bulk_create(
+            [PlayerCount(appid=appid, last_viewed_at=timezone.now())],
+            update_conflicts=True, unique_fields=["appid"], update_fields=["last_viewed_at"],
+        )
+
+def current(appid: int):
+    """
+    (count or None, row) for the page. None means unknown: never counted,
+    the latest attempt failed, or the reading is stale. No network; an app
+    that was never counted gets one background refresh.
+    """
+    row = PlayerCount.objects.filter(appid=appid).first()
+    if row is None or row.checked_at is None:
+        submit_once(("player_count", appid), refresh_counts, [appid])
+        return None, row
+    if not row.ok or row.counted_at is None or row.counted_at < timezone.now() - FRESH_FOR:
+        return None, row
+    return row.count, row
+
+def history(appid: int) -> list:
+    """
+    [(time, count)] over the last 24h, oldest first.
+    """
+    since = timezone.now() - HISTORY_WINDOW
+    return list(PlayerCountSample.objects
+                .filter(appid=appid, at__gte=since)
+                .order_by("at")
+                .values_list("at", "count"))
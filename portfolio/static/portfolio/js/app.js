@@ -15,49 +15,77 @@
         };
 
         // ---------- Portfolio page widgets ----------
+        // Sorting, search and paging happen server-side (/me/games/ JSON, keyset cursor).
         const grid = $("[data-grid]");
-        const cards = grid ? $$("[data-card]", grid) : [];
+        const form = $("[data-library]");
+        const more = $("[data-more]");
         const sortSelect = $("[data-sort]");
         const searchInput = $("[data-search]");
 
-        // ----------- lazy-load covers ----------
-        const lazyImgs = $$("img[loading='lazy'], img[data-lazy]");
-        if ("IntersectionObserver" in window && lazyImgs.length) {
-            const io = new IntersectionObserver((entries) => {
-                entries.forEach((e) => {
-                    if (e.isIntersecting) {
-                        const img = e.target;
-                        if (img.dataset.src) img.src = img.dataset.src;
-                        img.removeAttribute("data-lazy");
-                        io.unobserve(img)
-                    }
-                });
-            }, { rootMargin: "200px 0px" });
-            lazyImgs.forEach((img) => io.observe(img));
+        let cursor = more ? more.dataset.cursor : "";
+        let inflight = null; // AbortController of the page request in flight
+
+        function cardFor(g) {
+            const a = document.createElement("a");
+            a.className = "card";
+            a.href = g.url;
+            a.dataset.card = "";
+
+            const img = document.createElement("img");
+            img.className = "cover";
+            img.loading = "lazy";
+            img.alt = g.name;
+            img.src = g.image;
+
+            const h3 = document.createElement("h3");
+            h3.textContent = g.name;
+
+            const p = document.createElement("p");
+            let text = `Total: ${g.total}`;
+            if (g.recent) text += ` | Last 2w: ${g.recent}`;
+            if (g.last_played) text += ` | Last played: ${g.last_played}`;
+            p.textContent = text;
+
+            a.append(img, h3, p);
+            return a;
         }
 
-        function sortCards(mode) {
-            if (!grid || cards.length === 0) return;
-            const list = Array.from(cards);
-            list.sort((a, b) => {
-                if (mode === "name") {
-                    return (a.dataset.name || "").localeCompare(b.dataset.name || "", undefined, { sensitivity: "base"});
-                }
-                // default: most played (minutes desc)
-                const am = +(a.dataset.minutes || 0)
-                const bm = +(b.dataset.minutes || 0)
-                return bm - am;
+        function loadPage(reset) {
+            if (!grid || !form || (!reset && (inflight || !cursor))) return;
+            // A new search/sort supersedes whatever is still loading, so the
+            // latest query always wins instead of being dropped.
+            if (inflight) inflight.abort();
+            const ctrl = new AbortController();
+            inflight = ctrl;
+            const q = new URLSearchParams({
+                sort: sortSelect ? sortSelect.value : "",
+                q: searchInput ? searchInput.value.trim() : "",
             });
-            list.forEach((el) => grid.appendChild(el));
+            if (!reset) q.set("cursor", cursor);
+
+            fetch(`${form.dataset.library}?${q.toString()}`, { credentials: "same-origin", signal: ctrl.signal })
+                .then((r) => r.json())
+                .then((data) => {
+                    if (inflight !== ctrl) return;
+                    if (reset) grid.replaceChildren();
+                    (data.games || []).forEach((g) => grid.appendChild(cardFor(g)));
+                    if (reset && !(data.games || []).length) {
+                        const empty = document.createElement("p");
+                        empty.textContent = "No games match.";
+                        grid.appendChild(empty);
+                    }
+                    cursor = data.next || "";
+                })
+                .catch((err) => { if (err.name !== "AbortError") throw err; })
+                .finally(() => { if (inflight === ctrl) inflight = null; });
         }
 
-        function filterCards(q) {
-            if (!grid || cards.length === 0) return;
-            const s = (q || "").trim().toLowerCase();
-            cards.forEach((el) => {
-                const name = (el.dataset.name || "").toLowerCase();
-                el.style.display = s ? (name.includes(s) ? "" : "none") : "";
-            });
+        // Infinite scroll: fetch the next page when the sentinel comes into view
+        if (more && "IntersectionObserver" in window) {
+            const io = new IntersectionObserver((entries) => {
+                if (entries.some((e) => e.isIntersecting)) loadPage(false);
+            }, { rootMargin: "600px 0px" });
+            io.observe(more);
         }
 
         // Debounce helper for search input
@@ -69,29 +97,59 @@
             };
         }
 
-        // Initialize from URL (?sort=minutes|name)
+        if (form) {
+            // Without JS the form just submits; with JS we swap the grid in place.
+            form.addEventListener("submit", (e) => {
+                e.preventDefault();
+                loadPage(true);
+            });
+        }
+
         if (sortSelect) {
-            const initialSort = params.get("sort") || sortSelect.value || "minutes";
-            sortSelect.value = initialSort;
-            sortCards(initialSort)
             sortSelect.addEventListener("change", (e) => {
-                const mode = e.target.value;
-                setParam("sort", mode);
-                sortCards(mode);
+                setParam("sort", e.target.value);
+                loadPage(true);
             });
         }
 
         if (searchInput) {
-            const initialQuery = params.get("q") || "";
-            if (initialQuery) {
-                searchInput.value = initialQuery;
-                filterCards(initialQuery);
-            }
             searchInput.addEventListener("input", debounce((e) => {
-                const q = e.target.value;
-                setParam("q", q);
-                filterCards(q);
-            }, 150));
+                setParam("q", e.target.value.trim());
+                loadPage(true);
+            }, 250));
+        }
+
+        // ---------- Game page sections ----------
+        // The detail page is a shell; each section is a cached HTML fragment
+        // (ETag/Last-Modified, so the browser revalidates with a cheap 304).
+        $$("[data-fragment]").forEach((el) => {
+            fetch(el.dataset.fragment, { credentials: "same-origin" })
+                .then((r) => (r.ok ? r.text() : Promise.reject(r.status)))
+                .then((html) => { el.innerHTML = html; })
+                .catch(() => { el.replaceChildren(); });
+        });
+
+        // ---------- Background sync status ----------
+        // Poll while a queued/running job exists, then reload to show the new
+        // library. A failed job shows its error instead (reloading would retry it).
+        const syncStatus = $("[data-sync-status]");
+        if (syncStatus && ["queued", "running"].includes(syncStatus.dataset.syncState)) {
+            const poll = () => {
+                fetch(syncStatus.dataset.syncStatus, { credentials: "same-origin" })
+                    .then((r) => r.json())
+                    .then((data) => {
+                        if (data.status === "queued" || data.status === "running") {
+                            setTimeout(poll, 2000);
+                        } else if (data.status === "done") {
+                            location.reload();
+                        } else {
+                            syncStatus.dataset.syncState = data.status || "";
+                            syncStatus.textContent = `| Last sync failed${data.error ? `: ${data.error}` : ""}`;
+                        }
+                    })
+                    .catch(() => setTimeout(poll, 5000));
+            };
+            setTimeout(poll, 2000);
         }
 
         // ---------- Sync Now button UX ----------
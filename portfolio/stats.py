@@ -0,0 +1,136 @@
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .models import GameMeta, ProfileStats, UserGame
+
+# Portfolio header totals. sync_library adjusts them from each sync's diff
+# inside the same transaction; rebuild() recomputes from UserGame when there's
+# no row yet or on a full sync. Genre minutes use the GameMeta genres known at
+# sync time; when store_meta.refresh changes an app's genres, apply_genres()
+# moves that app's minutes for every owner.
+TOP_GENRES = 5
+BATCH_SIZE = 500
+
+def _genres_for(appids) -> dict:
+    appids = list(appids)
+    genres = {}
+    for i in range(0, len(appids), BATCH_SIZE):
+        genres.update(GameMeta.objects
+                      .filter(game_id__in=appids[i:i + BATCH_SIZE])
+                      .values_list("game_id", "genres"))
+    return genres
+
+def rebuild(profile) -> ProfileStats:
+    qs = UserGame.objects.filter(profile=profile)
+    agg = qs.aggregate(
+        games_total=Count("id"),
+        games_played=Count("id", filter=Q(playtime_forever__gt=0)),
+        minutes_total=Sum("playtime_forever"),
+        minutes_2weeks=Sum("playtime_2weeks"),
+    )
+    genre_minutes = {}
+    for genres, minutes in (qs.filter(playtime_forever__gt=0, game__meta__isnull=False)
+                            .values_list("game__meta__genres", "playtime_forever")):
+        for g in genres or []:
+            genre_minutes[g] = genre_minutes.get(g, 0) + minutes
+
+    stats = ProfileStats(
+        profile=profile,
+        games_total=agg["games_total"] or 0,
+        games_played=agg["games_played"] or 0,
+        minutes_total=agg["minutes_total"] or 0,
+        minutes_2weeks=agg["minutes_2weeks"] or 0,
+        genre_minutes=genre_minutes,
+    )
+    ProfileStats.objects.bulk_create(
+        [stats], update_conflicts=True, unique_fields=["profile"],
+        update_fields=["games_total", "games_played", "minutes_total", "minutes_2weeks",
+                       "genre_minutes", "updated_at"],
+    )
+    return stats
+
+def apply_diff(profile, diff: dict) -> ProfileStats:
+    """
+    Adjust the totals by what a sync changed. Cost is O(changed games).
+    """
+    stats = ProfileStats.objects.select_for_update().filter(profile=profile).first()
+    if stats is None:
+        return rebuild(profile)
+
+    # (appid, old playtime tuple or None, new playtime tuple or None)
+    moves = ([(appid, None, new) for appid, new in diff["inserted"]]
+             + [(appid, old, new) for appid, old, new in diff["changed"]]
+             + [(appid, old, None) for appid, old in diff["removed"]])
+    if not moves:
+        return stats
+
+    genres = _genres_for(appid for appid, _, _ in moves)
+    genre_minutes = dict(stats.genre_minutes)
+    for appid, old, new in moves:
+        old_forever, old_2w = (old[0], old[1]) if old else (0, 0)
+        new_forever, new_2w = (new[0], new[1]) if new else (0, 0)
+
+        stats.games_total += (new is not None) - (old is not None)
+        stats.games_played += (new_forever > 0) - (old_forever > 0)
+        stats.minutes_total += new_forever - old_forever
+        stats.minutes_2weeks += new_2w - old_2w
+        for g in genres.get(appid) or []:
+            genre_minutes[g] = genre_minutes.get(g, 0) + new_forever - old_forever
+
+    stats.genre_minutes = {g: m for g, m in genre_minutes.items() if m > 0}
+    stats.save()
+    return stats
+
+def apply_genres(appid: int, old_genres, new_genres) -> int:
+    """
+    Move the app's minutes from its old genres to its new ones for every
+    owner that has played it. Cost is O(owners). Returns the rows updated.
+    Call inside a transaction holding the app's GameMeta row lock (see
+    store_meta.refresh). Minutes are read after the owners' stats rows are
+    locked, so a concurrent sync's apply_diff is either fully before or after.
+    """
+    old_genres, new_genres = list(old_genres or []), list(new_genres or [])
+    if old_genres == new_genres:
+        return 0
+    profile_ids = sorted(UserGame.objects.filter(game_id=appid).values_list("profile_id", flat=True))
+    updated = 0
+    for i in range(0, len(profile_ids), BATCH_SIZE):
+        # Profile order, so concurrent refreshes lock rows in the same order
+        chunk = profile_ids[i:i + BATCH_SIZE]
+        rows = list(ProfileStats.objects.select_for_update().filter(profile_id__in=chunk).order_by("profile_id"))
+        minutes = dict(UserGame.objects.filter(game_id=appid, profile_id__in=chunk, playtime_forever__gt=0)
+                       .values_list("profile_id", "playtime_forever"))
+        rows = [stats for stats in rows if stats.profile_id in minutes]
+        now = timezone.now()
+        for stats in rows:
+            genre_minutes = dict(stats.genre_minutes)
+            m = minutes[stats.profile_id]
+            for g in old_genres:
+                genre_minutes[g] = genre_minutes.get(g, 0) - m
+            for g in new_genres:
+                genre_minutes[g] = genre_minutes.get(g, 0) + m
+            stats.genre_minutes = {g: v for g, v in genre_minutes.items() if v > 0}
+            stats.updated_at = now
+        ProfileStats.objects.bulk_update(rows, ["genre_minutes", "updated_at"])
+        updated += len(rows)
+    return updated
+
+def top_genres(stats, n: int = TOP_GENRES) -> list:
+    """
+    [(genre, minutes)] with the most playtime first.
+    """
+    return sorted((stats.genre_minutes or {}).items(), key=lambda kv: -kv[1])[:n]
+
+def stats_dict(stats) -> dict:
+    if stats is None:
+        return {"games_total": 0, "games_played": 0, "games_unplayed": 0,
+                "minutes_total": 0, "minutes_2weeks": 0, "top_genres": []}
+    return {
+        "games_total": stats.games_total,
+        "games_played": stats.games_played,
+        "games_unplayed": stats.games_total - stats.games_played,
+        "minutes_total": stats.minutes_total,
+        "minutes_2weeks": stats.minutes_2weeks,
+        "top_genres": [{"genre": g, "minutes": m} for g, m in top_genres(stats)],
+        "updated_at": stats.updated_at.isoformat(),
+    }
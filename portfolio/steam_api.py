@@ -1,22 +1,37 @@
-import os, requests
+import codecs, contextvars, json, os, re, requests, time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait
+from django.conf import settings
 
-API = "https://api.steampowered.com"
+from .steam_client import get_client
 
-def _get(path, **params):
+def _deadline(timeout):
+    # An explicit per-call timeout (budgeted fan-out calls) bounds the whole
+    # call, retries and backoff included, not just each attempt
+    return time.monotonic() + timeout if timeout else None
+
+def _get(path, timeout=None, key_required=True, **params):
     # Read the key per call so .env changes are picked up without full restart
     key = os.getenv("STEAM_WEB_API_KEY")
-    if not key:
+    if key:
+        params = {"key": key, **params}
+    elif key_required:
         raise RuntimeError("STEAM_WEB_API_KEY is not set.")
-    
-    params = {"key": key, **params}
 
-    r = requests.get(f"{API}/{path}", params=params, timeout=25)
+    r = get_client().get(f"{settings.STEAM_API_BASE}/{path}", params=params, timeout=timeout,
+                         deadline=_deadline(timeout))
     try:
         r.raise_for_status()
     except requests.HTTPError as e:
         raise RuntimeError(f"Steam API error {r.status_code} on {r.url}\nBody: {r.text}") from e
     return r.json()
 
+def http_stats() -> dict:
+    """
+    Call/retry/error/latency counters of the shared Steam HTTP client.
+    """
+    return get_client().stats()
+
 # --- Players / Accounts ---
 
 def get_player_summaries(steamids):
@@ -45,12 +60,14 @@ def get_friend_steamids(steamid):
 
 # --- Library / Stats ---
 
-def get_owned_games(steamid):
+def get_owned_games(steamid, timeout=None):
     """
     Normalized owned-games response: always return the inner 'response' dict if present.
     Include unplayed titles and app info for names/images.
+    Loads the whole body; sync and friend scans use iter_owned_games instead.
     """
     data = _get("IPlayerService/GetOwnedGames/v1",
+                timeout=timeout,
                 steamid=steamid, 
                 include_appinfo=1, 
                 include_played_free_games=1,
@@ -59,18 +76,190 @@ def get_owned_games(steamid):
             )
     return data.get("response", data)
 
-def get_number_of_current_players(appid: int) -> int:
+# Compact per-game record; everything else in the response (icon hashes,
+# per-platform playtimes, ...) is dropped while parsing.
+OwnedGame = namedtuple("OwnedGame", "appid name playtime_forever playtime_2weeks rtime_last_played")
+
+_GAMES_ARRAY = re.compile(r'"games"\s*:\s*\[')
+_decoder = json.JSONDecoder()
+
+class OwnedGames:
+    """
+    Streamed GetOwnedGames. Iterating yields OwnedGame records as the body
+    arrives, one game object in memory at a time. `complete` is True once the
+    "games" array has been read to its end (a private library has none).
+    Iterate once; breaking out early closes the connection.
+    """
+    CHUNK = 16 * 1024
+
+    def __init__(self, steamid, timeout=None, appinfo=True):
+        self.steamid = steamid
+        self.timeout = timeout
+        self.appinfo = appinfo
+        self.complete = False
+
+    def _response(self):
+        key = os.getenv("STEAM_WEB_API_KEY")
+        if not key:
+            raise RuntimeError("STEAM_WEB_API_KEY is not set.")
+        params = {"key": key, "steamid": self.steamid, "include_appinfo": int(self.appinfo),
+                  "include_played_free_games": 1, "include_unplayed": 1, "skip_unvetted_apps": 0}
+        r = get_client().get(f"{settings.STEAM_API_BASE}/IPlayerService/GetOwnedGames/v1",
+                             params=params, timeout=self.timeout, stream=True,
+                             deadline=_deadline(self.timeout))
+        if r.status_code >= 400:
+            r.close()
+            raise RuntimeError(f"Steam API error {r.status_code} on GetOwnedGames for {self.steamid}")
+        return r
+
+    def __iter__(self):
+        r = self._response()
+        try:
+            self.complete = yield from _iter_array(r.iter_content(self.CHUNK), _GAMES_ARRAY, _owned_game)
+        finally:
+            r.close()
+
+def _owned_game(g: dict):
+    appid = g.get("appid")
+    if not appid:
+        return None
+    return OwnedGame(
+        int(appid),
+        g.get("name") or "Unknown",
+        int(g.get("playtime_forever", 0) or 0),
+        int(g.get("playtime_2weeks", 0) or 0),
+        int(g.get("rtime_last_played", 0) or 0),
+    )
+
+def _iter_array(chunks, opening, convert):
+    """
+    Yield convert(element) for the elements of the first JSON array matched by
+    `opening` (a regex ending at its "["), decoding one element at a time from
+    byte chunks. Returns True if the array was read to its end, False if the
+    body had no such array; raises if the body ends inside it.
+    """
+    text = codecs.getincrementaldecoder("utf-8")()
+    buf, pos, in_array = "", 0, False
+    for chunk in chunks:
+        buf = buf[pos:] + text.decode(chunk)
+        pos = 0
+        if not in_array:
+            m = opening.search(buf)
+            if m is None:
+                # Keep a tail in case the key is split across chunks
+                pos = max(0, len(buf) - 32)
+                continue
+            in_array, pos = True, m.end()
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(buf):
+                break
+            if buf[pos] == "]":
+                return True
+            try:
+                obj, pos = _decoder.raw_decode(buf, pos)
+            except ValueError:
+                break    # element continues in the next chunk
+            item = convert(obj)
+            if item is not None:
+                yield item
+    if in_array:
+        raise RuntimeError("GetOwnedGames response ended inside the games array")
+    return False
+
+def iter_owned_games(steamid, timeout=None, appinfo=True) -> OwnedGames:
+    """
+    Stream a user's library as OwnedGame records. appinfo=False skips names
+    (much smaller responses when only appids are needed).
+    """
+    return OwnedGames(steamid, timeout=timeout, appinfo=appinfo)
+
+def owned_appids(steamid, timeout=None):
+    """
+    The user's appids as a set, or None when the library isn't visible.
+    """
+    games = iter_owned_games(steamid, timeout=timeout, appinfo=False)
+    appids = {g.appid for g in games}
+    return appids if games.complete else None
+
+def owns_game(steamid, appid: int, timeout=None):
+    """
+    True/False whether the user owns appid; None when the library isn't
+    visible. Stops reading the response as soon as the appid shows up.
+    """
+    games = iter_owned_games(steamid, timeout=timeout, appinfo=False)
+    if any(g.appid == appid for g in games):
+        return True
+    return False if games.complete else None
+
+def get_owned_appids_many(steamids, max_workers=8, call_timeout=10, budget=8.0):
+    """
+    owned_appids for several users concurrently (e.g. a friend list).
+    At most `max_workers` calls are in flight, each limited to `call_timeout`
+    seconds, and the whole batch to `budget` seconds.
+    Returns (results, failed): results maps steamid -> set of appids (None for
+    a private library) for every call that finished in time; failed lists the
+    steamids that errored or were still pending when the budget ran out.
+    """
+    return fan_out(lambda sid: owned_appids(sid, timeout=call_timeout),
+                   steamids, max_workers=max_workers, budget=budget)
+
+def fan_out(fn, keys, max_workers=8, budget=8.0):
+    """
+    Run fn(key) for each key in a bounded thread pool and return whatever
+    finished within `budget` seconds as (results, failed). Stragglers are
+    abandoned rather than waited for.
+    """
+    keys = list(dict.fromkeys(keys))
+    if not keys:
+        return {}, []
+
+    pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="steam")
+    # Each call runs in a copy of the caller's context so per-request timings see it.
+    futures = {pool.submit(contextvars.copy_context().run, fn, k): k for k in keys}
+    done, _ = wait(futures, timeout=budget)
+    # Don't block on stragglers: queued calls are cancelled, in-flight ones
+    # finish in the background and are bounded by their own timeout.
+    pool.shutdown(wait=False, cancel_futures=True)
+
+    results, failed = {}, []
+    for f, k in futures.items():
+        if f in done and f.exception() is None:
+            results[k] = f.result()
+        else:
+            failed.append(k)
+    return results, failed
+
+# --- Achievements ---
+
+def get_schema_for_game(appid: int, timeout=None):
+    """
+    Achievement definitions for an app (apiname, names, icons).
+    Returns [] for apps without achievements.
+    """
+    data = _get("ISteamUserStats/GetSchemaForGame/v2", timeout=timeout, appid=appid)
+    stats = (data.get("game") or {}).get("availableGameStats") or {}
+    return stats.get("achievements", []) or []
+
+def get_player_achievements(steamid, appid: int, timeout=None):
+    """
+    The player's achievement states for an app: [{"apiname", "achieved", "unlocktime"}].
+    Steam answers 400/403 for apps without stats or private profiles; that raises.
+    """
+    data = _get("ISteamUserStats/GetPlayerAchievements/v1", timeout=timeout, steamid=steamid, appid=appid)
+    return (data.get("playerstats") or {}).get("achievements", []) or []
+
+def get_number_of_current_players(appid: int, timeout=20):
     """
     Concurrent players right now for the given appid (may be 0 for niche or older apps).
+    Returns None when Steam has no count for the app; raises on HTTP/network errors
+    so callers can tell "0 players" from "couldn't ask".
     """
-    url = "https://api.steampowered.com/ISteamUserStats/GetNumberOfCurrentPlayers/v1"
-    try:
-        r = requests.get(url, params={"appid": appid}, timeout=20)
-        r.raise_for_status()
-        data = r.json()
-        return int(data.get("response", {}).get("player_count", 0) or 0)
-    except Exception:
-        return 0
+    data = _get("ISteamUserStats/GetNumberOfCurrentPlayers/v1",
+                timeout=timeout, key_required=False, appid=appid)
+    count = data.get("response", {}).get("player_count")
+    return int(count) if count is not None else None
     
 # --- Storefront Metadata (no API key required) ---
 
@@ -79,8 +268,8 @@ def get_store_appdetails(appid: int, cc="us", lang="en"):
     Unofficial Storefront API. Return rich app metadata:
     name, genres, short_description, website, screenshots, etc.
     """
-    url = "https://store.steampowered.com/api/appdetails"
-    r = requests.get(url, params={"appids": appid, "cc": cc, "l": lang}, timeout=25)
+    url = f"{settings.STEAM_STORE_BASE}/api/appdetails"
+    r = get_client().get(url, params={"appids": appid, "cc": cc, "l": lang})
     r.raise_for_status()
     payload = r.json()
     entry = payload.get(str(appid))
@@ -0,0 +1,187 @@
+import random, re, threading, time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+from . import perf
+
+# Responses worth retrying: rate limited or a transient server-side failure.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Numeric path segments (CDN /steam/apps/<appid>/...) are folded in the
+# per-endpoint stats, which would otherwise grow by one entry per app
+_ID_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+class TokenBucket:
+    """
+    Classic token bucket: `rate` tokens per second, up to `burst` saved up.
+    acquire() blocks until a token is available.
+    """
+    def __init__(self, rate: float, burst: int):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take one token; returns the seconds spent waiting."""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+class SteamClient:
+    """
+    One shared HTTP client for every Steam call: a keep-alive connection pool,
+    retries with exponential backoff + full jitter on 429/5xx and connection
+    errors (honouring Retry-After), a token bucket per host, and counters.
+    """
+    def __init__(self, timeout=25, connect_timeout=5, max_retries=3,
+                 backoff=0.5, backoff_max=8.0, rates=None, pool_size=20):
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        # host -> (requests per second, burst)
+        self.rates = dict(rates or {})
+        self.buckets = {}
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    # --- rate limiting ---
+
+    def _bucket(self, host):
+        with self._lock:
+            b = self.buckets.get(host)
+            if b is None and host in self.rates:
+                b = self.buckets[host] = TokenBucket(*self.rates[host])
+            return b
+
+    # --- requests ---
+
+    def get(self, url, params=None, timeout=None, stream=False, max_retries=None, deadline=None) -> requests.Response:
+        """
+        GET with retries. Returns the last response (the caller decides what a
+        non-2xx means) or raises the last connection/timeout error.
+        `max_retries` overrides the client's for this call. `deadline` (a
+        time.monotonic() value) bounds the whole call, backoff included: each
+        attempt's read timeout is cut to the time left and a retry that would
+        start after it isn't made.
+        """
+        parts = urlsplit(url)
+        host, path = parts.netloc, _ID_SEGMENT.sub("/{id}", parts.path)
+        retries = self.max_retries if max_retries is None else max_retries
+        bucket = self._bucket(host)
+
+        attempt = 0
+        while True:
+            if bucket:
+                waited = bucket.acquire()
+                if waited:
+                    self._count(host, "throttled_ms", waited * 1000)
+
+            read_timeout = timeout or self.timeout
+            if deadline is not None:
+                read_timeout = max(0.05, min(read_timeout, deadline - time.monotonic()))
+            t0 = time.monotonic()
+            try:
+                r = self.session.get(url, params=params, stream=stream,
+                                     timeout=(min(self.connect_timeout, read_timeout), read_timeout))
+                error = None
+            except (requests.ConnectionError, requests.Timeout) as e:
+                r, error = None, e
+            self._record(host, path, (time.monotonic() - t0) * 1000, r)
+
+            retryable = error is not None or r.status_code in RETRY_STATUSES
+            if retryable and attempt < retries:
+                delay = random.uniform(0, min(self.backoff_max, self.backoff * 2 ** (attempt + 1)))
+                retry_after = r.headers.get("Retry-After") if r is not None else None
+                if retry_after and retry_after.isdigit():
+                    delay = max(delay, min(float(retry_after), self.backoff_max))
+                if deadline is None or time.monotonic() + delay < deadline:
+                    attempt += 1
+                    self._count(host, "retries")
+                    if r is not None:
+                        r.close()
+                    time.sleep(delay)
+                    continue
+            if error is not None:
+                raise error
+            return r
+
+    # --- counters ---
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {"hosts": {}, "endpoints": {}}
+
+    def stats(self) -> dict:
+        """
+        Snapshot: per host {calls, retries, errors, throttled_ms, total_ms, max_ms}
+        and per endpoint path {calls, errors, total_ms, max_ms}.
+        """
+        with self._lock:
+            return {k: {name: dict(v) for name, v in d.items()} for k, d in self._stats.items()}
+
+    def _count(self, host, field, n=1):
+        with self._lock:
+            h = self._stats["hosts"].setdefault(host, _empty_host())
+            h[field] += n
+
+    def _record(self, host, path, ms, response):
+        perf.record_http(path, ms)
+        failed = response is None or response.status_code >= 400
+        with self._lock:
+            for bucket in (self._stats["hosts"].setdefault(host, _empty_host()),
+                           self._stats["endpoints"].setdefault(path, _empty_endpoint())):
+                bucket["calls"] += 1
+                bucket["errors"] += int(failed)
+                bucket["total_ms"] += ms
+                bucket["max_ms"] = max(bucket["max_ms"], ms)
+
+def _empty_endpoint():
+    return {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0}
+
+def _empty_host():
+    return {**_empty_endpoint(), "retries": 0, "throttled_ms": 0.0}
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_client() -> SteamClient:
+    """
+    Process-wide client configured from settings (see STEAM_HTTP_* in settings.py).
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = SteamClient(
+                    timeout=settings.STEAM_HTTP_TIMEOUT,
+                    connect_timeout=settings.STEAM_HTTP_CONNECT_TIMEOUT,
+                    max_retries=settings.STEAM_HTTP_RETRIES,
+                    backoff=settings.STEAM_HTTP_BACKOFF,
+                    pool_size=settings.STEAM_HTTP_POOL_SIZE,
+                    rates={
+                        urlsplit(settings.STEAM_API_BASE).netloc: settings.STEAM_API_RATE,
+                        urlsplit(settings.STEAM_STORE_BASE).netloc: settings.STEAM_STORE_RATE,
+                    },
+                )
+    return _client
@@ -0,0 +1,60 @@
+from datetime import timedelta
+
+from django.db import transaction
+from django.utils import timezone
+
+from .background import submit_once
+from .models import GameMeta
+from . import stats, steam_api
+
+# Store metadata barely changes; refresh a row once it's older than this.
+# Detail pages never wait on the store: stale/missing rows refresh in the background.
+STALE_AFTER = timedelta(days=3)
+
+def is_stale(meta) -> bool:
+    return meta is None or meta.fetched_at < timezone.now() - STALE_AFTER
+
+def get_meta(appid: int):
+    """
+    Stored metadata for the app, or None. No network.
+    """
+    return GameMeta.objects.filter(game_id=appid).first()
+
+def refresh(appid: int) -> GameMeta:
+    """
+    Fetch appdetails from the store and upsert the row. When the genres
+    changed (or the row is new), owners' ProfileStats genre minutes follow.
+    Raises on network/HTTP errors so callers can retry later.
+    """
+    data = steam_api.get_store_appdetails(appid)
+    now = timezone.now()
+    meta = GameMeta(
+        game_id=appid,
+        found=bool(data),
+        genres=[g["description"] for g in (data.get("genres") or []) if "description" in g],
+        short_description=data.get("short_description") or "",
+        website=(data.get("website") or "")[:500],
+        release_date=((data.get("release_date") or {}).get("date") or "")[:50],
+        fetched_at=now,
+    )
+    with transaction.atomic():
+        # Make sure the row exists, then lock it: two refreshes of the same app
+        # (prefetch command, several web processes) mustn't both see the old
+        # genres and apply the change twice.
+        GameMeta.objects.bulk_create([GameMeta(game_id=appid, found=False, fetched_at=now)],
+                                     ignore_conflicts=True)
+        old_genres = (GameMeta.objects.select_for_update().filter(game_id=appid)
+                      .values_list("genres", flat=True).get())
+        GameMeta.objects.bulk_create(
+            [meta], update_conflicts=True, unique_fields=["game"],
+            update_fields=["found", "genres", "short_description", "website", "release_date", "fetched_at"],
+        )
+        stats.apply_genres(appid, old_genres, meta.genres)
+    return meta
+
+def refresh_in_background(appid: int) -> None:
+    """
+    Queue a refresh unless one for this appid is already pending.
+    A store hiccup is retried by the next page view (or the prefetch command).
+    """
+    submit_once(("store_meta", appid), refresh, appid)
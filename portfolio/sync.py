@@ -1,53 +1,231 @@
+import hashlib, logging, zlib
+from array import array
+
+from django.db import transaction
 from django.utils import timezone
-from .models import Profile, Game, UserGame
+from .models import Profile, Game, UserGame, LibraryFingerprint
 from . import steam_api
+from .history import record_playtime
+from . import ownership, perf, stats
+from .achievements import sync_achievements, played_appids, next_pending
+
+logger = logging.getLogger(__name__)
+
+# Rows per bulk statement. Keeps us well under SQLite's bound-parameter limit.
+BATCH_SIZE = 500
 
-def sync_library(profile_id: int) -> None:
+PLAYTIME_FIELDS = ("playtime_forever", "playtime_2weeks", "rtime_last_played")
+
+def sync_library(profile_id: int, full: bool = False, achievements: bool = True,
+                 profile_basics: bool = True) -> dict:
     """
     Fetch the user's Steam profile + owned games and store them.
     Called on first login and when "Sync now" is clicked.
+
+    Incremental by default: if the library is identical to the last sync the
+    DB isn't touched beyond last_synced; otherwise only new/changed rows are
+    written and titles that left the library are pruned. `full=True` diffs
+    against the UserGame table instead of the stored fingerprint.
+    Achievements are then refreshed for the games played since the last sync
+    and for apps earlier syncs couldn't finish (Profile.achievements_pending).
+
+    Returns counts: {"inserted", "updated", "unchanged", "removed", "skipped"}
+    plus "achievements" when any were synced.
     """
     p = Profile.objects.get(id=profile_id)
-    
-    # 1) Profile basics (persona, avatar, level)
-    try:
-        s = steam_api.get_player_summaries(p.steamid64)
-        if s:
-            p.persona = s.get("personaname") or p.persona
-            p.avatar = s.get("avatarfull") or p.avatar
+
+    # 1) Profile basics (persona, avatar, level). The fleet resync batches
+    # summaries for many profiles itself and passes profile_basics=False.
+    if profile_basics:
         try:
-            p.level = steam_api.get_steam_level(p.steamid64) or p.level
+            s = (steam_api.get_player_summaries(p.steamid64) or [None])[0]
+            if s:
+                apply_summary(p, s)
+            try:
+                p.level = steam_api.get_steam_level(p.steamid64) or p.level
+            except Exception:
+                pass
         except Exception:
             pass
-    except Exception:
-        pass
 
-    # 2) Owned games + minutes
-    resp = steam_api.get_owned_games(p.steamid64)
-    games = resp.get("games", []) or []
+    # 2) Owned games + minutes, parsed game by game as the response streams in
+    stream = steam_api.iter_owned_games(p.steamid64)
+    owned = _normalize_games(stream)
+
+    # A private/hidden library comes back without a "games" key at all;
+    # don't treat that as "the user sold everything".
+    complete = stream.complete
+    digest = _library_digest(owned)
+    fp = None if full else LibraryFingerprint.objects.filter(profile=p).first()
+    diff = None
+
+    with perf.span("sync_db"), transaction.atomic():
+        if fp is not None and complete and fp.digest == digest:
+            # Nothing changed since the last sync: skip the diff entirely.
+            counts = {"inserted": 0, "updated": 0, "unchanged": len(owned), "removed": 0, "skipped": True}
+        else:
+            previous = _unpack_fingerprint(fp.data) if fp is not None else _previous_from_db(p)
+            counts, diff = _apply_library(p, owned, previous, prune=complete)
+            # Lifetime playtime only counts as played today when there was a
+            # library to compare with (not on the first sync that sees one,
+            # e.g. a library that was private until now)
+            had_library = bool(previous) or (fp is not None if not full else
+                                             LibraryFingerprint.objects.filter(profile=p).exists())
+            record_playtime(p, diff, baseline=not had_library)
+            ownership.apply_diff(p, diff)
+            if full:
+                stats.rebuild(p)
+            else:
+                stats.apply_diff(p, diff)
+            if complete:
+                LibraryFingerprint.objects.bulk_create(
+                    [LibraryFingerprint(profile=p, digest=digest, data=_pack_fingerprint(owned))],
+                    update_conflicts=True, unique_fields=["profile"], update_fields=["digest", "data", "updated_at"],
+                )
+
+        # 3) Mark last sync time
+        p.last_synced = timezone.now()
+        p.save()
+
+    # 4) Achievements for games played since the last sync, and apps earlier
+    # syncs didn't finish (outside the library transaction: these are HTTP calls)
+    if achievements:
+        appids = list(dict.fromkeys((played_appids(diff) if diff else [])
+                                    + [int(appid) for appid in p.achievements_pending]))
+        if appids:
+            try:
+                with perf.span("sync_achievements"):
+                    counts["achievements"] = sync_achievements(p, appids)
+                missed = counts["achievements"].pop("pending")
+            except Exception as e:
+                logger.exception("Achievement sync failed for profile %s", p.id)
+                counts["achievements"] = {"error": f"{type(e).__name__}: {e}"}
+                missed = appids
+            pending = next_pending(p.achievements_pending, missed)
+            counts["achievements"]["pending"] = len(pending)
+            if pending != p.achievements_pending:
+                p.achievements_pending = pending
+                Profile.objects.filter(id=p.id).update(achievements_pending=pending)
+
+    return counts
+
+def apply_summary(p: Profile, summary: dict) -> None:
+    """
+    Copy persona/avatar from a GetPlayerSummaries entry onto the profile (unsaved).
+    """
+    p.persona = summary.get("personaname") or p.persona
+    p.avatar = summary.get("avatarfull") or p.avatar
+
+def _normalize_games(games) -> dict:
+    """
+    Map appid -> (name, playtime_forever, playtime_2weeks, rtime_last_played)
+    from OwnedGame records.
+    """
+    return {g.appid: (g.name, g.playtime_forever, g.playtime_2weeks, g.rtime_last_played) for g in games}
+
+# --- Fingerprints ---
+# Per appid we keep (playtime_forever, playtime_2weeks, rtime_last_played,
+# crc32(name)) packed as unsigned ints: 20 bytes a game.
+
+def _name_crc(name: str) -> int:
+    return zlib.crc32(name.encode("utf-8"))
+
+def _library_digest(owned: dict) -> str:
+    h = hashlib.sha1()
+    for appid in sorted(owned):
+        name, pf, p2w, rtime = owned[appid]
+        h.update(f"{appid}:{name}:{pf}:{p2w}:{rtime};".encode("utf-8"))
+    return h.hexdigest()
+
+def _pack_fingerprint(owned: dict) -> bytes:
+    a = array("I")
+    for appid, (name, pf, p2w, rtime) in owned.items():
+        a.extend((appid, pf, p2w, rtime, _name_crc(name)))
+    return a.tobytes()
 
-    for g in games:
-        appid = g.get("appid")
-        if not appid:
+def _unpack_fingerprint(data) -> dict:
+    a = array("I")
+    a.frombytes(bytes(data))
+    return {a[i]: tuple(a[i + 1:i + 5]) for i in range(0, len(a), 5)}
+
+def _previous_from_db(p: Profile) -> dict:
+    # First incremental sync (or full=True): rebuild the fingerprint from what we store.
+    return {
+        appid: (pf, p2w, rtime, _name_crc(name))
+        for appid, name, pf, p2w, rtime in (
+            UserGame.objects.filter(profile=p)
+            .values_list("game_id", "game__name", *PLAYTIME_FIELDS)
+        )
+    }
+
+def _apply_library(p: Profile, owned: dict, previous: dict, prune: bool = True) -> tuple:
+    """
+    Diff the owned-games map against the previous sync and write only the
+    difference, in batches. The number of queries depends on the number of
+    *changed* rows / BATCH_SIZE, not on the library size.
+
+    Returns (counts, diff) where diff lists what moved, as playtime tuples:
+        {"inserted": [(appid, new)], "changed": [(appid, old, new)], "removed": [(appid, old)]}
+    """
+    named_games, unknown_games, new_rows, changed_rows = [], [], [], []
+    diff = {"inserted": [], "changed": [], "removed": []}
+    unchanged = 0
+
+    for appid, (name, *times) in owned.items():
+        times = tuple(times)
+        old = previous.get(appid)
+        ug = UserGame(profile=p, game_id=appid, **dict(zip(PLAYTIME_FIELDS, times)))
+
+        if old is None:
+            # Game may exist already (another user owns it): upsert a real name,
+            # but never overwrite one with "Unknown".
+            if name == "Unknown":
+                unknown_games.append(Game(appid=appid, name=name))
+            else:
+                named_games.append(Game(appid=appid, name=name))
+            new_rows.append(ug)
+            diff["inserted"].append((appid, times))
             continue
-        appid = int(appid)
-        name = g.get("name") or "Unknown"
-
-        game, _ = Game.objects.get_or_create(appid=appid, defaults={"name": name})
-
-        if name != "Unknown" and game.name != name:
-            game.name = name
-            game.save(update_fields=["name"])
-            
-        UserGame.objects.update_or_create(
-            profile=p, game=game,
-            defaults={
-                "playtime_forever": g.get("playtime_forever", 0),
-                "playtime_2weeks": g.get("playtime_2weeks", 0),
-                "rtime_last_played": g.get("rtime_last_played", 0),
-            },
+
+        if name != "Unknown" and _name_crc(name) != old[3]:
+            named_games.append(Game(appid=appid, name=name))
+        if times != old[:3]:
+            changed_rows.append(ug)
+            diff["changed"].append((appid, old[:3], times))
+        else:
+            unchanged += 1
+
+    # Game rows are shared between profiles: write them in appid order so
+    # concurrent syncs take row locks in the same order (no deadlocks on Postgres).
+    named_games.sort(key=lambda g: g.appid)
+    unknown_games.sort(key=lambda g: g.appid)
+    if named_games:
+        Game.objects.bulk_create(
+            named_games, batch_size=BATCH_SIZE,
+            update_conflicts=True, unique_fields=["appid"], update_fields=["name"],
         )
+    if unknown_games:
+        Game.objects.bulk_create(unknown_games, batch_size=BATCH_SIZE, ignore_conflicts=True)
+    if new_rows or changed_rows:
+        # INSERT ... ON CONFLICT (profile, game) DO UPDATE: one statement per
+        # batch for both new and changed rows (much cheaper than bulk_update's CASE).
+        UserGame.objects.bulk_create(
+            new_rows + changed_rows, batch_size=BATCH_SIZE,
+            update_conflicts=True, unique_fields=["profile", "game"], update_fields=PLAYTIME_FIELDS,
+        )
+
+    removed = 0
+    if prune:
+        gone = [appid for appid in previous if appid not in owned]
+        diff["removed"] = [(appid, previous[appid][:3]) for appid in gone]
+        for i in range(0, len(gone), BATCH_SIZE):
+            removed += UserGame.objects.filter(profile=p, game_id__in=gone[i:i + BATCH_SIZE]).delete()[0]
 
-    # 3) Mark last sync time
-    p.last_synced = timezone.now()
-    p.save()
\ No newline at end of file
+    counts = {
+        "inserted": len(new_rows),
+        "updated": len(changed_rows),
+        "unchanged": unchanged,
+        "removed": removed,
+        "skipped": False,
+    }
+    return counts, diff
@@ -1,6 +1,10 @@
 from django import template
+from django.urls import reverse
+from django.utils.html import format_html
 from datetime import datetime, timezone
 
+from portfolio import images
+
 register = template.Library()
 
 @register.filter
@@ -18,4 +22,49 @@ def epoch_to_date(epoch_seconds):
         dt = datetime.fromtimestamp(e, tz=timezone.utc).astimezone()
         return dt.strftime("%Y-%m-%d")
     except Exception:
-        return "-"
\ No newline at end of file
+        return "-"
+
+@register.simple_tag
+def sparkline(points, width=160, height=32):
+    """
+    Inline SVG polyline for [(time, value)] points, oldest first.
+    """
+    values = [v for _, v in points or []]
+    if len(values) < 2:
+        return ""
+    lo, hi = min(values), max(values)
+    span = (hi - lo) or 1
+    step = width / (len(values) - 1)
+    coords = " ".join(
+        f"{i * step:.1f},{height - 1 - (v - lo) / span * (height - 2):.1f}" for i, v in enumerate(values)
+    )
+    return format_html(
+        '<svg class="sparkline" width="{}" height="{}" viewBox="0 0 {} {}" aria-hidden="true">'
+        '<polyline fill="none" stroke="currentColor" stroke-width="1.5" points="{}"/></svg>',
+        width, height, width, height, coords,
+    )
+
+def header_url(appid, width, fmt):
+    """
+    Local URL of a game's header variant. Versioned by content hash once the
+    original is on disk, which makes it cacheable forever.
+    """
+    url = reverse("header_image", args=[appid, width, fmt])
+    version = images.known_version(appid)
+    return f"{url}?v={version[:12]}" if version else url
+
+@register.simple_tag
+def header_picture(appid, alt="", css_class="", sizes="320px"):
+    """
+    <picture> for a game's header from the local image cache: WebP and JPEG at
+    each of images.WIDTHS (only the original JPEG without Pillow).
+    """
+    if images.Image is None:
+        return format_html('<img src="{}" alt="{}" class="{}" loading="lazy">',
+                           header_url(appid, images.WIDTHS[-1], "jpg"), alt, css_class)
+    srcset = lambda fmt: ", ".join(f"{header_url(appid, w, fmt)} {w}w" for w in images.WIDTHS)
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" loading="lazy"></picture>',
+        srcset("webp"), sizes, header_url(appid, images.WIDTHS[0], "jpg"), srcset("jpg"), sizes, alt, css_class,
+    )
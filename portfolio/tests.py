@@ -1,3 +1,673 @@
-from django.test import TestCase
+import io, os, threading, time, zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import history, ownership, player_counts, stats, steam_api, steam_client, store_meta, transfer
+from .fake_steam import FakeSteam, appid_at
+from .library import SNAPSHOT_VERSION, SORTS, LibrarySnapshot, encode_cursor, query_library
+from .models import (Achievement, AppOwners, Game, LibraryFingerprint, PlayerCount, Profile, ProfileStats,
+                     UserAchievement, UserGame)
+from .steam_client import SteamClient, TokenBucket
+from .sync import (PLAYTIME_FIELDS, _pack_fingerprint, _previous_from_db, _unpack_fingerprint,
+                   sync_library)
+
+PLAYERS = "/ISteamUserStats/GetNumberOfCurrentPlayers/v1"
+
+
+class FakeSteamTestCase(SimpleTestCase):
+    """
+    One fake Steam server per test class; failures and counters reset per test.
+    """
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.fake = FakeSteam().start()
+        cls.addClassCleanup(cls.fake.stop)
+
+    def setUp(self):
+        self.fake.reset_counts()
+
+    def make_client(self, **kwargs):
+        return SteamClient(**{"backoff": 0.01, "backoff_max": 0.05, **kwargs})
+
+    def players_url(self):
+        return f"{self.fake.url}{PLAYERS}"
+
+
+class RetryTests(FakeSteamTestCase):
+    def test_retries_transient_errors(self):
+        self.fake.fail(PLAYERS, 503, times=2)
+        client = self.make_client(max_retries=3)
+        r = client.get(self.players_url(), params={"appid": 10})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(self.fake.counts()[PLAYERS], 3)
+        self.assertEqual(client.stats()["hosts"][client_host(self.fake)]["retries"], 2)
+
+    def test_gives_up_after_max_retries(self):
+        self.fake.fail(PLAYERS, 500, times=10)
+        r = self.make_client(max_retries=2).get(self.players_url(), params={"appid": 10})
+        self.assertEqual(r.status_code, 500)
+        self.assertEqual(self.fake.counts()[PLAYERS], 3)
+
+    def test_per_call_max_retries(self):
+        self.fake.fail(PLAYERS, 500, times=10)
+        r = self.make_client(max_retries=3).get(self.players_url(), params={"appid": 10}, max_retries=0)
+        self.assertEqual(r.status_code, 500)
+        self.assertEqual(self.fake.counts()[PLAYERS], 1)
+
+    def test_endpoint_stats_fold_ids(self):
+        client = self.make_client()
+        for appid in (10, 20, 30):
+            client.get(f"{self.fake.url}/steam/apps/{appid}/header.jpg")
+        self.assertEqual(list(client.stats()["endpoints"]), ["/steam/apps/{id}/header.jpg"])
+
+    def test_client_errors_are_not_retried(self):
+        self.fake.fail(PLAYERS, 403, times=10)
+        r = self.make_client(max_retries=3).get(self.players_url(), params={"appid": 10})
+        self.assertEqual(r.status_code, 403)
+        self.assertEqual(self.fake.counts()[PLAYERS], 1)
+
+    def test_connection_errors_are_retried_then_raised(self):
+        client = self.make_client(max_retries=2, connect_timeout=0.5)
+        # Nothing listens on port 9 (discard) here
+        with self.assertRaises(Exception):
+            client.get("http://127.0.0.1:9/x")
+        self.assertEqual(client.stats()["hosts"]["127.0.0.1:9"]["retries"], 2)
+
+
+class BackoffTests(FakeSteamTestCase):
+    def test_exponential_backoff_with_cap(self):
+        self.fake.fail(PLAYERS, 503, times=4)
+        client = self.make_client(max_retries=4, backoff=0.5, backoff_max=1.5)
+        delays = []
+        # Full jitter: pin it to the upper bound to see the schedule
+        with mock.patch("portfolio.steam_client.random.uniform", lambda lo, hi: hi), \
+                mock.patch("portfolio.steam_client.time.sleep", delays.append):
+            client.get(self.players_url(), params={"appid": 10})
+        self.assertEqual(delays, [1.0, 1.5, 1.5, 1.5])
+
+    def test_retry_after_is_honoured(self):
+        self.fake.fail(PLAYERS, 429, times=1, retry_after=3)
+        delays = []
+        with mock.patch("portfolio.steam_client.time.sleep", delays.append):
+            r = self.make_client(max_retries=1, backoff_max=5).get(self.players_url(), params={"appid": 10})
+        self.assertEqual(r.status_code, 200)
+        self.assertEqual(delays, [3.0])
+
+    def test_deadline_stops_retries(self):
+        # The first failure asks for a 1 s wait; the call only has 0.5 s
+        self.fake.fail(PLAYERS, 503, times=5, retry_after=1)
+        client = self.make_client(max_retries=3, backoff_max=2)
+        t0 = time.monotonic()
+        r = client.get(self.players_url(), params={"appid": 10}, deadline=time.monotonic() + 0.5)
+        self.assertEqual(r.status_code, 503)
+        self.assertEqual(self.fake.counts()[PLAYERS], 1)
+        self.assertLess(time.monotonic() - t0, 0.5)
+
+    def test_api_call_timeout_bounds_retries(self):
+        self.fake.fail(PLAYERS, 503, times=5, retry_after=1)
+        with override_settings(STEAM_API_BASE=self.fake.url, STEAM_HTTP_RETRIES=3, STEAM_HTTP_BACKOFF=0.01), \
+                mock.patch.dict(os.environ, {"STEAM_WEB_API_KEY": "test"}), \
+                mock.patch.object(steam_client, "_client", None):
+            t0 = time.monotonic()
+            with self.assertRaises(RuntimeError):
+                steam_api.get_number_of_current_players(10, timeout=0.5)
+            self.assertLess(time.monotonic() - t0, 0.5)
+        self.assertEqual(self.fake.counts()[PLAYERS], 1)
+
+
+class RateLimitTests(FakeSteamTestCase):
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=20, burst=2)
+        t0 = time.monotonic()
+        for _ in range(6):
+            bucket.acquire()
+        # 2 from the burst, then 4 at 20/s
+        self.assertGreaterEqual(time.monotonic() - t0, 0.19)
+
+    def test_client_throttles_per_host(self):
+        client = self.make_client(rates={client_host(self.fake): (20, 1)})
+        t0 = time.monotonic()
+        for _ in range(5):
+            client.get(self.players_url(), params={"appid": 10})
+        self.assertGreaterEqual(time.monotonic() - t0, 0.19)
+        self.assertGreater(client.stats()["hosts"][client_host(self.fake)]["throttled_ms"], 0)
+        self.assertEqual(self.fake.counts()[PLAYERS], 5)
+
+
+def library_row(appid, name, forever=0, two_weeks=0, last_played=0):
+    return {"game__appid": appid, "game__name": name, "playtime_forever": forever,
+            "playtime_2weeks": two_weeks, "rtime_last_played": last_played}
+
+
+class LibrarySnapshotTests(SimpleTestCase):
+    def round_trip(self, snap):
+        return LibrarySnapshot.from_bytes(snap.to_bytes())
+
+    def test_empty_library(self):
+        snap = self.round_trip(LibrarySnapshot.from_rows([]))
+        self.assertEqual((len(snap), list(snap), snap.names, snap.next_cursor), (0, [], [], None))
+
+    def test_rows_and_cursor_survive(self):
+        rows = [library_row(10, "Half-Life", 600, 30, 1_700_000_000),
+                library_row(20, "Ōkami HD", 120),
+                library_row(30, "Ōkami HD", 5, 5, 1_600_000_000),     # same name, stored once
+                library_row(40, "黒い砂漠 \U0001F3AE", 4_000_000_000)]
+        snap = self.round_trip(LibrarySnapshot.from_rows(rows, next_cursor="WzEyMCwyMF0"))
+        self.assertEqual([tuple(r) for r in snap], [
+            (10, "Half-Life", 600, 30, 1_700_000_000),
+            (20, "Ōkami HD", 120, 0, 0),
+            (30, "Ōkami HD", 5, 5, 1_600_000_000),
+            (40, "黒い砂漠 \U0001F3AE", 4_000_000_000, 0, 0),
+        ])
+        self.assertEqual(len(snap.names), 3)
+        self.assertEqual(snap.next_cursor, "WzEyMCwyMF0")
+        row = next(iter(snap))
+        self.assertEqual((row["name"], row.appid), ("Half-Life", 10))
+
+    def test_zero_and_absent_values(self):
+        rows = [library_row(10, "", 0), {"game__appid": 20, "game__name": "No dates", "playtime_forever": 7,
+                                         "playtime_2weeks": None, "rtime_last_played": None}]
+        snap = self.round_trip(LibrarySnapshot.from_rows(rows))
+        self.assertEqual([tuple(r) for r in snap], [(10, "", 0, 0, 0), (20, "No dates", 7, 0, 0)])
+
+    def test_nul_in_name_is_dropped(self):
+        snap = self.round_trip(LibrarySnapshot.from_rows([library_row(10, "a\x00b"), library_row(20, "c")]))
+        self.assertEqual([r.name for r in snap], ["ab", "c"])
+
+    def test_other_version_or_damage_is_rejected(self):
+        blob = bytearray(LibrarySnapshot.from_rows([library_row(10, "x", 1)]).to_bytes())
+        blob[4] = SNAPSHOT_VERSION + 1      # the version byte, after the magic
+        with self.assertRaisesMessage(ValueError, "version"):
+            LibrarySnapshot.from_bytes(bytes(blob))
+        good = LibrarySnapshot.from_rows([library_row(10, "x", 1)]).to_bytes()
+        for bad in (b"", good[:8], good[:-4] + b"oops", b"XXXX" + good[4:]):
+            with self.assertRaises(ValueError):
+                LibrarySnapshot.from_bytes(bad)
+
+
+class LibraryQueryTests(TestCase):
+    """
+    query_library's keyset pages, and library_page's answers to bad input.
+    """
+    # (appid, name, playtime_forever, playtime_2weeks, rtime_last_played); lots of ties
+    GAMES = [(10, "Beta", 50, 0, 300), (20, "Alpha", 50, 5, 0), (30, "Alpha", 50, 5, 300),
+             (40, "Gamma", 10, 0, 0), (50, "Beta", 10, 0, 100), (60, "Delta", 0, 0, 0),
+             (70, "Alpha", 0, 5, 0)]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username="library")
+        cls.profile = Profile.objects.create(user=cls.user, steamid64="76561198000000002")
+        for appid, name, *times in cls.GAMES:
+            game = Game.objects.create(appid=appid, name=name)
+            UserGame.objects.create(profile=cls.profile, game=game, playtime_forever=times[0],
+                                    playtime_2weeks=times[1], rtime_last_played=times[2])
+
+    def expected(self, sort, q=""):
+        games = [g for g in self.GAMES if q.lower() in g[1].lower()]
+        if sort == "name":
+            return [g[0] for g in sorted(games, key=lambda g: (g[1], g[0]))]
+        i = {"minutes": 2, "recent": 3, "last_played": 4}[sort]
+        return [g[0] for g in sorted(games, key=lambda g: (g[i], g[0]), reverse=True)]
+
+    def page_through(self, sort, q="", limit=2):
+        seen, cursor = [], None
+        for _ in range(len(self.GAMES) + 1):
+            rows, cursor = query_library(self.profile, sort=sort, q=q, cursor=cursor, limit=limit)
+            self.assertLessEqual(len(rows), limit)
+            seen += [r["game__appid"] for r in rows]
+            if cursor is None:
+                return seen
+        self.fail("pages never ended")
+
+    def test_every_sort_pages_through_ties(self):
+        for sort in SORTS:
+            for limit in (1, 2, 3, len(self.GAMES)):
+                with self.subTest(sort=sort, limit=limit):
+                    self.assertEqual(self.page_through(sort, limit=limit), self.expected(sort))
+
+    def test_search_with_cursor(self):
+        for sort in SORTS:
+            with self.subTest(sort=sort):
+                self.assertEqual(self.page_through(sort, q="alpha", limit=1), self.expected(sort, "alpha"))
+
+    def test_bad_input_is_a_400(self):
+        self.client.force_login(self.user)
+        url = reverse("library_page")
+        first = self.client.get(url, {"sort": "name", "limit": 2}).json()
+        self.assertEqual(self.client.get(url, {"sort": "name", "cursor": first["next"]}).status_code, 200)
+        # A name cursor on a minutes sort: same shape, wrong type
+        for params in ({"cursor": "not-a-cursor"}, {"cursor": encode_cursor("x", 1)},
+                       {"sort": "minutes", "cursor": first["next"]}, {"cursor": encode_cursor([1], 1)},
+                       {"limit": "ten"}):
+            with self.subTest(params=params):
+                response = self.client.get(url, params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn("invalid", response.json()["error"])
+
+
+# Caches of their own, so tests never read or write the real ones
+TEST_CACHES = {
+    "default": {"BACKEND": "portfolio.cache.TieredCache", "OPTIONS": {"SHARED": "shared"}},
+    "shared": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache", "LOCATION": "tests"},
+}
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ParallelSyncTests(TransactionTestCase):
+    """
+    Parallel syncs of different profiles whose libraries overlap, on the
+    configured database (run again with DB_ENGINE=postgres for PostgreSQL).
+    They upsert the same Game and AppOwners rows.
+    """
+    PROFILES = 8
+    LIBRARY = 200
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.fake = FakeSteam().start()
+        cls.addClassCleanup(cls.fake.stop)
+
+    def setUp(self):
+        use_fake_steam(self, self.fake)
+        self.profiles = [Profile.objects.create(user=User.objects.create(username=f"parallel-{i}"),
+                                                steamid64=f"76561198{i:09d}")
+                         for i in range(self.PROFILES)]
+
+    def sync_all(self):
+        def one(profile_id):
+            try:
+                return sync_library(profile_id, achievements=False)
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=len(self.profiles)) as pool:
+            futures = [pool.submit(one, p.id) for p in self.profiles]
+        self.assertEqual([repr(f.exception()) for f in futures if f.exception() is not None], [])
+
+    def assertOwnershipMatchesLibraries(self):
+        # This thread's local cache tier doesn't see the workers' deletes
+        # until LOCAL_TIMEOUT; read the rows
+        cache.clear()
+        pids = [p.id for p in self.profiles]
+        for appid in AppOwners.objects.values_list("appid", flat=True):
+            owners = set(UserGame.objects.filter(game_id=appid).values_list("profile_id", flat=True))
+            self.assertEqual(ownership.owners_among(appid, pids), owners, f"app {appid}")
+
+    def test_parallel_initial_and_changed_syncs(self):
+        for p in self.profiles:
+            self.fake.set_library(p.steamid64, self.LIBRARY)
+        self.sync_all()
+        self.assertEqual(UserGame.objects.count(), self.PROFILES * self.LIBRARY)
+        self.assertEqual(AppOwners.objects.count(), self.LIBRARY)
+        self.assertOwnershipMatchesLibraries()
+
+        # Half of them drop their last 20 games, the others play more
+        for i, p in enumerate(self.profiles):
+            self.fake.set_library(p.steamid64, self.LIBRARY, **({"drop": 20} if i % 2 else {"bump": 5}))
+        self.sync_all()
+        self.assertEqual(UserGame.objects.count(), self.PROFILES * self.LIBRARY - self.PROFILES // 2 * 20)
+        self.assertOwnershipMatchesLibraries()
+        last = appid_at(self.LIBRARY - 1)
+        self.assertEqual(len(ownership.owners_among(last, [p.id for p in self.profiles])), self.PROFILES // 2)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SyncTests(TestCase):
+    """
+    sync_library against FakeSteam, one profile at a time.
+    """
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.fake = FakeSteam().start()
+        cls.addClassCleanup(cls.fake.stop)
+
+    def setUp(self):
+        use_fake_steam(self, self.fake)
+        cache.clear()
+        self.profile = Profile.objects.create(user=User.objects.create(username="sync"),
+                                              steamid64="76561198000000001")
+
+    def sync(self, **kwargs):
+        return sync_library(self.profile.id, achievements=False, **kwargs)
+
+    def test_private_then_public_library_is_a_baseline(self):
+        self.fake.set_library(self.profile.steamid64, 50, private=True)
+        self.assertEqual(self.sync()["inserted"], 0)
+        self.fake.set_library(self.profile.steamid64, 50)
+        self.assertEqual(self.sync()["inserted"], 50)
+        today = timezone.localdate()
+        # Lifetime playtime isn't "played today"...
+        self.assertEqual(history.minutes_played(self.profile, today, today), 0)
+        # ...but play after that is
+        self.fake.set_library(self.profile.steamid64, 50, bump=5)
+        self.sync()
+        self.assertEqual(history.minutes_played(self.profile, today, today), 5 * 5)
+
+    def library(self, profile=None):
+        return {appid: tuple(times) for appid, *times in
+                UserGame.objects.filter(profile=profile or self.profile).values_list("game_id", *PLAYTIME_FIELDS)}
+
+    def assertStatsMatchRebuild(self, profile=None):
+        profile = profile or self.profile
+        stored = stats.stats_dict(ProfileStats.objects.get(profile=profile))
+        stored.pop("updated_at")
+        rebuilt = stats.stats_dict(stats.rebuild(profile))
+        rebuilt.pop("updated_at")
+        self.assertEqual(stored, rebuilt)
+
+    def test_unchanged_library_is_skipped(self):
+        self.fake.set_library(self.profile.steamid64, 30)
+        self.assertEqual(self.sync()["inserted"], 30)
+        with CaptureQueriesContext(connection) as ctx:
+            counts = self.sync()
+        self.assertEqual(counts, {"inserted": 0, "updated": 0, "unchanged": 30, "removed": 0, "skipped": True})
+        # Only last_synced (and the profile basics) are written
+        writes = [q["sql"] for q in ctx.captured_queries
+                  if q["sql"].split(None, 1)[0].upper() in ("INSERT", "UPDATE", "DELETE")]
+        self.assertEqual(len(writes), 1)
+        self.assertIn("portfolio_profile", writes[0])
+
+    def test_fingerprint_matches_stored_library(self):
+        self.fake.set_library(self.profile.steamid64, 30, bump=70_000)
+        self.sync()
+        fp = LibraryFingerprint.objects.get(profile=self.profile)
+        self.assertEqual(_unpack_fingerprint(fp.data), _previous_from_db(self.profile))
+        owned = {10: ("Ōkami HD", 2**32 - 1, 0, 1_700_000_000)}
+        self.assertEqual(_unpack_fingerprint(_pack_fingerprint(owned)),
+                         {10: (2**32 - 1, 0, 1_700_000_000, zlib.crc32("Ōkami HD".encode()))})
+
+    def test_changed_playtime(self):
+        self.fake.set_library(self.profile.steamid64, 30)
+        self.sync()
+        before = self.library()
+        self.fake.set_library(self.profile.steamid64, 30, bump=5)
+        counts = self.sync()
+        # Every 10th game got 5 more minutes
+        self.assertEqual((counts["updated"], counts["unchanged"], counts["skipped"]), (3, 27, False))
+        after = self.library()
+        self.assertEqual({appid for appid in after if after[appid] != before[appid]},
+                         {appid_at(0), appid_at(10), appid_at(20)})
+        self.assertEqual(after[appid_at(10)][0], before[appid_at(10)][0] + 5)
+        self.assertStatsMatchRebuild()
+
+    def test_removed_games(self):
+        self.fake.set_library(self.profile.steamid64, 30)
+        self.sync()
+        self.fake.set_library(self.profile.steamid64, 30, drop=5)
+        self.assertEqual(self.sync()["removed"], 5)
+        self.assertEqual(set(self.library()), {appid_at(i) for i in range(25)})
+        cache.clear()
+        self.assertEqual(ownership.owners_among(appid_at(29), [self.profile.id]), set())
+        self.assertEqual(ownership.owners_among(appid_at(24), [self.profile.id]), {self.profile.id})
+        self.assertStatsMatchRebuild()
+
+    def test_private_response_does_not_prune(self):
+        self.fake.set_library(self.profile.steamid64, 30)
+        self.sync()
+        before = self.library()
+        self.fake.set_library(self.profile.steamid64, 30, private=True)
+        self.assertEqual(self.sync()["removed"], 0)
+        self.assertEqual(self.library(), before)
+        # The fingerprint still describes the stored library
+        self.fake.set_library(self.profile.steamid64, 30)
+        self.assertTrue(self.sync()["skipped"])
+
+    def test_full_sync_matches_incremental(self):
+        other = Profile.objects.create(user=User.objects.create(username="sync-full"),
+                                       steamid64="76561198000000003")
+        for change in ({}, {"bump": 5}, {"drop": 4, "bump": 9}, {"size": 40, "bump": 9}):
+            for p in (self.profile, other):
+                self.fake.set_library(p.steamid64, **{"size": 30, **change})
+            with self.subTest(change=change):
+                incremental = self.sync()
+                full = sync_library(other.id, full=True, achievements=False)
+                self.assertEqual(full, incremental)
+                self.assertEqual(self.library(other), self.library())
+                self.assertStatsMatchRebuild(other)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class PlayerCountTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.fake = FakeSteam().start()
+        cls.addClassCleanup(cls.fake.stop)
+
+    def setUp(self):
+        use_fake_steam(self, self.fake)
+        self.fake.reset_counts()
+
+    def test_failed_call_flags_the_reading(self):
+        player_counts.refresh_counts([10])
+        self.fake.fail(PLAYERS, 403)
+        self.assertEqual(player_counts.refresh_counts([10]), {"ok": 0, "failed": 1, "skipped": 0})
+        row = PlayerCount.objects.get(appid=10)
+        self.assertEqual((row.ok, row.count), (False, 10))
+
+    def test_apps_not_reached_keep_their_reading(self):
+        player_counts.refresh_counts([10, 20])
+        before = dict(PlayerCount.objects.values_list("appid", "checked_at"))
+        # The budget ran out before any call finished
+        with mock.patch.object(steam_api, "fan_out", lambda fn, keys, **kw: ({}, list(keys))):
+            self.assertEqual(player_counts.refresh_counts([10, 20]), {"ok": 0, "failed": 0, "skipped": 2})
+        self.assertEqual(list(PlayerCount.objects.filter(ok=True).values_list("appid", flat=True)), [10, 20])
+        self.assertEqual(dict(PlayerCount.objects.values_list("appid", "checked_at")), before)
+
+    def test_least_recently_checked_first(self):
+        now = timezone.now()
+        for appid, age in ((10, 1), (20, 5), (30, None)):
+            PlayerCount.objects.create(appid=appid, last_viewed_at=now,
+                                       checked_at=now - timedelta(minutes=age) if age else None)
+        self.assertEqual(player_counts.hot_appids(), [30, 20, 10])
+        self.assertEqual(player_counts.hot_appids(limit=2), [30, 20])
+
+
+@override_settings(CACHES=TEST_CACHES)
+class GenreMinutesTests(TransactionTestCase):
+    """
+    store_meta.refresh moving genre minutes for the owners of an app.
+    """
+    APP = appid_at(5)     # played for 35 minutes in FakeSteam libraries
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.fake = FakeSteam().start()
+        cls.addClassCleanup(cls.fake.stop)
+
+    def setUp(self):
+        use_fake_steam(self, self.fake)
+        self.profiles = [Profile.objects.create(user=User.objects.create(username=f"genres-{i}"),
+                                                steamid64=f"7656119810000000{i}")
+                         for i in range(3)]
+        for p in self.profiles:
+            self.fake.set_library(p.steamid64, 10)
+            sync_library(p.id, achievements=False)
+
+    def assertMatchesRebuild(self):
+        for p in self.profiles:
+            stored = ProfileStats.objects.get(profile=p).genre_minutes
+            self.assertEqual(stored, stats.rebuild(p).genre_minutes)
+
+    def genres(self):
+        return ProfileStats.objects.get(profile=self.profiles[0]).genre_minutes
+
+    def test_refresh_adds_then_moves_genres(self):
+        self.assertEqual(self.genres(), {})
+        store_meta.refresh(self.APP)
+        self.assertEqual(self.genres(), {"Casual": 35, "Sports": 35})
+        self.assertMatchesRebuild()
+        # Same genres again: nothing moves
+        store_meta.refresh(self.APP)
+        self.assertEqual(self.genres(), {"Casual": 35, "Sports": 35})
+        with mock.patch.object(steam_api, "get_store_appdetails",
+                               lambda appid: {"genres": [{"description": "RPG"}]}):
+            store_meta.refresh(self.APP)
+        self.assertEqual(self.genres(), {"RPG": 35})
+        self.assertMatchesRebuild()
+
+    def test_portfolio_etag_follows_genre_changes(self):
+        self.client.force_login(self.profiles[0].user)
+        etag = self.client.get(reverse("me"))["ETag"]
+        self.assertEqual(self.client.get(reverse("me"), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        store_meta.refresh(self.APP)
+        response = self.client.get(reverse("me"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Casual")
+
+    def test_concurrent_refreshes_apply_once(self):
+        # Both fetch the store page before either writes
+        fetched = threading.Barrier(2)
+        appdetails = steam_api.get_store_appdetails
+
+        def fetch(appid):
+            data = appdetails(appid)
+            fetched.wait(timeout=10)
+            return data
+
+        def refresh():
+            try:
+                store_meta.refresh(self.APP)
+            finally:
+                connection.close()
+
+        with mock.patch.object(steam_api, "get_store_appdetails", fetch), \
+                ThreadPoolExecutor(max_workers=2) as pool:
+            futures = [pool.submit(refresh) for _ in range(2)]
+        self.assertEqual([repr(f.exception()) for f in futures if f.exception() is not None], [])
+        self.assertEqual(self.genres(), {"Casual": 35, "Sports": 35})
+        self.assertMatchesRebuild()
+
+
+@override_settings(CACHES=TEST_CACHES)
+class TransferTests(TestCase):
+    """
+    export_library / import_library round trips.
+    """
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.fake = FakeSteam().start()
+        cls.addClassCleanup(cls.fake.stop)
+
+    def setUp(self):
+        use_fake_steam(self, self.fake)
+        cache.clear()
+        self.steamids = ["76561198000000011", "76561198000000012"]
+        for i, steamid in enumerate(self.steamids):
+            p = Profile.objects.create(user=User.objects.create(username=f"transfer-{i}"), steamid64=steamid)
+            self.fake.set_library(steamid, 30 + i * 10)
+            sync_library(p.id)
+        # Level 0 must survive the trip too
+        Profile.objects.filter(steamid64=self.steamids[0]).update(level=0)
+
+    def state(self):
+        """
+        Everything an export carries, keyed by steamid and appid (ids differ between databases).
+        """
+        profiles = {}
+        for p in Profile.objects.filter(steamid64__in=self.steamids):
+            profiles[p.steamid64] = {
+                "basics": (p.persona, p.avatar, p.level),
+                "library": {appid: tuple(times) for appid, *times in
+                            UserGame.objects.filter(profile=p).values_list("game_id", *PLAYTIME_FIELDS)},
+                "achievements": set(UserAchievement.objects.filter(profile=p)
+                                    .values_list("appid", "apiname", "achieved", "unlocktime")),
+            }
+        return {
+            "profiles": profiles,
+            "games": set(Game.objects.values_list("appid", "name")),
+            "schemas": set(Achievement.objects.values_list("appid", "apiname", "icon")),
+        }
+
+    def export(self) -> str:
+        out = io.StringIO()
+        transfer.export(out)
+        return out.getvalue()
+
+    def load(self, text):
+        return transfer.load(io.StringIO(text))
+
+    def assertDerivedDataMatches(self):
+        cache.clear()
+        pids = list(Profile.objects.values_list("id", flat=True))
+        for appid in Game.objects.values_list("appid", flat=True):
+            owners = set(UserGame.objects.filter(game_id=appid).values_list("profile_id", flat=True))
+            self.assertEqual(ownership.owners_among(appid, pids), owners)
+        for p in Profile.objects.all():
+            stored = stats.stats_dict(ProfileStats.objects.get(profile=p))
+            rebuilt = stats.stats_dict(stats.rebuild(p))
+            stored.pop("updated_at"), rebuilt.pop("updated_at")
+            self.assertEqual(stored, rebuilt)
+            # The fingerprint describes the imported library: a resync skips
+            self.assertTrue(sync_library(p.id, achievements=False)["skipped"])
+
+    def test_round_trip_into_empty_database(self):
+        before, text = self.state(), self.export()
+        self.assertTrue(before["profiles"][self.steamids[0]]["achievements"])
+        for model in (User, Game, Achievement, AppOwners):
+            model.objects.all().delete()
+
+        counts = self.load(text)
+        self.assertEqual((counts["profiles"], counts["user_games"], counts["removed"]), (2, 70, 0))
+        self.assertEqual(self.state(), before)
+        self.assertEqual(Profile.objects.get(steamid64=self.steamids[0]).level, 0)
+        self.assertDerivedDataMatches()
+
+    def test_reimport_without_changes_writes_no_rows(self):
+        before, text = self.state(), self.export()
+        counts = self.load(text)
+        self.assertEqual((counts["user_games"], counts["removed"]), (0, 0))
+        self.assertEqual(self.state(), before)
+
+    def test_import_replaces_library(self):
+        before, text = self.state(), self.export()
+        # Since the export: more games, more play, a fresh level
+        self.fake.set_library(self.steamids[0], 40, bump=5)
+        sync_library(Profile.objects.get(steamid64=self.steamids[0]).id, achievements=False)
+        self.assertNotEqual(self.state()["profiles"], before["profiles"])
+
+        counts = self.load(text)
+        self.assertEqual(counts["removed"], 10)
+        self.assertEqual(self.state()["profiles"], before["profiles"])
+        self.fake.set_library(self.steamids[0], 30)     # Steam agrees with the file again
+        self.assertDerivedDataMatches()
+
+    def test_rejects_other_files(self):
+        for text in ("", "not json\n", '{"format": "something-else"}\n',
+                     '{"format": "steamfolio-library", "version": 99}\n'):
+            with self.subTest(text=text), self.assertRaises(ValueError):
+                self.load(text)
+
+
+def use_fake_steam(test, fake):
+    """
+    Point the Steam client at `fake` for the rest of the test.
+    """
+    steam = override_settings(STEAM_API_BASE=fake.url, STEAM_STORE_BASE=fake.url)
+    steam.enable()
+    test.addCleanup(steam.disable)
+    for patch in (mock.patch.dict(os.environ, {"STEAM_WEB_API_KEY": "test"}),
+                  mock.patch.object(steam_client, "_client", None)):
+        patch.start()
+        test.addCleanup(patch.stop)
+    # Both bases share one host here; throttling isn't what's tested
+    steam_client.get_client().rates.clear()
+
+
+def client_host(fake) -> str:
+    return fake.url.split("//", 1)[1]
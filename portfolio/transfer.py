@@ -0,0 +1,282 @@
+import contextlib, gzip, json, sys
+from itertools import groupby
+from operator import itemgetter
+
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from social_django.models import UserSocialAuth
+
+from .models import Achievement, Game, LibraryFingerprint, Profile, UserAchievement, UserGame
+from . import ownership, stats
+from .sync import PLAYTIME_FIELDS, _library_digest, _pack_fingerprint
+
+# Library export/import (manage.py export_library / import_library), for
+# seeding or restoring profiles without calling Steam.
+#
+# The file is newline-delimited JSON, gzipped when its name ends in .gz. The
+# first line is a header naming the columns of each record type; every other
+# line is one record, a JSON array led by its type:
+#   ["game", appid, name, schema_fetched_at]
+#   ["achievement", appid, apiname, displayname, description, icon, icongray]
+#   ["profile", steamid64, username, persona, avatar, level, last_synced]
+#   ["ug", appid, playtime_forever, playtime_2weeks, rtime_last_played]
+#   ["ua", appid, apiname, achieved, unlocktime]
+# Games and schemas come first; each profile is followed by its own ug/ua
+# records. Both sides stream, holding at most one profile's library.
+#
+# Import writes with executemany upserts (no model instances) in one
+# transaction, skipping rows that already hold the file's values, then updates
+# what sync_library maintains: fingerprint, stats and app owners. A profile's
+# library is replaced by the file's; its achievements are merged. Playtime
+# history isn't exported, and imported playtime doesn't count as played.
+FORMAT = "steamfolio-library"
+VERSION = 1
+COLUMNS = {
+    "game": ["appid", "name", "schema_fetched_at"],
+    "achievement": ["appid", "apiname", "displayname", "description", "icon", "icongray"],
+    "profile": ["steamid64", "username", "persona", "avatar", "level", "last_synced"],
+    "ug": ["appid", *PLAYTIME_FIELDS],
+    "ua": ["appid", "apiname", "achieved", "unlocktime"],
+}
+# Rows per executemany call / per fetch when exporting
+CHUNK_SIZE = 5000
+# Bound parameters per IN (...) lookup
+BATCH_SIZE = 500
+
+def open_file(path: str, mode: str):
+    """
+    Text stream for `path` ("r" or "w"): stdin/stdout for "-", gzip for *.gz.
+    """
+    if path == "-":
+        return contextlib.nullcontext(sys.stdin if mode == "r" else sys.stdout)
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8", compresslevel=6)
+    return open(path, mode, encoding="utf-8")
+
+# --- Export ---
+
+def _dt(value):
+    return value.isoformat() if value else None
+
+class _ByProfile:
+    """
+    A (profile_id, ...) row stream ordered by profile, handed out one profile at a time.
+    """
+    def __init__(self, qs):
+        self._groups = groupby(qs.iterator(chunk_size=CHUNK_SIZE), key=itemgetter(0))
+        self._head = next(self._groups, None)
+
+    def take(self, profile_id):
+        if self._head is None or self._head[0] != profile_id:
+            return
+        for row in self._head[1]:
+            yield row[1:]
+        self._head = next(self._groups, None)
+
+def export(out, steamids=None) -> dict:
+    """
+    Write profiles (all, or those in `steamids`) with their libraries and
+    achievements to the text stream `out`. Returns counts of what was written.
+    """
+    profiles = Profile.objects.all()
+    if steamids:
+        profiles = profiles.filter(steamid64__in=list(steamids))
+    user_games = UserGame.objects.filter(profile__in=profiles)
+    games = Game.objects.filter(appid__in=user_games.values("game_id")) if steamids else Game.objects.all()
+    counts = dict.fromkeys(COLUMNS, 0)
+
+    def write(kind, row):
+        out.write(json.dumps([kind, *row], ensure_ascii=False, separators=(",", ":")) + "\n")
+        counts[kind] += 1
+
+    out.write(json.dumps({"format": FORMAT, "version": VERSION,
+                          "exported_at": timezone.now().isoformat(), "columns": COLUMNS}) + "\n")
+    for appid, name, fetched in games.order_by("appid").values_list(*COLUMNS["game"]).iterator(chunk_size=CHUNK_SIZE):
+        write("game", (appid, name, _dt(fetched)))
+    schemas = Achievement.objects.filter(appid__in=games.filter(schema_fetched_at__isnull=False).values("appid"))
+    for row in schemas.order_by("appid", "apiname").values_list(*COLUMNS["achievement"]).iterator(chunk_size=CHUNK_SIZE):
+        write("achievement", row)
+
+    ug = _ByProfile(user_games.order_by("profile_id", "game_id")
+                    .values_list("profile_id", "game_id", *PLAYTIME_FIELDS))
+    ua = _ByProfile(UserAchievement.objects.filter(profile__in=profiles)
+                    .order_by("profile_id", "appid", "apiname")
+                    .values_list("profile_id", *COLUMNS["ua"]))
+    for pid, steamid, username, persona, avatar, level, synced in (
+            profiles.order_by("id")
+            .values_list("id", "steamid64", "user__username", "persona", "avatar", "level", "last_synced")
+            .iterator(chunk_size=CHUNK_SIZE)):
+        write("profile", (steamid, username, persona, avatar, level, _dt(synced)))
+        for row in ug.take(pid):
+            write("ug", row)
+        for row in ua.take(pid):
+            write("ua", row)
+    return {"profiles": counts["profile"], "games": counts["game"], "user_games": counts["ug"],
+            "achievements": counts["achievement"], "user_achievements": counts["ua"]}
+
+# --- Import ---
+
+def _upsert(model, columns, unique, rows, update=None) -> None:
+    """
+    INSERT ... ON CONFLICT (unique) DO UPDATE (or DO NOTHING when `update` is
+    empty) for plain tuples, CHUNK_SIZE rows per executemany. `update` maps a
+    column to its SQL expression (default: the incoming value).
+    """
+    if not rows:
+        return
+    q = connection.ops.quote_name
+    table = q(model._meta.db_table)
+    if update is None:
+        update = {c: f"excluded.{q(c)}" for c in columns if c not in unique}
+    action = ("DO UPDATE SET " + ", ".join(f"{q(c)} = {expr}" for c, expr in update.items())) if update else "DO NOTHING"
+    sql = (f"INSERT INTO {table} ({', '.join(map(q, columns))}) VALUES ({', '.join(['%s'] * len(columns))}) "
+           f"ON CONFLICT ({', '.join(map(q, unique))}) {action}")
+    with connection.cursor() as cursor:
+        for i in range(0, len(rows), CHUNK_SIZE):
+            cursor.executemany(sql, rows[i:i + CHUNK_SIZE])
+
+class _Loader:
+    def __init__(self, now):
+        self.now = now
+        self.counts = {"profiles": 0, "games": 0, "user_games": 0, "removed": 0,
+                       "achievements": 0, "user_achievements": 0}
+        self.names = {}         # appid -> name, from the file's game records
+        self.games, self.schemas, self.user_games, self.user_achievements = [], [], [], []
+        self.profile = None
+        self.ownership = {}     # appid -> (profile ids to add, profile ids to remove)
+        self.profile_ids = []
+
+    def add(self, record):
+        kind, row = record[0], record[1:]
+        if kind in ("ug", "ua") and self.profile is None:
+            raise ValueError(f"{kind!r} record before any profile")
+        if kind == "ug":
+            appid, times = row[0], tuple(row[1:])
+            self.owned[appid] = times
+            # Rows that already hold these values aren't rewritten
+            if self.previous.get(appid) != times:
+                self.user_games.append((self.profile.id, appid, *times))
+                if len(self.user_games) >= CHUNK_SIZE:
+                    self.flush()
+        elif kind == "ua":
+            self.user_achievements.append((self.profile.id, *row))
+            if len(self.user_achievements) >= CHUNK_SIZE:
+                self.flush()
+        elif kind == "game":
+            appid, name, fetched = row
+            self.names[appid] = name
+            fetched = parse_datetime(fetched) if fetched else None
+            self.games.append((appid, name, connection.ops.adapt_datetimefield_value(fetched)))
+            if len(self.games) >= CHUNK_SIZE:
+                self.flush()
+        elif kind == "achievement":
+            self.schemas.append(tuple(row))
+            if len(self.schemas) >= CHUNK_SIZE:
+                self.flush()
+        elif kind == "profile":
+            self.finish_profile()
+            self.start_profile(*row)
+        else:
+            raise ValueError(f"unknown record type {kind!r}")
+
+    def flush(self):
+        q = connection.ops.quote_name
+        game = q(Game._meta.db_table)
+        # Never overwrite a real name with "Unknown" or a known schema time with none
+        _upsert(Game, ["appid", "name", "schema_fetched_at"], ["appid"], self.games, {
+            "name": f"CASE WHEN excluded.{q('name')} = 'Unknown' THEN {game}.{q('name')} ELSE excluded.{q('name')} END",
+            "schema_fetched_at": f"COALESCE(excluded.{q('schema_fetched_at')}, {game}.{q('schema_fetched_at')})",
+        })
+        _upsert(Achievement, COLUMNS["achievement"], ["appid", "apiname"], self.schemas)
+        _upsert(UserGame, ["profile_id", "game_id", *PLAYTIME_FIELDS], ["profile_id", "game_id"], self.user_games)
+        _upsert(UserAchievement, ["profile_id", *COLUMNS["ua"]], ["profile_id", "appid", "apiname"],
+                self.user_achievements)
+        self.counts["games"] += len(self.games)
+        self.counts["achievements"] += len(self.schemas)
+        self.counts["user_games"] += len(self.user_games)
+        self.counts["user_achievements"] += len(self.user_achievements)
+        self.games, self.schemas, self.user_games, self.user_achievements = [], [], [], []
+
+    def start_profile(self, steamid, username, persona, avatar, level, last_synced):
+        self.flush()
+        p = Profile.objects.filter(steamid64=steamid).first()
+        if p is None:
+            # Link the Steam login to the new user, so signing in finds this profile
+            social = UserSocialAuth.objects.filter(provider="steam", uid=steamid).select_related("user").first()
+            user = social.user if social else None
+            if user is None:
+                if not username or User.objects.filter(username=username).exists():
+                    username = f"steam_{steamid}"
+                user = User.objects.create_user(username=username)
+                UserSocialAuth.objects.create(user=user, provider="steam", uid=steamid)
+            p = Profile.objects.create(user=user, steamid64=steamid)
+        p.persona, p.avatar = persona or p.persona, avatar or p.avatar
+        if level is not None:
+            p.level = level
+        # Counts as a sync: the portfolio caches are keyed on last_synced
+        p.last_synced = self.now
+        p.save()
+        self.profile = p
+        self.previous = {appid: tuple(times) for appid, *times in
+                         UserGame.objects.filter(profile=p).values_list("game_id", *PLAYTIME_FIELDS)}
+        self.owned = {}
+
+    def finish_profile(self):
+        if self.profile is None:
+            return
+        p, owned = self.profile, self.owned
+        # Apps the file's game records didn't cover: the DB's name, or a placeholder row
+        missing = [appid for appid in owned if appid not in self.names]
+        names = {}
+        for i in range(0, len(missing), BATCH_SIZE):
+            names.update(Game.objects.filter(appid__in=missing[i:i + BATCH_SIZE]).values_list("appid", "name"))
+        unknown = [(appid, "Unknown") for appid in missing if appid not in names]
+        _upsert(Game, ["appid", "name"], ["appid"], unknown, update={})
+        names.update(unknown)
+        self.flush()
+
+        gone = sorted(self.previous.keys() - owned.keys())
+        for i in range(0, len(gone), BATCH_SIZE):
+            self.counts["removed"] += UserGame.objects.filter(profile=p, game_id__in=gone[i:i + BATCH_SIZE]).delete()[0]
+        for appid in owned.keys() - self.previous.keys():
+            self.ownership.setdefault(appid, (set(), set()))[0].add(p.id)
+        for appid in gone:
+            self.ownership.setdefault(appid, (set(), set()))[1].add(p.id)
+
+        library = {appid: (self.names.get(appid) or names[appid], *times) for appid, times in owned.items()}
+        LibraryFingerprint.objects.bulk_create(
+            [LibraryFingerprint(profile=p, digest=_library_digest(library), data=_pack_fingerprint(library))],
+            update_conflicts=True, unique_fields=["profile"], update_fields=["digest", "data", "updated_at"],
+        )
+        stats.rebuild(p)
+        self.counts["profiles"] += 1
+        self.profile_ids.append(p.id)
+        self.profile = None
+
+def load(lines) -> dict:
+    """
+    Import an export (an iterable of its lines) in one transaction. Returns
+    counts: profiles, games, user_games, removed, achievements, user_achievements.
+    Raises ValueError on a file that isn't a version-1 export.
+    """
+    lines = iter(lines)
+    try:
+        header = json.loads(next(lines, "") or "null")
+    except ValueError:
+        header = None
+    if not isinstance(header, dict) or header.get("format") != FORMAT:
+        raise ValueError("not a library export")
+    if header.get("version") != VERSION:
+        raise ValueError(f"unsupported export version {header.get('version')!r} (expected {VERSION})")
+
+    loader = _Loader(timezone.now())
+    with transaction.atomic():
+        for line in lines:
+            if line.strip():
+                loader.add(json.loads(line))
+        loader.finish_profile()
+        loader.flush()
+        ownership.apply_changes(loader.ownership, loader.profile_ids)
+    return loader.counts
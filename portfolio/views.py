@@ -1,12 +1,27 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import logout
-from django.core.cache import cache
+from django.contrib.auth.views import redirect_to_login
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject
 
-from .models import Profile, UserGame
-from .sync import sync_library
-from . import steam_api
-from itertools import islice
+from .models import Game, Profile, UserGame, ProfileStats, SyncJob
+from .cache import get_or_compute, cache_stats
+from .perf import span, request_stats
+from .jobs import enqueue_sync, latest_job
+from .detail import SECTIONS, abuild_section, etag_for
+from .history import minutes_played
+from .stats import stats_dict
+from .library import (query_library, BadCursor, LibrarySnapshot, SNAPSHOT_VERSION,
+                      SORTS, DEFAULT_SORT, PAGE_SIZE)
+from .templatetags.portfolio_extras import minutes_to_hours, epoch_to_date, header_url
+from . import images, steam_api
 
 def login_page(request):
     # Renders a simple page with a "Sign in with Steam" link
@@ -20,29 +35,128 @@ def home(request):
     # If logged in, go to portfolio; otherwise show login page
     return redirect("me") if request.user.is_authenticated else redirect("login")
 
+# --- Conditional GET ---
+# Pages carry an ETag built from what they show (sync time, job state, query
+# params) and answer a matching If-None-Match with a 304 before any library
+# query or rendering. Bump PAGE_VERSION when the page templates change.
+PAGE_VERSION = 2
+# Rendered grid HTML ({% cache %} in portfolio.html), keyed on the sync time
+GRID_TTL = 3600
+
+def _not_modified(request, etag, last_modified=None):
+    return get_conditional_response(
+        request, etag=etag, last_modified=int(last_modified.timestamp()) if last_modified else None)
+
+def _validators(response, etag, last_modified=None):
+    # Private pages: the browser keeps them but asks every time (cheap when it's a 304)
+    response["ETag"] = etag
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified.timestamp())
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
 @login_required
 def my_portfolio(request):
     profile = Profile.objects.get(user=request.user)
 
-    # First visit: populate from Steam
-    if not profile.last_synced:
-        sync_library(profile.id)
-
-    # Cache the heavy query for speed (safe even if cache isn't configured)
-    cache_key = f"lib:{profile.id}"
-    games = cache.get(cache_key) if cache else None
-    if games is None:
-        qs = (UserGame.objects
-              .select_related("game")
-              .filter(profile=profile)
-              .order_by("-playtime_forever"))
-        games = list(qs.values("game__appid", "game__name",
-                               "playtime_forever", "playtime_2weeks", "rtime_last_played"))
-        
-        if cache:
-            cache.set(cache_key, games, 3600)
-
-    return render(request, "portfolio.html", {"profile": profile, "games": games})
+    # First visit: queue a sync; the page polls sync_status and reloads when it's done.
+    # Not again after a failed one (the page would loop); "Sync Now" retries.
+    sync_job = latest_job(profile)
+    if not profile.last_synced and (sync_job is None or sync_job.status != SyncJob.FAILED):
+        sync_job = enqueue_sync(profile)
+
+    sort = request.GET.get("sort") if request.GET.get("sort") in SORTS else DEFAULT_SORT
+    q = request.GET.get("q", "").strip()
+    today = timezone.localdate()
+
+    # Everything the page shows changes with a sync, a job state change, the
+    # header stats (store metadata moves genre minutes between syncs) or the
+    # date ("this month"); the library itself isn't read for a 304.
+    stats_row = ProfileStats.objects.filter(profile=profile).first()
+    stats_at = stats_row and stats_row.updated_at
+    etag = etag_for("me", PAGE_VERSION, SNAPSHOT_VERSION, profile.id, profile.last_synced,
+                    profile.persona, profile.avatar, profile.level,
+                    sync_job and (sync_job.id, sync_job.status), stats_at, sort, q, today)
+    last_modified = max(filter(None, (profile.last_synced, sync_job and sync_job.created_at,
+                                      sync_job and sync_job.finished_at, stats_at)), default=None)
+    response = _not_modified(request, etag, last_modified)
+    if response is not None:
+        return _validators(response, etag, last_modified)
+
+    # First page of the unfiltered grid is cached per sort (safe even if cache isn't
+    # configured) twice: as rendered HTML (GRID_TTL) and as a compact LibrarySnapshot
+    # blob to rebuild it from. Both are keyed on the sync time so a sync finishing
+    # in the worker (or a force_sync) invalidates them. Loaded lazily: a cached
+    # grid never touches the snapshot.
+    sync_ver = int(profile.last_synced.timestamp()) if profile.last_synced else 0
+    if q:
+        games = LibrarySnapshot.from_rows(*query_library(profile, sort=sort, q=q))
+    else:
+        games = SimpleLazyObject(lambda: LibrarySnapshot.from_bytes(get_or_compute(
+            f"lib:{profile.id}:{sync_ver}:{sort}:v{SNAPSHOT_VERSION}",
+            lambda: LibrarySnapshot.from_rows(*query_library(profile, sort=sort)).to_bytes(),
+            3600,
+        )))
+
+    # Header totals: the precomputed ProfileStats row, plus hours this month
+    # from the snapshot history (at most ~31 small rows)
+    stats = stats_dict(stats_row)
+    month_minutes = minutes_played(profile, today.replace(day=1), today)
+
+    with span("render"):
+        response = render(request, "portfolio.html", {
+            "profile": profile,
+            "games": games,
+            "sort": sort,
+            "q": q,
+            "sync_job": sync_job,
+            "month_minutes": month_minutes,
+            "stats": stats,
+            "grid_key": f"{profile.id}:{sync_ver}:{sort}:v{SNAPSHOT_VERSION}:{PAGE_VERSION}",
+            "grid_ttl": GRID_TTL,
+        })
+    return _validators(response, etag, last_modified)
+
+@login_required
+def profile_stats(request):
+    # Same totals as the portfolio header, as JSON
+    profile = Profile.objects.get(user=request.user)
+    today = timezone.localdate()
+    return JsonResponse({
+        **stats_dict(ProfileStats.objects.filter(profile=profile).first()),
+        "minutes_this_month": minutes_played(profile, today.replace(day=1), today),
+    })
+
+@login_required
+def library_page(request):
+    # JSON pages for the portfolio grid (infinite scroll, sort and search)
+    profile = Profile.objects.get(user=request.user)
+    try:
+        games, next_cursor = query_library(
+            profile,
+            sort=request.GET.get("sort", DEFAULT_SORT),
+            q=request.GET.get("q", "").strip(),
+            cursor=request.GET.get("cursor") or None,
+            limit=request.GET.get("limit", PAGE_SIZE),
+        )
+    except BadCursor:
+        return JsonResponse({"error": "invalid cursor"}, status=400)
+    except ValueError:
+        return JsonResponse({"error": "invalid limit"}, status=400)
+
+    return JsonResponse({
+        "games": [{
+            "appid": g["game__appid"],
+            "name": g["game__name"],
+            "minutes": g["playtime_forever"],
+            "total": minutes_to_hours(g["playtime_forever"]),
+            "recent": minutes_to_hours(g["playtime_2weeks"]) if g["playtime_2weeks"] else None,
+            "last_played": epoch_to_date(g["rtime_last_played"]) if g["rtime_last_played"] else None,
+            "url": reverse("game_detail", args=[g["game__appid"]]),
+            "image": header_url(g["game__appid"], images.WIDTHS[0], "webp" if images.Image else "jpg"),
+        } for g in games],
+        "next": next_cursor,
+    })
 
 @login_required
 def game_detail(request, appid: int):
@@ -51,83 +165,136 @@ def game_detail(request, appid: int):
         UserGame.objects.select_related("game"),
         profile=profile, game__appid=appid
         )
-    
-
-    header = f"https://cdn.cloudflare.steamstatic.com/steam/apps/{appid}/header.jpg"
-
-    # --- Player Count (live, cache 2 minutes) ---
-    pc_key = f"pc:{appid}"
-    player_count = cache.get(pc_key) if cache else None
-    if player_count is None:
-        try:
-            player_count = steam_api.get_number_of_current_players(appid)
-        except Exception:
-            player_count = None
-        if cache:
-            cache.set(pc_key, player_count, 120)
-    
-    # --- Store metadata (genres, description, link) - cache 6h ---
-    meta_key = f"store:{appid}"
-    meta = cache.get(meta_key) if cache else None
-    if meta is None:
-        try:
-            meta = steam_api.get_store_appdetails(appid) or {}
-        except Exception:
-            meta = {}
-        if cache:
-            cache.set(meta_key, meta, 6 * 3600)
-
-    genres = [g["description"] for g in (meta.get("genres") or []) if "description" in g]
-    description = meta.get("short_description") or None
-    store_url = meta.get("website") or f"https://store.steampowered.com/app/{appid}"
-
-    # --- Friends who also own the game - cache 2h ---
-    # NOTE: subject to each friend's privacy; may be empty.
-    friends_key = f"friends_own:{profile.id}:{appid}"
-    friends_who_own = cache.get(friends_key) if cache else None
-    if friends_who_own is None:
-        friends_who_own = []
-        try:
-            friend_ids = steam_api.get_friend_steamids(profile.steamid64)[:100]
-            # fetch names/avatars in one call
-            summaries = {p["steamid"]: p for p in steam_api.get_player_summaries(friend_ids)} if friend_ids else {}
-
-            # check up to 50 friends' libraries to keep a response quick
-            for fid in islice(friend_ids, 0, 50):
-                try:
-                    og = steam_api.get_owned_games(fid)
-                    games = og.get("games", []) or []
-                    if any(g.get("appid") == appid for g in games):
-                        ps = summaries.get(fid, {})
-                        friends_who_own.append({
-                            "steamid": fid,
-                            "name": ps.get("personaname", "Friend"),
-                            "avatar": ps.get("avatarFull", ""),
-                            "profileurl": ps.get("profileurl", f"https://steamcommunity.com/profiles/{fid}"),
-                        })
-                except Exception:
-                    # skip private/errored friends
-                    continue
-        except Exception:
-            friends_who_own = []
-        
-        if cache:
-            cache.set(friends_key, friends_who_own, 2 * 3600)
-    
-    ctx = {
-        "ug": ug,
-        "header": header,
-        "player_count": player_count,
-        "genres": genres,
-        "description": description,
-        "store_url": store_url,
-        "friends_who_own": friends_who_own,
-    }
-    return render(request, "game_detail.html", ctx)
+
+    etag = etag_for("game", PAGE_VERSION, appid, ug.game.name, ug.playtime_forever,
+                    ug.playtime_2weeks, ug.rtime_last_played)
+    response = _not_modified(request, etag, profile.last_synced)
+    if response is not None:
+        return _validators(response, etag, profile.last_synced)
+
+    # Shell only: player count, store metadata, friends and achievements are
+    # fragments the page fetches after first paint (game_fragment, detail.py)
+    ctx = {"ug": ug}
+    with span("render"):
+        response = render(request, "game_detail.html", ctx)
+    return _validators(response, etag, profile.last_synced)
+
+def _fragment_start(request, appid: int, section: str):
+    """
+    (profile, validators, early response) for a fragment request. The early
+    response is a redirect to login or a 304 when the client's copy is current.
+    """
+    if section not in SECTIONS:
+        raise Http404
+    _, version, _, personal = SECTIONS[section]
+    profile = None
+    if personal:
+        if not request.user.is_authenticated:
+            return None, None, redirect_to_login(request.get_full_path())
+        profile = Profile.objects.get(user=request.user)
+        if not UserGame.objects.filter(profile=profile, game_id=appid).exists():
+            raise Http404
+    elif not Game.objects.filter(appid=appid).exists():
+        raise Http404
+
+    validators = version(profile, appid)
+    early = None
+    if validators:
+        early = get_conditional_response(request, etag=etag_for(section, appid, validators[0]),
+                                         last_modified=int(validators[1].timestamp()))
+    return profile, validators, early
+
+def _fragment_finish(response, appid: int, section: str, validators, complete: bool = True):
+    if validators and complete:
+        response["ETag"] = etag_for(section, appid, validators[0])
+        response["Last-Modified"] = http_date(validators[1].timestamp())
+        patch_cache_control(response, **SECTIONS[section][2])
+    else:
+        # Live or partial (timed out): always ask again
+        patch_cache_control(response, no_store=True)
+    return response
+
+def game_fragment(request, appid: int, section: str):
+    # One section of the game page as HTML, with its own cache policy and validators
+    profile, validators, early = _fragment_start(request, appid, section)
+    if early is not None:
+        return _fragment_finish(early, appid, section, validators) if early.status_code == 304 else early
+    ctx = SECTIONS[section][0](profile, appid)
+    with span("render"):
+        response = render(request, f"fragments/game_{section}.html", ctx)
+    return _fragment_finish(response, appid, section, validators)
+
+async def game_fragment_async(request, appid: int, section: str):
+    # Same, with the section built in a worker thread under its timeout.
+    # Routed instead of game_fragment when ASYNC_VIEWS=True (run under ASGI).
+    # No async login_required: request.auser() needs async auth backends and
+    # social-auth's Steam backend is sync only, so the user loads in a thread.
+    profile, validators, early = await sync_to_async(_fragment_start)(request, appid, section)
+    if early is not None:
+        return _fragment_finish(early, appid, section, validators) if early.status_code == 304 else early
+    ctx, complete = await abuild_section(section, profile, appid)
+    with span("render"):
+        response = await sync_to_async(render)(request, f"fragments/game_{section}.html", ctx)
+    return _fragment_finish(response, appid, section, validators, complete)
+
+def header_image(request, appid: int, width: int, fmt: str):
+    # A game's header from the local image cache (images.py). With ?v= matching
+    # the stored content hash the URL can never change meaning: cache it forever.
+    if width not in images.WIDTHS or fmt not in images.FORMATS:
+        raise Http404
+    # Only fetch headers for games we know about
+    if images.known_version(appid) is None and not Game.objects.filter(appid=appid).exists():
+        raise Http404
+    try:
+        found = images.open_variant(appid, width, fmt)
+    except Exception:
+        return HttpResponse(status=502)
+    if found is None:
+        response = HttpResponse(status=404)
+        patch_cache_control(response, public=True, max_age=3600)
+        return response
+
+    f, content_type, sha = found
+    etag = etag_for("img", sha, width, fmt, images.Image is not None)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = FileResponse(f, content_type=content_type)
+    else:
+        f.close()
+    response["ETag"] = etag
+    if request.GET.get("v") == sha[:12]:
+        patch_cache_control(response, public=True, max_age=365 * 24 * 3600, immutable=True)
+    else:
+        patch_cache_control(response, public=True, max_age=24 * 3600)
+    return response
 
 @login_required
 def force_sync(request):
+    # Queue only; the worker clears the library cache when it finishes
     profile = Profile.objects.get(user=request.user)
-    sync_library(profile.id)
-    if cache: cache.delete(f"lib:{profile.id}")
-    return redirect("me")
\ No newline at end of file
+    enqueue_sync(profile)
+    return redirect("me")
+
+@login_required
+def sync_status(request):
+    # Lightweight poll target for the portfolio page
+    profile = Profile.objects.get(user=request.user)
+    job = latest_job(profile)
+    return JsonResponse({
+        "status": job.status if job else None,
+        "job": job.id if job else None,
+        "duration_ms": job.duration_ms if job else None,
+        "result": job.result if job else {},
+        "error": job.error if job else "",
+        "last_synced": profile.last_synced.isoformat() if profile.last_synced else None,
+    })
+
+@staff_member_required
+def cache_stats_view(request):
+    # Per-prefix hit/miss/recompute counters (this worker process) + Steam HTTP counters
+    return JsonResponse({"cache": cache_stats(), "steam_http": steam_api.http_stats()})
+
+@staff_member_required
+def request_stats_view(request):
+    # p50/p95/p99 and mean DB/HTTP/render cost per view (this worker process)
+    return JsonResponse({"views": request_stats()})
@@ -33,6 +33,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    "portfolio.middleware.TimingMiddleware",    # Server-Timing + /stats/requests/
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -59,8 +60,123 @@ TEMPLATES = [{
 
 WSGI_APPLICATION = "steamfolio.wsgi.application"
 
-# --- DB (SQLite for dev; can swap to Postgres if wanted) ---
-DATABASES = {"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": BASE_DIR / "db.sqlite3"}}
+# --- DB: SQLite for dev, PostgreSQL with DB_ENGINE=postgres ---
+if os.getenv("DB_ENGINE") == "postgres":
+    # Needs psycopg (pip install "psycopg[binary]", plus "psycopg[pool]" for DB_POOL).
+    # Connections stay open for DB_CONN_MAX_AGE seconds and are checked before
+    # reuse; DB_POOL=True uses psycopg's pool instead (Django requires
+    # CONN_MAX_AGE=0 then).
+    DB_POOL = os.getenv("DB_POOL", "False") == "True"
+    DATABASES = {"default": {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": os.getenv("POSTGRES_DB", "steamfolio"),
+        "USER": os.getenv("POSTGRES_USER", "steamfolio"),
+        "PASSWORD": os.getenv("POSTGRES_PASSWORD", ""),
+        "HOST": os.getenv("POSTGRES_HOST", "localhost"),
+        "PORT": os.getenv("POSTGRES_PORT", "5432"),
+        "CONN_MAX_AGE": 0 if DB_POOL else int(os.getenv("DB_CONN_MAX_AGE", "600")),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "connect_timeout": 5,
+            **({"pool": {"min_size": 2, "max_size": int(os.getenv("DB_POOL_MAX", "20")),
+                         "timeout": 10}} if DB_POOL else {}),
+        },
+    }}
+else:
+    # Sync workers write from several threads: take the write lock when a
+    # transaction starts (IMMEDIATE) so writers queue on the busy timeout
+    # instead of failing with "database is locked" on lock upgrade. WAL lets
+    # page reads carry on while a sync is writing.
+    DATABASES = {"default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "db.sqlite3",
+        "OPTIONS": {
+            "transaction_mode": "IMMEDIATE",
+            "timeout": 20,
+            "init_command": "PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;",
+        },
+        # Tests get a file too: the in-memory test DB has no WAL and can't
+        # take parallel writers (see ParallelSyncTests)
+        "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
+    }}
+
+# --- Cache: small in-process LRU in front of a shared tier ---
+# Shared tier: Redis when REDIS_URL is set, the DB cache table with
+# CACHE_BACKEND=db (run `manage.py createcachetable` once), else files on disk.
+REDIS_URL = os.getenv("REDIS_URL")
+if REDIS_URL:
+    SHARED_CACHE = {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": REDIS_URL}
+elif os.getenv("CACHE_BACKEND") == "db":
+    SHARED_CACHE = {"BACKEND": "django.core.cache.backends.db.DatabaseCache", "LOCATION": "steamfolio_cache"}
+else:
+    SHARED_CACHE = {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                    "LOCATION": os.getenv("CACHE_DIR", str(BASE_DIR / ".django_cache"))}
+SHARED_CACHE["TIMEOUT"] = 3600
+if not REDIS_URL:
+    # The file and DB tiers cull once they hold MAX_ENTRIES (Django's default
+    # is 300). Keys are per app (own:, pcview:), per profile (lib: per sort,
+    # ownlib:, friend_idx:) and per profile and app (friend_recheck:), plus
+    # short-lived lock: keys; size it for a few times apps + profiles. A cull
+    # drops 1/CULL_FREQUENCY of the entries; the file tier lists its directory
+    # on every set, so a much larger cache belongs on Redis.
+    SHARED_CACHE["OPTIONS"] = {
+        "MAX_ENTRIES": int(os.getenv("CACHE_MAX_ENTRIES", "20000")),
+        "CULL_FREQUENCY": 10,
+    }
+
+CACHES = {
+    "default": {
+        "BACKEND": "portfolio.cache.TieredCache",
+        "TIMEOUT": 3600,
+        "OPTIONS": {
+            "SHARED": "shared",
+            "LOCAL_MAX_ENTRIES": int(os.getenv("CACHE_LOCAL_MAX_ENTRIES", "500")),
+            "LOCAL_TIMEOUT": int(os.getenv("CACHE_LOCAL_TIMEOUT", "30")),
+        },
+    },
+    "shared": SHARED_CACHE,
+}
+
+# --- Library sync jobs ---
+# Syncs are queued and run by `manage.py sync_worker`. Set SYNC_INLINE=True to
+# run them inside the request instead (local dev without a worker).
+SYNC_INLINE = os.getenv("SYNC_INLINE", "False") == "True"
+
+# --- Header images (portfolio/images.py) ---
+# Resized copies of game headers served from /img/, kept on disk (LRU-bounded).
+# Install Pillow for WebP/resized variants; without it the original JPEG is served.
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", str(BASE_DIR / ".image_cache"))
+IMAGE_CACHE_MAX_MB = int(os.getenv("IMAGE_CACHE_MAX_MB", "512"))
+
+# --- Async views ---
+# Serve game page sections from the async fragment view (each built under a
+# timeout, with a fallback). Meant for ASGI (uvicorn/daphne steamfolio.asgi:application);
+# it also works under WSGI, with an event loop per request.
+ASYNC_VIEWS = os.getenv("ASYNC_VIEWS", "False") == "True"
+
+# --- Steam HTTP client (portfolio/steam_client.py) ---
+STEAM_API_BASE = os.getenv("STEAM_API_BASE", "https://api.steampowered.com")
+STEAM_STORE_BASE = os.getenv("STEAM_STORE_BASE", "https://store.steampowered.com")
+STEAM_CDN_BASE = os.getenv("STEAM_CDN_BASE", "https://cdn.cloudflare.steamstatic.com")
+STEAM_HTTP_TIMEOUT = float(os.getenv("STEAM_HTTP_TIMEOUT", "25"))
+STEAM_HTTP_CONNECT_TIMEOUT = float(os.getenv("STEAM_HTTP_CONNECT_TIMEOUT", "5"))
+STEAM_HTTP_RETRIES = int(os.getenv("STEAM_HTTP_RETRIES", "3"))
+STEAM_HTTP_BACKOFF = float(os.getenv("STEAM_HTTP_BACKOFF", "0.5"))
+STEAM_HTTP_POOL_SIZE = int(os.getenv("STEAM_HTTP_POOL_SIZE", "20"))
+# Token bucket per host: (requests per second, burst)
+STEAM_API_RATE = (float(os.getenv("STEAM_API_RPS", "20")), int(os.getenv("STEAM_API_BURST", "40")))
+STEAM_STORE_RATE = (float(os.getenv("STEAM_STORE_RPS", "1")), int(os.getenv("STEAM_STORE_BURST", "10")))
+
+# --- Request instrumentation (portfolio/middleware.py, portfolio/perf.py) ---
+# The Server-Timing header names the Steam endpoints a view called and its
+# query counts: on in development, off in production unless asked for.
+PERF_SERVER_TIMING = os.getenv("PERF_SERVER_TIMING", str(DEBUG)) == "True"
+# Fraction of requests run under cProfile (0 = off). Dumps are kept only for
+# requests slower than PERF_PROFILE_SLOW_MS; read them with `python -m pstats`.
+PERF_PROFILE_SAMPLE = float(os.getenv("PERF_PROFILE_SAMPLE", "0"))
+PERF_PROFILE_SLOW_MS = float(os.getenv("PERF_PROFILE_SLOW_MS", "500"))
+PERF_PROFILE_DIR = os.getenv("PERF_PROFILE_DIR", str(BASE_DIR / ".profiles"))
+PERF_PROFILE_KEEP = int(os.getenv("PERF_PROFILE_KEEP", "50"))
 
 # --- Auth: enable Steam OpenID ---
 AUTHENTICATION_BACKENDS = [
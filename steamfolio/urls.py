@@ -14,6 +14,7 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
 from django.contrib import admin
 from django.urls import path, include
 from portfolio import views
@@ -25,6 +26,14 @@ urlpatterns = [
     path("login/", views.login_page, name="login"),
     path("logout/", views.logout_view, name="logout"),
     path("me/", views.my_portfolio, name="me"),
+    path("me/games/", views.library_page, name="library_page"),
+    path("me/stats/", views.profile_stats, name="profile_stats"),
     path("game/<int:appid>/", views.game_detail, name="game_detail"),
+    path("game/<int:appid>/<slug:section>/", views.game_fragment_async if settings.ASYNC_VIEWS else views.game_fragment,
+         name="game_fragment"),
+    path("img/<int:appid>/<int:width>.<slug:fmt>", views.header_image, name="header_image"),
     path("force-sync/", views.force_sync, name="force_sync"),
+    path("sync-status/", views.sync_status, name="sync_status"),
+    path("stats/cache/", views.cache_stats_view, name="cache_stats"),
+    path("stats/requests/", views.request_stats_view, name="request_stats"),
 ]